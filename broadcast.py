@@ -0,0 +1,203 @@
+"""
+Массовая рассылка Woolzy Bot
+Админ отправляет текст, бот рассылает его всем пользователям с учётом лимитов Bot API.
+Прогресс сохраняется в таблице broadcasts, поэтому рассылка продолжается после перезапуска
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Tuple
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.ext import Application, CallbackContext
+
+from config import BROADCAST_CONCURRENCY, BROADCAST_PAGE_SIZE, BROADCAST_PROGRESS_INTERVAL, BROADCAST_RATE
+from db import db_connect
+from delivery import is_permanent_failure, track_delivery
+from ratelimit import PRIORITY_BROADCAST
+
+# Остановленные админом рассылки: раннер проверяет флаг между страницами
+_cancelled: Dict[int, bool] = {}
+
+# ---------------- ХРАНЕНИЕ ----------------
+def create_broadcast(admin_chat_id: int, text: str) -> int:
+    """Создаёт рассылку и возвращает её id"""
+    with db_connect() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM users WHERE is_bot = 0 AND unreachable = 0").fetchone()[0]
+        cur = conn.execute(
+            "INSERT INTO broadcasts (admin_chat_id, text, status, total, created_at) VALUES (?, ?, 'running', ?, ?)",
+            (admin_chat_id, text, total, int(time.time())),
+        )
+        return cur.lastrowid
+
+def _load(broadcast_id: int) -> Tuple[int, str, int, int, int, int, int | None]:
+    with db_connect() as conn:
+        return conn.execute(
+            "SELECT admin_chat_id, text, cursor, total, sent, failed, status_message_id FROM broadcasts WHERE id = ?",
+            (broadcast_id,),
+        ).fetchone()
+
+def _next_recipients(cursor: int) -> List[int]:
+    with db_connect() as conn:
+        return [
+            row[0]
+            for row in conn.execute(
+                "SELECT user_id FROM users WHERE user_id > ? AND is_bot = 0 AND unreachable = 0 "
+                "ORDER BY user_id LIMIT ?",
+                (cursor, BROADCAST_PAGE_SIZE),
+            )
+        ]
+
+def _checkpoint(broadcast_id: int, cursor: int, sent: int, failed: int, status: str = "running") -> None:
+    with db_connect() as conn:
+        conn.execute(
+            "UPDATE broadcasts SET cursor = ?, sent = ?, failed = ?, status = ?, "
+            "finished_at = CASE WHEN ? = 'running' THEN NULL ELSE ? END WHERE id = ?",
+            (cursor, sent, failed, status, status, int(time.time()), broadcast_id),
+        )
+
+def _set_status_message(broadcast_id: int, message_id: int) -> None:
+    with db_connect() as conn:
+        conn.execute("UPDATE broadcasts SET status_message_id = ? WHERE id = ?", (message_id, broadcast_id))
+
+def cancel_broadcast(broadcast_id: int) -> None:
+    """Просит раннер остановить рассылку после текущей страницы"""
+    _cancelled[broadcast_id] = True
+
+# ---------------- ОТПРАВКА ----------------
+class _Pacer:
+    """Равномерно распределяет отправки: не больше rate сообщений в секунду"""
+
+    def __init__(self, rate: float) -> None:
+        self._interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(self._next, now) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """Сдвигает все следующие отправки (после RetryAfter)"""
+        self._next = max(self._next, time.monotonic() + seconds)
+
+async def _send_one(bot: Bot, pacer: _Pacer, sem: asyncio.Semaphore, user_id: int, text: str) -> bool:
+    async with sem:
+        for _ in range(3):
+            await pacer.wait()
+            try:
+                await track_delivery(
+                    "broadcast",
+                    user_id,
+                    bot.send_message(
+                        chat_id=user_id, text=text, parse_mode=ParseMode.HTML, rate_limit_args=PRIORITY_BROADCAST
+                    ),
+                )
+                return True
+            except RetryAfter as e:
+                pacer.pause(e.retry_after)
+            except Forbidden:
+                # Пользователь заблокировал бота: он уже помечен недоступным в track_delivery
+                return False
+            except BadRequest as e:
+                # «Chat not found» тоже помечен в track_delivery; прочие BadRequest — ошибка в самом сообщении
+                if not is_permanent_failure(e):
+                    logging.error("Broadcast to %s rejected: %s", user_id, e)
+                return False
+            except TelegramError as e:
+                logging.warning("Broadcast to %s failed: %s", user_id, e)
+                return False
+        return False
+
+def _progress_text(broadcast_id: int, sent: int, failed: int, total: int, rate: float, status: str) -> str:
+    done = sent + failed
+    lines = [f"📣 Рассылка #{broadcast_id}: {status}"]
+    lines.append(f"– Отправлено: <b>{sent}</b>, ошибок: <b>{failed}</b> из {total}")
+    if status == "идёт":
+        eta = (max(total - done, 0) / rate) if rate > 0 else 0
+        lines.append(f"– Скорость: {rate:.1f} сообщ/с, осталось ~{int(eta // 60)} мин {int(eta % 60)} с")
+    return "\n".join(lines)
+
+def _progress_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(text="⏹ Остановить", callback_data=f"broadcast_stop:{broadcast_id}")]]
+    )
+
+async def run_broadcast(bot: Bot, broadcast_id: int) -> None:
+    """Рассылает сообщение, начиная с сохранённого курсора.
+
+    Получатели читаются страницами по user_id; после каждой страницы
+    курсор и счётчики сохраняются в БД. При перезапуске страница, на которой
+    упал процесс, может быть отправлена повторно.
+    """
+    admin_chat_id, text, cursor, total, sent, failed, status_message_id = await asyncio.to_thread(_load, broadcast_id)
+    pacer = _Pacer(BROADCAST_RATE)
+    sem = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    started = time.monotonic()
+    started_done = sent + failed
+    last_report = 0.0
+
+    async def report(status: str) -> None:
+        nonlocal status_message_id
+        elapsed = time.monotonic() - started
+        rate = (sent + failed - started_done) / elapsed if elapsed > 0 else 0.0
+        progress = _progress_text(broadcast_id, sent, failed, total, rate, status)
+        markup = _progress_keyboard(broadcast_id) if status == "идёт" else None
+        try:
+            if status_message_id is None:
+                message = await bot.send_message(
+                    chat_id=admin_chat_id, text=progress, reply_markup=markup, parse_mode=ParseMode.HTML
+                )
+                status_message_id = message.message_id
+                await asyncio.to_thread(_set_status_message, broadcast_id, status_message_id)
+            else:
+                await bot.edit_message_text(
+                    chat_id=admin_chat_id,
+                    message_id=status_message_id,
+                    text=progress,
+                    reply_markup=markup,
+                    parse_mode=ParseMode.HTML,
+                )
+        except TelegramError as e:
+            logging.warning("Broadcast %s progress update failed: %s", broadcast_id, e)
+
+    await report("идёт")
+    while not _cancelled.get(broadcast_id):
+        recipients = await asyncio.to_thread(_next_recipients, cursor)
+        if not recipients:
+            break
+        results = await asyncio.gather(*(_send_one(bot, pacer, sem, uid, text) for uid in recipients))
+        sent += sum(results)
+        failed += len(results) - sum(results)
+        cursor = recipients[-1]
+        await asyncio.to_thread(_checkpoint, broadcast_id, cursor, sent, failed)
+        if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            await report("идёт")
+
+    status = "cancelled" if _cancelled.pop(broadcast_id, False) else "done"
+    await asyncio.to_thread(_checkpoint, broadcast_id, cursor, sent, failed, status)
+    await report("остановлена" if status == "cancelled" else "завершена")
+    logging.info("Broadcast %s %s: sent=%s failed=%s", broadcast_id, status, sent, failed)
+
+def _running_ids() -> List[int]:
+    with db_connect() as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM broadcasts WHERE status = 'running'")]
+
+async def _resume_job(context: CallbackContext) -> None:
+    for broadcast_id in await asyncio.to_thread(_running_ids):
+        logging.info("Resuming broadcast %s", broadcast_id)
+        context.application.create_task(run_broadcast(context.bot, broadcast_id))
+
+def resume_broadcasts(app: Application) -> None:
+    """Продолжает рассылки, прерванные перезапуском"""
+    # Вызывается из post_init, когда приложение ещё не запущено: задачи создаются
+    # уже из работающей очереди заданий, чтобы приложение дождалось их при остановке
+    app.job_queue.run_once(_resume_job, 0, name="broadcast_resume")
@@ -0,0 +1,63 @@
+"""
+Кампания Woolzy Bot
+Шаги кампании из campaign.json компилируются в таблицы переходов: какие шаги
+ставит событие, какие отменяет и при каких флагах пользователя шаг не отправляется
+"""
+
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from timings import CAMPAIGN_EVENTS, CampaignStep
+
+# Биты событий хранятся в БД (campaign_state), поэтому не зависят от загруженной кампании
+EVENT_BITS: Dict[str, int] = {event: 1 << i for i, event in enumerate(CAMPAIGN_EVENTS)}
+if len(EVENT_BITS) != len(CAMPAIGN_EVENTS):
+    raise ValueError("CAMPAIGN_EVENTS contains duplicates")
+
+# ---------------- КОМПИЛЯЦИЯ ----------------
+class CampaignPlan(NamedTuple):
+    """Таблицы переходов одной версии кампании"""
+    schedule: Dict[str, List[Tuple[int, str]]]   # событие -> шаги (задержка, ключ)
+    cancel_mask: Dict[str, int]                  # ключ шага -> биты событий, отменяющих шаг
+    cancels: Dict[str, List[str]]                # событие -> ключи шагов, которые оно отменяет
+
+    def steps_for(self, event: str) -> List[Tuple[int, str]]:
+        """Шаги (задержка, ключ), которые ставит событие"""
+        return self.schedule.get(event, [])
+
+    def keys_cancelled_by(self, event: str) -> List[str]:
+        """Ключи шагов, которые событие отменяет"""
+        return self.cancels.get(event, [])
+
+    def is_cancelled(self, key: str, flags: int) -> bool:
+        """Шаг больше не нужен пользователю с такими флагами"""
+        return bool(flags & self.cancel_mask.get(key, 0))
+
+def compile_campaign(steps: Iterable[CampaignStep], message_keys: Iterable[str]) -> CampaignPlan:
+    """Проверяет шаги и строит таблицы переходов; ошибки — ValueError"""
+    messages = set(message_keys)
+    schedule: Dict[str, List[Tuple[int, str]]] = {}
+    cancel_mask: Dict[str, int] = {}
+    cancels: Dict[str, List[str]] = {}
+    for step in steps:
+        if step.key in cancel_mask:
+            raise ValueError(f"Campaign step {step.key!r} is defined twice")
+        if step.key not in messages:
+            raise ValueError(f"Campaign step {step.key!r} has no message text")
+        if step.trigger != "start" and step.trigger not in EVENT_BITS:
+            raise ValueError(f"Campaign step {step.key!r}: unknown trigger {step.trigger!r}")
+        mask = 0
+        for event in step.cancel_on:
+            if event not in EVENT_BITS:
+                raise ValueError(f"Campaign step {step.key!r}: unknown cancel event {event!r}")
+            mask |= EVENT_BITS[event]
+            cancels.setdefault(event, []).append(step.key)
+        schedule.setdefault(step.trigger, []).append((step.delay, step.key))
+        cancel_mask[step.key] = mask
+    return CampaignPlan(schedule, cancel_mask, cancels)
+
+# ---------------- ПЕРЕХОДЫ ----------------
+# Флаги событий пользователя копятся и не сбрасываются повторным /start
+FLAGS_SET_SQL = """
+    INSERT INTO campaign_state (user_id, flags) VALUES (?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET flags = flags | excluded.flags
+"""
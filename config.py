@@ -12,6 +12,104 @@ if not BOT_TOKEN:
     raise SystemExit("BOT_TOKEN env var is required")
 
 DB_PATH = os.getenv("DB_PATH", "bot_metrics.sqlite3")
+# Адрес Bot API (можно указать локальный сервер, например для нагрузочных тестов)
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "https://api.telegram.org/bot")
+# Сколько долгоживущих соединений с БД держать в пуле
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+# Сколько профилей пользователей помнить: неизменившийся профиль повторно не записывается
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "50000"))
+
+# ---------------- ПРИЁМ ОБНОВЛЕНИЙ ----------------
+# "polling" — getUpdates (по умолчанию), "webhook" — встроенный HTTP-сервер
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# Публичный адрес, который сообщается Telegram (включая путь), например https://bot.example.com/telegram
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token: запросы без него отклоняются
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+    raise SystemExit("WEBHOOK_URL and WEBHOOK_SECRET env vars are required in webhook mode")
+# Предел очереди необработанных обновлений: при заполнении приём обновлений ждёт
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+# Обновления одного пользователя обрабатываются по порядку, разных — параллельно:
+# сколько обновлений принято в работу, сколько выполняется одновременно
+# и сколько может ждать в очереди одного пользователя (лишние отбрасываются)
+UPDATE_MAX_IN_FLIGHT = int(os.getenv("UPDATE_MAX_IN_FLIGHT", "1024"))
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "256"))
+UPDATE_MAX_PER_USER = int(os.getenv("UPDATE_MAX_PER_USER", "20"))
+
+# ---------------- МЕТРИКИ ----------------
+# Порт HTTP-сервера метрик в формате Prometheus (/metrics); 0 — выключено
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# ---------------- ЗАПИСЬ СОБЫТИЙ ----------------
+# События пишутся в БД фоновым потоком пачками: сброс по размеру пачки или по таймеру (секунды)
+EVENTS_BATCH_SIZE = int(os.getenv("EVENTS_BATCH_SIZE", "500"))
+EVENTS_FLUSH_INTERVAL = float(os.getenv("EVENTS_FLUSH_INTERVAL", "0.5"))
+# Предел очереди: при переполнении обработчики ждут, пока поток запишет накопленное
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "10000"))
+
+# ---------------- ОЧЕРЕДЬ ОТЛОЖЕННЫХ СООБЩЕНИЙ ----------------
+# Как часто тикер проверяет очередь (секунды) и сколько сообщений отправляет за тик
+OUTBOX_TICK_SECONDS = float(os.getenv("OUTBOX_TICK_SECONDS", "1"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "25"))
+# Что делать с сообщениями, просроченными дольше OUTBOX_MAX_LATENESS секунд
+# (например, после перезапуска): "send" — отправить, "drop" — выбросить
+OUTBOX_CATCHUP = os.getenv("OUTBOX_CATCHUP", "send")
+OUTBOX_MAX_LATENESS = int(os.getenv("OUTBOX_MAX_LATENESS", str(6 * 3600)))
+
+# ---------------- ОТПРАВКА СООБЩЕНИЙ ----------------
+# Общий лимит вызовов Bot API (в секунду) и допустимый всплеск
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))
+SEND_BURST = int(os.getenv("SEND_BURST", "30"))
+# Лимит на один личный чат (в секунду, со всплеском) и на одну группу (в минуту)
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_GROUP_PER_MINUTE = int(os.getenv("SEND_GROUP_PER_MINUTE", "20"))
+# Сколько токенов общего лимита цепочка и рассылка оставляют ответам на нажатия
+SEND_BULK_RESERVE = int(os.getenv("SEND_BULK_RESERVE", "5"))
+# Случайная задержка сообщений цепочки (секунды), чтобы созревшие разом таймеры не шли пачкой
+SEND_DRIP_JITTER = float(os.getenv("SEND_DRIP_JITTER", "1"))
+
+# ---------------- МАССОВАЯ РАССЫЛКА ----------------
+# Общий темп (сообщений в секунду, лимит Bot API — около 30) и число одновременных отправок
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+# Сколько получателей читать из БД за раз (после каждой страницы прогресс сохраняется)
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "200"))
+# Как часто обновлять сообщение с прогрессом (секунды)
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+
+# ---------------- ОТЧЁТЫ АДМИНА ----------------
+# Готовые отчёты кэшируются: после новых записей в БД отчёт пересчитывается не чаще
+# раза в REPORT_CACHE_TTL секунд, без записей живёт до REPORT_CACHE_IDLE_TTL секунд
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "10"))
+REPORT_CACHE_IDLE_TTL = float(os.getenv("REPORT_CACHE_IDLE_TTL", "120"))
+
+# ---------------- ПРОФИЛИРОВАНИЕ ----------------
+# Интервал между срезами стеков при профилировании из меню админа, секунды
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+
+# ---------------- ХРАНЕНИЕ СОБЫТИЙ ----------------
+# Сколько дней хранить сырые события (0 — хранить всё). Более старые
+# сворачиваются в дневные агрегаты events_daily и уходят в архив ARCHIVE_DIR.
+# Не меньше 8 дней: неполные часы по краям отчёта за 7 дней считаются по сырым событиям
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+if 0 < RETENTION_DAYS < 8:
+    raise SystemExit("RETENTION_DAYS must be 0 (keep everything) or at least 8")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+# Размер пачки удаления и период запуска сворачивания (секунды)
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "2000"))
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))
+
+# ---------------- КОНТЕНТ КАМПАНИИ ----------------
+# Тексты, кнопки и шаги кампании; файл перечитывается при изменении и по команде /reload
+CAMPAIGN_PATH = os.getenv("CAMPAIGN_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "campaign.json"))
+# Как часто проверять, изменился ли файл, секунды (0 — только по /reload)
+CAMPAIGN_RELOAD_INTERVAL = float(os.getenv("CAMPAIGN_RELOAD_INTERVAL", "5"))
 
 # ---------------- ССЫЛКИ (ОБЯЗАТЕЛЬНО ЗАМЕНИТЬ НА РЕАЛЬНЫЕ) ----------------
 REVIEW24_LINK = "https://t.me/c/2329306914/1/369"  
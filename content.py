@@ -0,0 +1,241 @@
+"""
+Контент кампании Woolzy Bot
+Тексты, кнопки и шаги кампании читаются из campaign.json в неизменяемый
+снимок: HTML текстов проверен, клавиатуры собраны, шаги скомпилированы.
+Новый снимок подменяет старый одним присваиванием, поэтому обработчики
+всегда видят целую версию контента, старую или новую
+"""
+
+import hashlib
+import json
+import logging
+import os
+from html.parser import HTMLParser
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from campaign import CampaignPlan, compile_campaign
+from config import CAMPAIGN_PATH, GROUP_LINK, GUIDE_LINK, REVIEW24_LINK, REVIEW48_LINK, SHOP_LINK, VIDEO_LINK
+from timings import CampaignStep
+
+# Подстановки в текстах и URL кнопок: {group_link} и т.д.
+LINKS: Dict[str, str] = {
+    "group_link": GROUP_LINK,
+    "guide_link": GUIDE_LINK,
+    "shop_link": SHOP_LINK,
+    "video_link": VIDEO_LINK,
+    "review24_link": REVIEW24_LINK,
+    "review48_link": REVIEW48_LINK,
+}
+# Сообщения, без которых бот не работает
+REQUIRED_MESSAGES = ("welcome",)
+
+MAX_MESSAGE_LENGTH = 4096
+MAX_CALLBACK_BYTES = 64
+
+class ContentError(ValueError):
+    """Файл кампании не прошёл проверку; problems — все найденные ошибки"""
+
+    def __init__(self, problems: List[str]) -> None:
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+class Content(NamedTuple):
+    version: str                                    # первые символы sha1 файла
+    messages: Mapping[str, str]                     # ключ -> готовый HTML
+    keyboards: Mapping[str, InlineKeyboardMarkup]   # ключ -> клавиатура сообщения
+    steps: Tuple[CampaignStep, ...]
+    timeline: Tuple[Tuple[int, str], ...]           # шаги после /start: (задержка, ключ)
+    plan: CampaignPlan
+
+# ---------------- ПРОВЕРКА HTML ----------------
+# Разметка, которую принимает Bot API с parse_mode=HTML
+_TAGS = {"b", "strong", "i", "em", "u", "ins", "s", "strike", "del", "a", "code", "pre", "span", "tg-spoiler", "tg-emoji", "blockquote"}
+_ENTITIES = {"lt", "gt", "amp", "quot"}
+
+class _TelegramHTML(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=False)
+        self.open: List[str] = []
+        self.problems: List[str] = []
+        self.length = 0
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, str | None]]) -> None:
+        if tag not in _TAGS:
+            self.problems.append(f"unsupported tag <{tag}>")
+        elif tag == "a" and not dict(attrs).get("href"):
+            self.problems.append("<a> without href")
+        elif tag == "span" and dict(attrs).get("class") != "tg-spoiler":
+            self.problems.append('<span> without class="tg-spoiler"')
+        self.open.append(tag)
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, str | None]]) -> None:
+        self.problems.append(f"self-closing tag <{tag}/>")
+
+    def handle_endtag(self, tag: str) -> None:
+        if not self.open or self.open[-1] != tag:
+            self.problems.append(f"unexpected </{tag}>")
+            return
+        self.open.pop()
+
+    def handle_data(self, data: str) -> None:
+        if "<" in data or ">" in data:
+            self.problems.append("bare < or > (use &lt; and &gt;)")
+        self.length += len(data)
+
+    def handle_entityref(self, name: str) -> None:
+        if name not in _ENTITIES:
+            self.problems.append(f"unsupported entity &{name};")
+        self.length += 1
+
+    def handle_charref(self, name: str) -> None:
+        self.length += 1
+
+def html_problems(text: str) -> List[str]:
+    """Ошибки разметки текста для parse_mode=HTML (пустой список — текст корректен)"""
+    parser = _TelegramHTML()
+    parser.feed(text)
+    parser.close()
+    problems = parser.problems
+    if parser.open:
+        problems.append(f"unclosed <{parser.open[-1]}>")
+    if parser.length > MAX_MESSAGE_LENGTH:
+        problems.append(f"text is {parser.length} characters, Telegram allows {MAX_MESSAGE_LENGTH}")
+    return problems
+
+# ---------------- ЗАГРУЗКА ----------------
+def _substitute(value: str, where: str, problems: List[str]) -> str:
+    try:
+        return value.format_map(LINKS)
+    except (KeyError, ValueError, IndexError) as e:
+        problems.append(f"{where}: bad placeholder {e} (known: {', '.join(sorted(LINKS))}; literal braces are {{{{ }}}})")
+        return value
+
+def _button(spec: Any, where: str, problems: List[str]) -> InlineKeyboardButton | None:
+    if not isinstance(spec, dict) or not isinstance(spec.get("text"), str) or not spec["text"]:
+        problems.append(f"{where}: button needs a non-empty text")
+        return None
+    if ("callback" in spec) == ("url" in spec):
+        problems.append(f"{where}: button needs exactly one of callback or url")
+        return None
+    if "callback" in spec:
+        data = str(spec["callback"])
+        if not data or len(data.encode()) > MAX_CALLBACK_BYTES:
+            problems.append(f"{where}: callback must be 1-{MAX_CALLBACK_BYTES} bytes")
+            return None
+        return InlineKeyboardButton(text=spec["text"], callback_data=data)
+    url = _substitute(str(spec["url"]), where, problems)
+    if not url.startswith(("https://", "http://", "tg://")):
+        problems.append(f"{where}: url must start with https://, http:// or tg://")
+        return None
+    return InlineKeyboardButton(text=spec["text"], url=url)
+
+def parse_content(raw: bytes) -> Content:
+    """Снимок контента из содержимого campaign.json; все ошибки — в одном ContentError"""
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise ContentError([f"invalid JSON: {e}"]) from None
+    if not isinstance(data, dict):
+        raise ContentError(["top level must be an object"])
+    problems: List[str] = []
+
+    messages: Dict[str, str] = {}
+    for key, value in (data.get("messages") or {}).items():
+        # Текст — строка или список строк (строки склеиваются через перевод строки)
+        text = "\n".join(value) if isinstance(value, list) else value
+        if not isinstance(text, str) or not text.strip():
+            problems.append(f"messages.{key}: empty or not a string")
+            continue
+        text = _substitute(text, f"messages.{key}", problems)
+        problems.extend(f"messages.{key}: {problem}" for problem in html_problems(text))
+        messages[key] = text
+    problems.extend(f"messages.{key}: required message is missing" for key in REQUIRED_MESSAGES if key not in messages)
+
+    keyboards: Dict[str, InlineKeyboardMarkup] = {}
+    for key, rows in (data.get("keyboards") or {}).items():
+        if key not in messages:
+            problems.append(f"keyboards.{key}: no message with this key")
+        built = [
+            [_button(spec, f"keyboards.{key}[{i}][{j}]", problems) for j, spec in enumerate(row)]
+            for i, row in enumerate(rows if isinstance(rows, list) else [])
+            if isinstance(row, list)
+        ]
+        if built and all(button is not None for row in built for button in row):
+            keyboards[key] = InlineKeyboardMarkup(built)
+
+    steps: List[CampaignStep] = []
+    for i, spec in enumerate(data.get("steps") or []):
+        try:
+            delay = int(spec["delay"])
+            if delay < 0:
+                raise ValueError("negative delay")
+            steps.append(CampaignStep(str(spec["key"]), str(spec["trigger"]), delay, tuple(spec.get("cancel_on") or ())))
+        except (KeyError, TypeError, ValueError) as e:
+            problems.append(f"steps[{i}]: {e!r}")
+    try:
+        plan = compile_campaign(steps, messages)
+    except ValueError as e:
+        problems.append(str(e))
+
+    if problems:
+        raise ContentError(problems)
+    return Content(
+        version=hashlib.sha1(raw).hexdigest()[:8],
+        messages=MappingProxyType(messages),
+        keyboards=MappingProxyType(keyboards),
+        steps=tuple(steps),
+        timeline=tuple((step.delay, step.key) for step in steps if step.trigger == "start"),
+        plan=plan,
+    )
+
+class ContentStore:
+    """Текущий снимок контента и его перезагрузка из файла"""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._stamp = self._stat()
+        with open(path, "rb") as f:
+            # Ошибка в файле при запуске — бот не стартует, как и с ошибкой в коде
+            self.current = parse_content(f.read())
+
+    def _stat(self) -> Tuple[int, int]:
+        st = os.stat(self._path)
+        return st.st_mtime_ns, st.st_size
+
+    def changed(self) -> bool:
+        """Файл изменился с последней загрузки"""
+        try:
+            return self._stat() != self._stamp
+        except OSError:
+            return False
+
+    def reload(self) -> Content:
+        """Читает файл и подменяет снимок; при ошибке (ContentError, OSError) остаётся прежний"""
+        stamp = self._stat()
+        with open(self._path, "rb") as f:
+            raw = f.read()
+        # Отметку запоминаем и при ошибке: тот же битый файл не проверяется на каждом тике
+        self._stamp = stamp
+        content = parse_content(raw)
+        if content.version != self.current.version:
+            self.current = content
+            logging.info(
+                "Campaign content %s loaded: %s messages, %s steps", content.version, len(content.messages), len(content.steps),
+            )
+        return self.current
+
+content = ContentStore(CAMPAIGN_PATH)
+
+def describe(snapshot: Content) -> str:
+    """Короткое описание версии для админа"""
+    return (
+        f"версия {snapshot.version}: сообщений {len(snapshot.messages)}, "
+        f"клавиатур {len(snapshot.keyboards)}, шагов {len(snapshot.steps)}"
+    )
+
+def format_problems(error: ContentError) -> str:
+    """Ошибки проверки списком для сообщения админу"""
+    return "\n".join(f"• {problem}" for problem in error.problems[:20])
@@ -0,0 +1,420 @@
+"""
+База данных Woolzy Bot
+Общий пул соединений с SQLite и версионированные миграции схемы
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+from config import DB_PATH, DB_POOL_SIZE
+from timings import CAMPAIGN_EVENTS
+
+# ---------------- ПУЛ СОЕДИНЕНИЙ ----------------
+class ConnectionPool:
+    """Небольшой пул долгоживущих соединений.
+
+    PRAGMA настраиваются один раз при открытии соединения, а кэш
+    подготовленных выражений sqlite3 живёт вместе с соединением.
+    """
+
+    def __init__(self, path: str, size: int) -> None:
+        self._path = path
+        self._size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        # Сколько раз и как долго ждали свободного соединения
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, timeout=30, check_same_thread=False, cached_statements=256)
+        # Действует только на новую пустую БД (до WAL и создания таблиц); существующую
+        # переводят в этот режим полным VACUUM (см. README, «Хранение событий»)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Берёт соединение из пула, открывая новое, пока не достигнут лимит"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self._size:
+                self._opened += 1
+                return self._open()
+        started = time.monotonic()
+        conn = self._idle.get()
+        self.waits += 1
+        self.wait_seconds += time.monotonic() - started
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Возвращает соединение в пул, откатывая незавершённую транзакцию"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self) -> None:
+        """Закрывает все свободные соединения"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            self._opened -= 1
+
+pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+
+@contextmanager
+def db_connect() -> Iterator[sqlite3.Connection]:
+    """Выдаёт соединение из пула: commit при успехе, rollback при ошибке"""
+    conn = pool.acquire()
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.release(conn)
+
+# ---------------- МИГРАЦИИ ----------------
+Migration = Callable[[sqlite3.Connection], None]
+
+def _script(sql: str) -> Migration:
+    """Миграция из набора SQL-выражений, разделённых точкой с запятой"""
+    def apply(conn: sqlite3.Connection) -> None:
+        for statement in sql.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+    return apply
+
+def _add_profile_columns(conn: sqlite3.Connection) -> None:
+    # Старые базы могли быть созданы без этих колонок
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    for column, ddl in (
+        ("language_code", "language_code TEXT"),
+        ("is_premium", "is_premium INTEGER DEFAULT 0"),
+        ("is_bot", "is_bot INTEGER DEFAULT 0"),
+    ):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE users ADD COLUMN {ddl}")
+
+def refresh_funnel(conn: sqlite3.Connection, low: int, high: int) -> None:
+    """Пересчитывает состояние воронки по событиям с id из [low, high].
+
+    Нужен для событий, записанных в обход потока записи: при создании таблиц
+    воронки и при переносе events_legacy. Более ранние шаги побеждают, поэтому
+    порядок обработки пачек не важен.
+    """
+    params = {"low": low, "high": high}
+    conn.execute(
+        """
+        INSERT INTO funnel_steps (user_id, kind, first_at)
+        SELECT e.user_id, e.kind, MIN(e.created_at)
+        FROM events e JOIN event_kinds k ON k.id = e.kind
+        WHERE e.id BETWEEN :low AND :high
+          AND (k.type = 'start' OR (k.type = 'message_sent' AND k.payload <> '')
+               OR (k.type = 'button_click' AND k.payload IN ('btn_group', 'btn_guide', 'btn_kaspi')))
+        GROUP BY 1, 2
+        ON CONFLICT(user_id, kind) DO UPDATE SET first_at = MIN(first_at, excluded.first_at)
+        """,
+        params,
+    )
+    message_kinds = "(SELECT id FROM event_kinds WHERE type = 'message_sent')"
+    # Последнее сообщение до каждого шага (не считая сообщения самого шага)
+    conn.execute(
+        f"""
+        UPDATE funnel_steps SET prev_kind = (
+            SELECT e.kind FROM events e
+            WHERE e.user_id = funnel_steps.user_id AND e.kind IN {message_kinds}
+              AND e.created_at <= funnel_steps.first_at AND e.kind <> funnel_steps.kind
+            ORDER BY e.created_at DESC LIMIT 1
+        )
+        WHERE user_id IN (SELECT DISTINCT user_id FROM events WHERE id BETWEEN :low AND :high)
+        """,
+        params,
+    )
+    # Последнее полученное сообщение вообще
+    conn.execute(
+        f"""
+        UPDATE users SET last_msg_kind = (
+            SELECT e.kind FROM events e
+            WHERE e.user_id = users.user_id AND e.kind IN {message_kinds}
+            ORDER BY e.created_at DESC LIMIT 1
+        )
+        WHERE user_id IN (SELECT DISTINCT user_id FROM events WHERE id BETWEEN :low AND :high)
+        """,
+        params,
+    )
+
+def _create_funnel(conn: sqlite3.Connection) -> None:
+    _script("""
+        CREATE TABLE funnel_steps (
+            user_id   INTEGER NOT NULL,
+            kind      INTEGER NOT NULL,
+            first_at  INTEGER NOT NULL,
+            prev_kind INTEGER,
+            PRIMARY KEY (user_id, kind)
+        ) WITHOUT ROWID;
+        CREATE INDEX idx_funnel_kind_time ON funnel_steps(kind, first_at);
+        ALTER TABLE users ADD COLUMN last_msg_kind INTEGER;
+    """)(conn)
+    refresh_funnel(conn, 0, 9223372036854775807)
+
+def backfill_campaign_state(conn: sqlite3.Connection, low: int, high: int) -> None:
+    """Флаги кампании по кликам из events с id в [low, high]"""
+    for bit, event in enumerate(CAMPAIGN_EVENTS):
+        conn.execute(
+            """
+            INSERT INTO campaign_state (user_id, flags)
+            SELECT DISTINCT e.user_id, ? FROM events e
+            WHERE e.id BETWEEN ? AND ?
+              AND e.kind IN (SELECT id FROM event_kinds WHERE type = 'button_click' AND payload = ?)
+            ON CONFLICT(user_id) DO UPDATE SET flags = flags | excluded.flags
+            """,
+            (1 << bit, low, high, event),
+        )
+
+def _create_campaign_state(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE TABLE campaign_state (user_id INTEGER PRIMARY KEY, flags INTEGER NOT NULL DEFAULT 0)")
+    # Флаги по уже случившимся кликам, чтобы старые пользователи не получали лишних шагов.
+    # Клики из events_legacy добавляет migrate_legacy_events по мере переноса
+    backfill_campaign_state(conn, 0, 9223372036854775807)
+
+# Порядок менять нельзя: номер миграции = её позиция в списке, начиная с 1
+MIGRATIONS: List[Migration] = [
+    # 1: базовая схема
+    _script("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id     INTEGER PRIMARY KEY,
+            username    TEXT,
+            first_name  TEXT,
+            last_name   TEXT,
+            language_code TEXT,
+            is_premium  INTEGER DEFAULT 0,
+            is_bot      INTEGER DEFAULT 0,
+            last_start  TEXT
+        );
+        CREATE TABLE IF NOT EXISTS events (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id     INTEGER NOT NULL,
+            type        TEXT NOT NULL,
+            payload     TEXT,
+            created_at  TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_events_user_time ON events(user_id, created_at);
+    """),
+    # 2: расширенный профиль пользователя
+    _add_profile_columns,
+    # 3: очередь отложенных сообщений, due_at — unix time
+    _script("""
+        CREATE TABLE IF NOT EXISTS scheduled_messages (
+            user_id     INTEGER NOT NULL,
+            key         TEXT NOT NULL,
+            chat_id     INTEGER NOT NULL,
+            due_at      INTEGER NOT NULL,
+            PRIMARY KEY (user_id, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_scheduled_due ON scheduled_messages(due_at);
+    """),
+    # 4: почасовые агрегаты событий для отчётов; bucket — начало часа в unix time
+    _script("""
+        CREATE TABLE IF NOT EXISTS event_rollups (
+            bucket      INTEGER NOT NULL,
+            type        TEXT NOT NULL,
+            payload     TEXT NOT NULL,
+            cnt         INTEGER NOT NULL,
+            PRIMARY KEY (bucket, type, payload)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at);
+        INSERT INTO event_rollups (bucket, type, payload, cnt)
+            SELECT CAST(strftime('%s', created_at) AS INTEGER) / 3600 * 3600, type, IFNULL(payload, ''), COUNT(*)
+            FROM events
+            GROUP BY 1, 2, 3;
+    """),
+    # 5: компактный формат событий: время — INTEGER unix time, type/payload — код из справочника
+    # event_kinds. Старая таблица переименовывается в events_legacy и переносится фоном
+    # (migrate_legacy_events), чтобы не держать блокировку на всё время конвертации
+    _script("""
+        CREATE TABLE event_kinds (
+            id          INTEGER PRIMARY KEY,
+            type        TEXT NOT NULL,
+            payload     TEXT NOT NULL,
+            UNIQUE (type, payload)
+        );
+        INSERT INTO event_kinds (type, payload) SELECT DISTINCT type, payload FROM event_rollups;
+
+        DROP INDEX IF EXISTS idx_events_user_time;
+        DROP INDEX IF EXISTS idx_events_created;
+        ALTER TABLE events RENAME TO events_legacy;
+        CREATE TABLE events (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id     INTEGER NOT NULL,
+            kind        INTEGER NOT NULL,
+            created_at  INTEGER NOT NULL
+        );
+        CREATE INDEX idx_events_user_time ON events(user_id, created_at);
+        CREATE INDEX idx_events_created ON events(created_at);
+        INSERT INTO sqlite_sequence (name, seq) SELECT 'events', IFNULL(MAX(id), 0) FROM events_legacy;
+
+        CREATE TABLE event_rollups_new (
+            bucket      INTEGER NOT NULL,
+            kind        INTEGER NOT NULL,
+            cnt         INTEGER NOT NULL,
+            PRIMARY KEY (bucket, kind)
+        ) WITHOUT ROWID;
+        INSERT INTO event_rollups_new (bucket, kind, cnt)
+            SELECT r.bucket, k.id, r.cnt FROM event_rollups r
+            JOIN event_kinds k ON k.type = r.type AND k.payload = r.payload;
+        DROP TABLE event_rollups;
+        ALTER TABLE event_rollups_new RENAME TO event_rollups;
+
+        CREATE TABLE users_new (
+            user_id     INTEGER PRIMARY KEY,
+            username    TEXT,
+            first_name  TEXT,
+            last_name   TEXT,
+            language_code TEXT,
+            is_premium  INTEGER DEFAULT 0,
+            is_bot      INTEGER DEFAULT 0,
+            last_start  INTEGER
+        );
+        INSERT INTO users_new
+            SELECT user_id, username, first_name, last_name, language_code, is_premium, is_bot,
+                   CAST(strftime('%s', last_start) AS INTEGER)
+            FROM users;
+        DROP TABLE users;
+        ALTER TABLE users_new RENAME TO users;
+    """),
+    # 6: время последней активности в users и индексы для постраничного списка
+    _script("""
+        ALTER TABLE users ADD COLUMN last_seen INTEGER NOT NULL DEFAULT 0;
+        UPDATE users SET last_seen = IFNULL((SELECT MAX(created_at) FROM events WHERE events.user_id = users.user_id), 0);
+        CREATE INDEX idx_users_seen ON users(last_seen, user_id);
+        CREATE INDEX idx_users_lang_seen ON users(language_code, last_seen, user_id);
+        CREATE INDEX idx_users_premium_seen ON users(last_seen, user_id) WHERE is_premium = 1;
+        CREATE INDEX idx_users_bot_seen ON users(last_seen, user_id) WHERE is_bot = 1;
+    """),
+    # 7: массовые рассылки; cursor — последний обработанный user_id
+    _script("""
+        CREATE TABLE broadcasts (
+            id          INTEGER PRIMARY KEY,
+            admin_chat_id INTEGER NOT NULL,
+            text        TEXT NOT NULL,
+            status      TEXT NOT NULL,
+            cursor      INTEGER NOT NULL DEFAULT 0,
+            total       INTEGER NOT NULL DEFAULT 0,
+            sent        INTEGER NOT NULL DEFAULT 0,
+            failed      INTEGER NOT NULL DEFAULT 0,
+            status_message_id INTEGER,
+            created_at  INTEGER NOT NULL,
+            finished_at INTEGER
+        );
+    """),
+    # 8: дневные агрегаты событий, свёрнутых по сроку хранения (day — начало суток UTC)
+    _script("""
+        CREATE TABLE events_daily (
+            day     INTEGER NOT NULL,
+            kind    INTEGER NOT NULL,
+            events  INTEGER NOT NULL,
+            users   INTEGER NOT NULL,
+            PRIMARY KEY (day, kind)
+        ) WITHOUT ROWID;
+    """),
+    # 9: состояние воронки: первое время каждого шага и последнее полученное сообщение
+    _create_funnel,
+    # 10: эпохи статистики; обнуление открывает новую эпоху вместо удаления событий
+    _script("""
+        CREATE TABLE stat_epochs (
+            id          INTEGER PRIMARY KEY,
+            started_at  INTEGER NOT NULL,
+            ended_at    INTEGER
+        );
+        INSERT INTO stat_epochs (started_at) VALUES (0);
+    """),
+    # 11: состояние кампании — битовая маска событий из CAMPAIGN_EVENTS
+    _create_campaign_state,
+    # 12: исходы отправки сообщений; users.unreachable — код постоянного отказа (0 — доступен)
+    _script("""
+        CREATE TABLE deliveries (
+            id          INTEGER PRIMARY KEY,
+            user_id     INTEGER NOT NULL,
+            source      TEXT NOT NULL,
+            status      INTEGER NOT NULL,
+            latency_ms  INTEGER NOT NULL,
+            created_at  INTEGER NOT NULL
+        );
+        CREATE INDEX idx_deliveries_time ON deliveries(created_at, status, latency_ms);
+        ALTER TABLE users ADD COLUMN unreachable INTEGER NOT NULL DEFAULT 0;
+        CREATE INDEX idx_users_unreachable ON users(user_id) WHERE unreachable <> 0;
+    """),
+    # 13: лента событий с фильтром по типу: записи индекса (kind, rowid) идут по порядку id
+    _script("CREATE INDEX idx_events_kind ON events(kind);"),
+]
+
+def migrate_legacy_events(batch_size: int) -> bool:
+    """Переносит очередную пачку событий из events_legacy (от новых к старым).
+
+    Возвращает True, когда переносить больше нечего. Счётчики event_rollups
+    уже учитывают эти события, поэтому трогать их не нужно.
+    """
+    with db_connect() as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events_legacy'").fetchone():
+            return True
+        ids = [row[0] for row in conn.execute("SELECT id FROM events_legacy ORDER BY id DESC LIMIT ?", (batch_size,))]
+        if not ids:
+            conn.execute("DROP TABLE events_legacy")
+            logging.info("Legacy events table migrated and dropped")
+            return True
+        low, high = ids[-1], ids[0]
+        conn.execute(
+            "INSERT OR IGNORE INTO event_kinds (type, payload) "
+            "SELECT DISTINCT type, IFNULL(payload, '') FROM events_legacy WHERE id BETWEEN ? AND ?",
+            (low, high),
+        )
+        conn.execute(
+            """
+            INSERT INTO events (id, user_id, kind, created_at)
+            SELECT l.id, l.user_id, k.id, CAST(strftime('%s', l.created_at) AS INTEGER)
+            FROM events_legacy l
+            JOIN event_kinds k ON k.type = l.type AND k.payload = IFNULL(l.payload, '')
+            WHERE l.id BETWEEN ? AND ?
+            """,
+            (low, high),
+        )
+        conn.execute(
+            """
+            UPDATE users SET last_seen = (SELECT MAX(created_at) FROM events WHERE events.user_id = users.user_id)
+            WHERE user_id IN (SELECT DISTINCT user_id FROM events WHERE id BETWEEN ? AND ?)
+            """,
+            (low, high),
+        )
+        refresh_funnel(conn, low, high)
+        backfill_campaign_state(conn, low, high)
+        conn.execute("DELETE FROM events_legacy WHERE id BETWEEN ? AND ?", (low, high))
+    return False
+
+def db_init() -> None:
+    """Применяет недостающие миграции; версия схемы хранится в PRAGMA user_version"""
+    conn = pool.acquire()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            logging.info("Applied database migration %s", number)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
@@ -0,0 +1,78 @@
+"""
+Учёт доставки сообщений Woolzy Bot
+Каждая отправка записывается в deliveries (исход и задержка); пользователь,
+на котором Telegram вернул постоянный отказ, помечается недоступным, а его
+отложенные сообщения снимаются
+"""
+
+import time
+from typing import Awaitable, TypeVar
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from events import record_write
+from metrics import DELIVERIES
+from stats import utcnow_ts
+from storage import profile_cache
+
+T = TypeVar("T")
+
+# Коды исхода отправки в deliveries.status
+DELIVERY_OK = 0
+DELIVERY_BLOCKED = 1         # Forbidden: пользователь заблокировал бота или удалил аккаунт
+DELIVERY_CHAT_NOT_FOUND = 2  # BadRequest «Chat not found»
+DELIVERY_RETRY_AFTER = 3     # превышен лимит Telegram, отправка будет повторена
+DELIVERY_FAILED = 4          # прочие ошибки
+# Постоянные отказы: пользователь помечается недоступным
+PERMANENT_FAILURES = (DELIVERY_BLOCKED, DELIVERY_CHAT_NOT_FOUND)
+
+DELIVERY_STATUS_NAMES = {
+    DELIVERY_OK: "ok",
+    DELIVERY_BLOCKED: "blocked",
+    DELIVERY_CHAT_NOT_FOUND: "chat_not_found",
+    DELIVERY_RETRY_AFTER: "retry_after",
+    DELIVERY_FAILED: "failed",
+}
+
+INSERT_DELIVERY_SQL = (
+    "INSERT INTO deliveries (user_id, source, status, latency_ms, created_at) VALUES (?, ?, ?, ?, ?)"
+)
+
+def delivery_status(error: Exception) -> int:
+    """Код исхода неудачной отправки по исключению Bot API"""
+    if isinstance(error, RetryAfter):
+        return DELIVERY_RETRY_AFTER
+    if isinstance(error, Forbidden):
+        return DELIVERY_BLOCKED
+    if isinstance(error, BadRequest) and "chat not found" in error.message.lower():
+        return DELIVERY_CHAT_NOT_FOUND
+    return DELIVERY_FAILED
+
+def is_permanent_failure(error: Exception) -> bool:
+    """Отказ, после которого пользователь помечен недоступным (заблокировал бота, чат не найден)"""
+    return delivery_status(error) in PERMANENT_FAILURES
+
+async def mark_unreachable(user_id: int, status: int) -> None:
+    """Помечает пользователя недоступным и снимает его отложенные сообщения"""
+    await record_write("UPDATE users SET unreachable = ? WHERE user_id = ?", (status, user_id))
+    # Отметку снимет первое же входящее обновление (save_user), даже с неизменным профилем
+    profile_cache.forget(user_id)
+    await record_write("DELETE FROM scheduled_messages WHERE user_id = ?", (user_id,))
+
+async def _record(source: str, user_id: int, status: int, started: float) -> None:
+    latency_ms = int((time.perf_counter() - started) * 1000)
+    DELIVERIES.inc(source=source, status=DELIVERY_STATUS_NAMES[status])
+    await record_write(INSERT_DELIVERY_SQL, (user_id, source, status, latency_ms, utcnow_ts()))
+    if status in PERMANENT_FAILURES:
+        await mark_unreachable(user_id, status)
+
+async def track_delivery(source: str, user_id: int, send: Awaitable[T]) -> T:
+    """Выполняет отправку и записывает её исход; исключения пробрасываются дальше"""
+    started = time.perf_counter()
+    try:
+        result = await send
+    except Exception as e:
+        await _record(source, user_id, delivery_status(e), started)
+        raise
+    await _record(source, user_id, DELIVERY_OK, started)
+    return result
@@ -0,0 +1,90 @@
+"""
+Порядок обработки обновлений Woolzy Bot
+Обновления одного пользователя обрабатываются строго по очереди,
+а обновления разных пользователей — параллельно
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+class _KeyQueue:
+    """Очередь одного пользователя: замок и число ожидающих в нём обновлений"""
+
+    __slots__ = ("lock", "pending")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления одного пользователя последовательно, разных — параллельно.
+
+    max_in_flight — сколько обновлений может быть принято одновременно (вместе
+    с ожидающими своей очереди); max_running — сколько из них выполняется
+    одновременно; max_per_user — сколько обновлений одного пользователя может
+    ждать, лишние (например, десятки нажатий подряд) отбрасываются.
+    Очередь пользователя удаляется, как только в ней не остаётся обновлений,
+    поэтому память не растёт с числом пользователей.
+    """
+
+    def __init__(self, max_in_flight: int, max_running: int, max_per_user: int) -> None:
+        super().__init__(max_in_flight)
+        self._running = asyncio.BoundedSemaphore(max_running)
+        self._max_per_user = max_per_user
+        self._queues: Dict[int, _KeyQueue] = {}
+        # Статистика: отброшенные обновления
+        self.dropped = 0
+
+    @staticmethod
+    def update_key(update: object) -> int | None:
+        """Ключ очереди: пользователь, а без него — чат; None — без упорядочивания"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    def active_keys(self) -> int:
+        """Сколько пользователей сейчас имеют обновления в обработке"""
+        return len(self._queues)
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        key = self.update_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _KeyQueue()
+        elif queue.pending >= self._max_per_user:
+            self.dropped += 1
+            logging.warning("Dropping update from %s: %s updates already queued", key, queue.pending)
+            if asyncio.iscoroutine(coroutine):
+                coroutine.close()
+            return
+
+        queue.pending += 1
+        try:
+            # Сначала очередь пользователя, потом общий лимит: ожидающие своей
+            # очереди обновления не занимают слоты выполнения
+            async with queue.lock:
+                async with self._running:
+                    await coroutine
+        finally:
+            queue.pending -= 1
+            if not queue.pending:
+                del self._queues[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,129 @@
+"""
+Просмотр событий Woolzy Bot
+Лента событий для админа с keyset-пагинацией: каждая страница — короткий
+проход по индексу, сколько бы событий ни было в таблице
+"""
+
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from db import db_connect
+from metrics import SQL_SECONDS
+from stats import action_name, format_time_short, format_user
+
+EVENTS_PAGE_SIZE = 15
+# Больше кодов у фильтра — вместо веток UNION ALL один проход по первичному ключу
+# (SQLite не принимает больше 500 веток в одном составном запросе)
+MAX_KIND_BRANCHES = 64
+# Сколько кнопок «к пользователю» показывать под страницей ленты
+MAX_USER_BUTTONS = 8
+
+# Фильтры ленты: код (используется в callback_data) -> (подпись, type, payload или None — любой)
+EVENT_FILTERS: Dict[str, Tuple[str, str | None, str | None]] = {
+    "all": ("все", None, None),
+    "start": ("старты", "start", None),
+    "click": ("клики", "button_click", None),
+    "kaspi": ("Kaspi", "button_click", "btn_kaspi"),
+    "msg": ("сообщения", "message_sent", None),
+}
+
+_COLUMNS = (
+    "e.id, e.created_at, e.user_id, k.type, k.payload, "
+    "IFNULL(u.first_name,''), IFNULL(u.last_name,''), IFNULL(u.username,''), "
+    "IFNULL(u.language_code,''), IFNULL(u.is_premium,0), IFNULL(u.is_bot,0)"
+)
+
+class EventsPage(NamedTuple):
+    text: str
+    next_cursor: str | None           # курсор следующей (более старой) страницы
+    users: List[Tuple[int, str]]      # пользователи страницы: (user_id, подпись кнопки)
+
+def _kinds(conn: Any, etype: str, payload: str | None) -> List[int]:
+    if payload is None:
+        return [row[0] for row in conn.execute("SELECT id FROM event_kinds WHERE type = ?", (etype,))]
+    return [row[0] for row in conn.execute("SELECT id FROM event_kinds WHERE type = ? AND payload = ?", (etype, payload))]
+
+def _render(title: str, rows: List[Tuple[Any, ...]], with_user: bool) -> Tuple[str, List[Tuple[int, str]]]:
+    lines = [title]
+    users: Dict[int, str] = {}
+    for _, created_at, uid, etype, payload, first_name, last_name, username, lang, is_premium, is_bot in rows:
+        action = action_name(etype, payload)
+        if with_user:
+            display = format_user(uid, first_name, last_name, username, lang, is_premium, is_bot)
+            lines.append(f"{format_time_short(created_at)} • {display} • {action}")
+            if uid not in users and len(users) < MAX_USER_BUTTONS:
+                users[uid] = first_name or (f"@{username}" if username else str(uid))
+        else:
+            lines.append(f"{format_time_short(created_at)} • {action}")
+    if not rows:
+        lines.append("Событий нет")
+    return "\n".join(lines), list(users.items())
+
+def get_events_page(filter_key: str = "all", before_id: int | None = None) -> EventsPage:
+    """Страница ленты от новых событий к старым, keyset по events.id.
+
+    Без фильтра — диапазон по первичному ключу; с фильтром — по индексу
+    idx_events_kind, отдельный ограниченный проход на каждый код события.
+    Если кодов больше MAX_KIND_BRANCHES, события фильтра ищутся проходом
+    по первичному ключу от новых к старым.
+    """
+    label, etype, payload = EVENT_FILTERS.get(filter_key, EVENT_FILTERS["all"])
+    limit = EVENTS_PAGE_SIZE + 1
+    bound = before_id if before_id is not None else 2**62
+    with db_connect() as conn, SQL_SECONDS.time(query="events_page"):
+        if etype is None:
+            sql = (
+                f"SELECT {_COLUMNS} FROM events e JOIN event_kinds k ON k.id = e.kind "
+                "LEFT JOIN users u ON u.user_id = e.user_id WHERE e.id < ? ORDER BY e.id DESC LIMIT ?"
+            )
+            params: List[Any] = [bound, limit]
+        elif len(kinds := _kinds(conn, etype, payload) or [-1]) > MAX_KIND_BRANCHES:
+            # Унарный плюс не даёт планировщику взять idx_events_kind и сортировать все события фильтра
+            sql = (
+                f"SELECT {_COLUMNS} FROM events e JOIN event_kinds k ON k.id = e.kind "
+                "LEFT JOIN users u ON u.user_id = e.user_id "
+                f"WHERE e.id < ? AND +e.kind IN ({', '.join('?' * len(kinds))}) ORDER BY e.id DESC LIMIT ?"
+            )
+            params = [bound, *kinds, limit]
+        else:
+            # По одной ветке на код: каждая читает не больше limit записей индекса
+            branch = "SELECT * FROM (SELECT id FROM events WHERE kind = ? AND id < ? ORDER BY id DESC LIMIT ?)"
+            sql = (
+                f"SELECT {_COLUMNS} FROM ("
+                + " UNION ALL ".join([branch] * len(kinds))
+                + ") p JOIN events e ON e.id = p.id JOIN event_kinds k ON k.id = e.kind "
+                "LEFT JOIN users u ON u.user_id = e.user_id ORDER BY e.id DESC LIMIT ?"
+            )
+            params = [value for kind in kinds for value in (kind, bound, limit)] + [limit]
+        rows = conn.execute(sql, params).fetchall()
+
+    has_next = len(rows) > EVENTS_PAGE_SIZE
+    rows = rows[:EVENTS_PAGE_SIZE]
+    text, users = _render(f"📜 События ({label}):", rows, with_user=True)
+    return EventsPage(text, str(rows[-1][0]) if has_next else None, users)
+
+def get_user_timeline(user_id: int, before: Tuple[int, int] | None = None) -> EventsPage:
+    """События одного пользователя от новых к старым, keyset по (created_at, id) в idx_events_user_time"""
+    keyset, params = "", [user_id]
+    if before is not None:
+        keyset = " AND (e.created_at, e.id) < (?, ?)"
+        params.extend(before)
+    params.append(EVENTS_PAGE_SIZE + 1)
+    with db_connect() as conn, SQL_SECONDS.time(query="user_timeline"):
+        rows = conn.execute(
+            f"SELECT {_COLUMNS} FROM events e JOIN event_kinds k ON k.id = e.kind "
+            f"LEFT JOIN users u ON u.user_id = e.user_id WHERE e.user_id = ?{keyset} "
+            "ORDER BY e.created_at DESC, e.id DESC LIMIT ?",
+            params,
+        ).fetchall()
+        profile = conn.execute(
+            "SELECT IFNULL(first_name,''), IFNULL(last_name,''), IFNULL(username,''), IFNULL(language_code,''), "
+            "IFNULL(is_premium,0), IFNULL(is_bot,0) FROM users WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+
+    has_next = len(rows) > EVENTS_PAGE_SIZE
+    rows = rows[:EVENTS_PAGE_SIZE]
+    display = format_user(user_id, *profile) if profile else str(user_id)
+    text, _ = _render(f"👤 {display} (id {user_id}):", rows, with_user=False)
+    cursor = f"{rows[-1][1]}:{rows[-1][0]}" if has_next else None
+    return EventsPage(text, cursor, [])
@@ -0,0 +1,205 @@
+"""
+Запись событий Woolzy Bot
+Обработчики только кладут записи в очередь, а отдельный поток пишет их в SQLite
+пачками в одной транзакции в порядке постановки в очередь
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, List, NamedTuple, Sequence, Tuple
+
+from config import EVENTS_BATCH_SIZE, EVENTS_FLUSH_INTERVAL, EVENTS_QUEUE_SIZE
+from db import db_connect
+from funnel import LAST_MSG_UPDATE_SQL, STEP_INSERT_SQL, funnel_rows
+from stats import (
+    LAST_SEEN_UPDATE_SQL,
+    ROLLUP_UPSERT_SQL,
+    event_kind_id,
+    forget_event_kinds,
+    last_seen_rows,
+    rollup_rows,
+    utcnow_ts,
+)
+
+INSERT_EVENT_SQL = "INSERT INTO events (user_id, kind, created_at) VALUES (?, ?, ?)"
+
+class Event(NamedTuple):
+    user_id: int
+    type: str
+    payload: str | None
+    created_at: int
+
+class Statement(NamedTuple):
+    sql: str
+    rows: Sequence[Sequence[Any]]
+
+_STOP = object()
+
+# ---------------- ПОТОК ЗАПИСИ ----------------
+class EventWriter:
+    """Write-behind очередь записей в БД.
+
+    Пачка сбрасывается, когда набралось batch_size записей или прошло
+    flush_interval секунд с первой записи в пачке. Если очередь заполнена,
+    submit() ждёт освобождения места, не блокируя event loop.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float) -> None:
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._thread: threading.Thread | None = None
+        # Статистика: записано записей, время ожидания блокировки записи и время сброса
+        self.enqueued = 0
+        self.written = 0
+        self.lock_wait_seconds = 0.0
+        self.flush_seconds = 0.0
+
+    def start(self) -> None:
+        """Запускает поток записи"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Дописывает всё, что осталось в очереди, и останавливает поток"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def pending(self) -> int:
+        """Сколько записей ждёт сброса в БД"""
+        return self._queue.qsize()
+
+    async def submit(self, item: Event | Statement) -> None:
+        """Ставит запись в очередь; при заполненной очереди ждёт (backpressure)"""
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                self.enqueued += 1
+                return
+            except queue.Full:
+                await asyncio.sleep(self._flush_interval / 10)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+        # Дописываем хвост, пришедший уже после сигнала остановки
+        tail = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                tail.append(item)
+        if tail:
+            self._flush(tail)
+
+    def _flush(self, batch: List[Event | Statement]) -> None:
+        started = time.monotonic()
+        try:
+            with db_connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self.lock_wait_seconds += time.monotonic() - started
+                _write(conn, batch)
+            self.written += len(batch)
+            failed = False
+        except Exception:
+            forget_event_kinds()
+            logging.exception("Failed to write %s queued records, retrying one by one", len(batch))
+            failed = True
+        if failed:
+            # Одна ошибочная запись не должна уносить с собой остальные записи пачки
+            self._flush_each(batch)
+        self.flush_seconds += time.monotonic() - started
+
+    def _flush_each(self, batch: List[Event | Statement]) -> None:
+        """Пишет пачку по одной записи: ошибочная запись откатывается до точки сохранения, остальные сохраняются"""
+        try:
+            with db_connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for item in batch:
+                    conn.execute("SAVEPOINT record")
+                    try:
+                        _write(conn, [item])
+                    except Exception:
+                        conn.execute("ROLLBACK TO record")
+                        forget_event_kinds()
+                        logging.exception("Dropped queued record %s", _describe(item))
+                    else:
+                        self.written += 1
+                    conn.execute("RELEASE record")
+        except Exception:
+            forget_event_kinds()
+            logging.exception("Failed to write %s queued records", len(batch))
+
+def _describe(item: Event | Statement) -> str:
+    if isinstance(item, Event):
+        return f"event {item.type}:{item.payload} of user {item.user_id}"
+    return f"statement {' '.join(item.sql.split())[:80]!r}"
+
+def _write(conn: sqlite3.Connection, batch: List[Event | Statement]) -> None:
+    """Выполняет записи в порядке постановки в очередь"""
+    # Подряд идущие события пишутся одной группой, подряд идущие одинаковые выражения — одним executemany
+    runs: List[Tuple[str | None, List[Any]]] = []
+    for item in batch:
+        sql = None if isinstance(item, Event) else item.sql
+        if not runs or runs[-1][0] != sql:
+            runs.append((sql, []))
+        if sql is None:
+            runs[-1][1].append(item)
+        else:
+            runs[-1][1].extend(item.rows)
+    for sql, group in runs:
+        if sql is None:
+            _write_events(conn, group)
+        else:
+            conn.executemany(sql, group)
+
+def _write_events(conn: sqlite3.Connection, events: List[Event]) -> None:
+    rows = [(e.user_id, event_kind_id(conn, e.type, e.payload), e.created_at) for e in events]
+    conn.executemany(INSERT_EVENT_SQL, rows)
+    conn.executemany(ROLLUP_UPSERT_SQL, rollup_rows(rows))
+    conn.executemany(LAST_SEEN_UPDATE_SQL, last_seen_rows(rows))
+    steps, last_msgs = funnel_rows(
+        (e.user_id, e.type, e.payload, kind, e.created_at) for e, (_, kind, _) in zip(events, rows)
+    )
+    conn.executemany(STEP_INSERT_SQL, steps)
+    conn.executemany(LAST_MSG_UPDATE_SQL, last_msgs)
+
+event_writer = EventWriter(EVENTS_QUEUE_SIZE, EVENTS_BATCH_SIZE, EVENTS_FLUSH_INTERVAL)
+
+# ---------------- API ДЛЯ ОБРАБОТЧИКОВ ----------------
+async def record_event(user_id: int, type: str, payload: str | None = None) -> None:
+    """Ставит событие в очередь записи; время фиксируется в момент вызова"""
+    await event_writer.submit(Event(user_id, type, payload, utcnow_ts()))
+
+async def record_write(sql: str, *rows: Sequence[Any]) -> None:
+    """Ставит в очередь произвольное выражение записи (по одному набору параметров на строку)"""
+    await event_writer.submit(Statement(sql, rows))
@@ -0,0 +1,89 @@
+"""
+Выгрузка данных Woolzy Bot в сжатые CSV/JSONL-файлы
+Строки читаются из БД порциями и сразу пишутся в gzip-файл, поэтому
+память не зависит от размера таблиц
+"""
+
+import csv
+import gzip
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterator, NamedTuple, Sequence, Tuple
+
+from db import db_connect
+
+FETCH_SIZE = 1000
+EXPORT_FORMATS = ("csv", "jsonl")
+# Лимит Bot API на загрузку файлов ботом
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+# Время отдаётся в ISO 8601 (UTC); преобразование делает SQLite, а не Python
+_ISO = "strftime('%Y-%m-%dT%H:%M:%SZ', NULLIF({}, 0), 'unixepoch')"
+
+# ---------------- ИСТОЧНИКИ ----------------
+class Source(NamedTuple):
+    title: str
+    columns: Sequence[str]
+    sql: str
+
+EXPORT_SOURCES: Dict[str, Source] = {
+    "users": Source(
+        "Пользователи",
+        ("user_id", "username", "first_name", "last_name", "language_code", "is_premium", "is_bot", "last_start", "last_seen"),
+        f"""
+        SELECT user_id, username, first_name, last_name, language_code, is_premium, is_bot,
+               {_ISO.format("last_start")}, {_ISO.format("last_seen")}
+        FROM users ORDER BY user_id
+        """,
+    ),
+    "events": Source(
+        "События",
+        ("id", "user_id", "type", "payload", "created_at"),
+        f"""
+        SELECT e.id, e.user_id, k.type, k.payload, {_ISO.format("e.created_at")}
+        FROM events e JOIN event_kinds k ON k.id = e.kind
+        ORDER BY e.id
+        """,
+    ),
+    # События, удалённые по сроку хранения (RETENTION_DAYS), остаются здесь в виде дневных итогов
+    "daily": Source(
+        "Итоги по дням",
+        ("day", "type", "payload", "events", "users"),
+        """
+        SELECT strftime('%Y-%m-%d', d.day, 'unixepoch'), k.type, k.payload, d.events, d.users
+        FROM events_daily d JOIN event_kinds k ON k.id = d.kind
+        ORDER BY d.day, k.type, k.payload
+        """,
+    ),
+}
+
+def iter_rows(source: Source) -> Iterator[Tuple[Any, ...]]:
+    """Строки источника порциями по FETCH_SIZE"""
+    with db_connect() as conn:
+        cur = conn.execute(source.sql)
+        while rows := cur.fetchmany(FETCH_SIZE):
+            yield from rows
+
+# ---------------- ЗАПИСЬ ----------------
+def write_export(name: str, fmt: str) -> Tuple[str, int]:
+    """Пишет выгрузку во временный .gz-файл; возвращает путь и число строк"""
+    source = EXPORT_SOURCES[name]
+    fd, path = tempfile.mkstemp(prefix=f"woolzy-{name}-", suffix=f".{fmt}.gz")
+    count = 0
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", compresslevel=6, encoding="utf-8", newline="") as f:
+            if fmt == "csv":
+                writer = csv.writer(f)
+                writer.writerow(source.columns)
+                for row in iter_rows(source):
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in iter_rows(source):
+                    f.write(json.dumps(dict(zip(source.columns, row)), ensure_ascii=False) + "\n")
+                    count += 1
+    except Exception:
+        os.remove(path)
+        raise
+    return path, count
@@ -0,0 +1,209 @@
+"""
+Воронка и когорты Woolzy Bot
+Для каждого пользователя хранится время первого достижения каждого шага
+(funnel_steps); таблица обновляется вместе с записью событий, поэтому отчёт
+не перечитывает events
+"""
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+
+from content import content
+from db import db_connect
+from metrics import SQL_SECONDS
+from stats import get_epoch
+
+DAY_SECONDS = 86400
+
+# Кнопки, которые считаются конверсией
+FUNNEL_BUTTONS = ("btn_group", "btn_guide", "btn_kaspi")
+STEP_TITLES: Dict[str, str] = {
+    "start": "🚀 Старт",
+    "btn_group": "👥 Группа",
+    "btn_guide": "📘 Гайд",
+    "btn_kaspi": "🛒 Kaspi",
+}
+# Окна отчёта: сколько последних дней-когорт показывать
+FUNNEL_WINDOWS: Dict[str, int] = {"7d": 7, "30d": 30}
+
+# ---------------- ОБНОВЛЕНИЕ СОСТОЯНИЯ ----------------
+# Шаг хранится кодом из event_kinds, как и в events. Первое достижение шага;
+# prev_kind — последнее сообщение, полученное до этого шага
+STEP_INSERT_SQL = """
+    INSERT INTO funnel_steps (user_id, kind, first_at, prev_kind)
+    VALUES (?, ?, ?, COALESCE(?, (SELECT last_msg_kind FROM users WHERE user_id = ?)))
+    ON CONFLICT(user_id, kind) DO NOTHING
+"""
+# users.last_msg_kind живёт рядом с last_seen: страницы users в пачке и так переписываются
+LAST_MSG_UPDATE_SQL = "UPDATE users SET last_msg_kind = ? WHERE user_id = ?"
+
+def event_step(etype: str, payload: str | None) -> str | None:
+    """Шаг воронки для события или None, если событие в воронку не входит"""
+    if etype == "start":
+        return "start"
+    if etype == "message_sent" and payload:
+        return f"msg:{payload}"
+    if etype == "button_click" and payload in FUNNEL_BUTTONS:
+        return payload
+    return None
+
+def funnel_rows(
+    events: Iterable[Tuple[int, str, str | None, int, int]],
+) -> Tuple[List[Tuple[Any, ...]], List[Tuple[int, int]]]:
+    """Строки для STEP_INSERT_SQL и LAST_MSG_UPDATE_SQL из пачки событий (user_id, type, payload, kind, created_at).
+
+    Выражения выполняются в этом порядке: шаги, для которых в пачке не было
+    предшествующего сообщения, берут prev_kind из состояния до пачки.
+    """
+    steps: List[Tuple[Any, ...]] = []
+    last_msg: Dict[int, int] = {}
+    for user_id, etype, payload, kind, created_at in events:
+        if event_step(etype, payload) is None:
+            continue
+        steps.append((user_id, kind, created_at, last_msg.get(user_id), user_id))
+        if etype == "message_sent":
+            last_msg[user_id] = kind
+    return steps, [(kind, user_id) for user_id, kind in last_msg.items()]
+
+# ---------------- ОТЧЁТ ----------------
+def funnel_steps() -> List[str]:
+    """Шаги отчёта по порядку: старт, сообщения цепочки текущей кампании, кнопки"""
+    return ["start", *(f"msg:{key}" for _, key in content.current.timeline), *FUNNEL_BUTTONS]
+
+def step_title(step: str) -> str:
+    """Подпись шага; сообщения, которых нет в STEP_TITLES, — по ключу"""
+    return STEP_TITLES.get(step) or f"✉️ {step[len('msg:'):]}"
+
+def format_duration(seconds: float) -> str:
+    """Короткая запись длительности: 45 с, 12 мин, 3.5 ч, 2.1 дн"""
+    if seconds < 60:
+        return f"{int(seconds)} с"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} мин"
+    if seconds < DAY_SECONDS:
+        return f"{seconds / 3600:.1f} ч"
+    return f"{seconds / DAY_SECONDS:.1f} дн"
+
+def _pct(part: int, whole: int) -> str:
+    return f"{part * 100 / whole:.1f}%" if whole else "—"
+
+# Шаги пользователей из когорт окна со временем от старта, отсортированные так,
+# чтобы медианы по когортам и по всему окну набирались за один проход.
+# Шаги считаются с :steps_since (начало эпохи статистики), когорты — по всему окну
+_REACHED_SQL = """
+    WITH starts AS (
+        SELECT user_id, first_at AS started, first_at - first_at % 86400 AS cohort
+        FROM funnel_steps WHERE kind = :start AND first_at >= :since
+    )
+    SELECT f.kind, s.cohort, f.first_at - s.started AS dt
+    FROM starts s JOIN funnel_steps f ON f.user_id = s.user_id
+    WHERE f.kind <> :start AND f.first_at >= s.started AND f.first_at >= :steps_since
+    ORDER BY f.kind, dt
+"""
+
+def _median(sorted_values: List[int]) -> int:
+    return sorted_values[(len(sorted_values) - 1) // 2]
+
+def reached_by_cohort(
+    conn: Any, start_kind: int, since: int, steps: Dict[int, str | None], steps_since: int = 0,
+) -> Dict[int | None, Dict[str, Tuple[int, int]]]:
+    """{когорта: {шаг: (дошли, медиана секунд от старта)}}; когорта None — всё окно"""
+    result: Dict[int | None, Dict[str, Tuple[int, int]]] = defaultdict(dict)
+    kind: int | None = None
+    values: Dict[int | None, List[int]] = defaultdict(list)
+
+    def close_step() -> None:
+        step = steps.get(kind)
+        if step is not None:
+            for cohort, dts in values.items():
+                result[cohort][step] = (len(dts), _median(dts))
+        values.clear()
+
+    for row_kind, cohort, dt in conn.execute(
+        _REACHED_SQL, {"start": start_kind, "since": since, "steps_since": steps_since},
+    ):
+        if row_kind != kind:
+            close_step()
+            kind = row_kind
+        values[cohort].append(dt)
+        values[None].append(dt)
+    close_step()
+    return result
+
+def build_funnel_text(window_key: str) -> str:
+    """Отчёт по воронке для когорт (день первого /start, UTC) за окно"""
+    days = FUNNEL_WINDOWS[window_key]
+    now = int(datetime.now(timezone.utc).timestamp())
+    since = now - now % DAY_SECONDS - (days - 1) * DAY_SECONDS
+
+    starts: Dict[int, int] = {}
+    by_cohort: Dict[int | None, Dict[str, Tuple[int, int]]] = defaultdict(dict)
+    kaspi_prev: List[Tuple[str, int]] = []
+    with db_connect() as conn:
+        # Обнуление статистики отсекает шаги, сделанные до него, но не когорты: пользователь,
+        # стартовавший до обнуления, остаётся в своей когорте и учитывается, если дошёл до шага после
+        epoch = get_epoch(conn.cursor())
+        steps_since = epoch.started_at if epoch is not None else 0
+        # Справочник маленький: шаги сопоставляем с кодами в Python
+        steps = {kind: event_step(etype, payload) for kind, etype, payload in conn.execute("SELECT id, type, payload FROM event_kinds")}
+        kind_of = {step: kind for kind, step in steps.items() if step is not None}
+        start_kind = kind_of.get("start")
+        if start_kind is not None:
+            with SQL_SECONDS.time(query="funnel_starts"):
+                starts = dict(conn.execute(
+                    "SELECT first_at - first_at % 86400, COUNT(*) FROM funnel_steps "
+                    "WHERE kind = ? AND first_at >= ? GROUP BY 1",
+                    (start_kind, since),
+                ).fetchall())
+            with SQL_SECONDS.time(query="funnel_steps"):
+                by_cohort = reached_by_cohort(conn, start_kind, since, steps, steps_since)
+        if start_kind is not None and "btn_kaspi" in kind_of:
+            with SQL_SECONDS.time(query="funnel_kaspi_prev"):
+                kaspi_prev = [
+                    ((steps.get(prev) or "")[len("msg:"):], cnt)
+                    for prev, cnt in conn.execute(
+                        """
+                        SELECT k.prev_kind, COUNT(*)
+                        FROM funnel_steps s JOIN funnel_steps k ON k.user_id = s.user_id AND k.kind = ?
+                        WHERE s.kind = ? AND s.first_at >= ? AND k.first_at >= s.first_at AND k.first_at >= ?
+                        GROUP BY 1 ORDER BY 2 DESC
+                        """,
+                        (kind_of["btn_kaspi"], start_kind, since, steps_since),
+                    )
+                ]
+
+    total_starts = sum(starts.values())
+
+    lines = [f"<b>🔻 Воронка: когорты за {days} дн.</b> (по дню первого /start, UTC)"]
+    if steps_since > since:
+        reset_at = datetime.fromtimestamp(steps_since, timezone.utc).strftime("%m-%d %H:%M")
+        lines.append(f"Шаги учтены с обнуления статистики ({reset_at} UTC)")
+    lines.append("")
+    lines.append(f"{step_title('start')}: {total_starts}")
+    prev = total_starts
+    for step in funnel_steps()[1:]:
+        cnt, median = by_cohort[None].get(step, (0, 0))
+        conv = f"{_pct(cnt, total_starts)} от старта"
+        if step.startswith("msg:"):
+            # Сообщения цепочки идут друг за другом: показываем и переход от предыдущего шага
+            conv += f", {_pct(cnt, prev)} от пред."
+            prev = cnt
+        median_text = f" • медиана {format_duration(median)}" if cnt else ""
+        lines.append(f"{step_title(step)}: {cnt} ({conv}){median_text}")
+
+    if kaspi_prev:
+        parts = [f"{msg or 'нет сообщения'} — {cnt}" for msg, cnt in kaspi_prev]
+        lines += ["", "<b>🛒 Перед первым кликом Kaspi</b>", ", ".join(parts)]
+
+    lines += ["", "<b>По когортам</b>"]
+    if not starts:
+        lines.append("Нет стартов за этот период.")
+    for cohort in sorted(starts, reverse=True):
+        day = datetime.fromtimestamp(cohort, timezone.utc).strftime("%m-%d")
+        cohort_steps = by_cohort.get(cohort, {})
+        conv = " · ".join(
+            f"{STEP_TITLES[b].split()[-1]} {_pct(cohort_steps.get(b, (0, 0))[0], starts[cohort])}" for b in FUNNEL_BUTTONS
+        )
+        lines.append(f"{day}: {starts[cohort]} → {conv}")
+    return "\n".join(lines)
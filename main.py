@@ -7,57 +7,88 @@ import asyncio
 import logging
 import os
 import sqlite3
+import time
 from datetime import datetime, timezone
 from typing import List
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 from telegram.ext import (
-    AIORateLimiter,
     Application,
     ApplicationBuilder,
     CallbackContext,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
+    MessageHandler,
+    filters,
 )
 
 # Импорты из модулей
-from config import BOT_TOKEN, DB_PATH, is_admin, GROUP_LINK, GUIDE_LINK, SHOP_LINK
-from timings import TIMELINE
-from messages import MESSAGES
-from buttons import BUTTON_SETS, get_special_buttons
-from stats import utcnow_iso, db_connect, build_stats_text, get_users_list, reset_statistics
-
-# ---------------- БАЗА ДАННЫХ ----------------
-SCHEMA_SQL = """
-CREATE TABLE IF NOT EXISTS users (
-    user_id     INTEGER PRIMARY KEY,
-    username    TEXT,
-    first_name  TEXT,
-    last_name   TEXT,
-    language_code TEXT,
-    is_premium  INTEGER DEFAULT 0,
-    is_bot      INTEGER DEFAULT 0,
-    last_start  TEXT
-);
-
-CREATE TABLE IF NOT EXISTS events (
-    id          INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id     INTEGER NOT NULL,
-    type        TEXT NOT NULL,
-    payload     TEXT,
-    created_at  TEXT NOT NULL
-);
-CREATE INDEX IF NOT EXISTS idx_events_user_time ON events(user_id, created_at);
-"""
-
-def db_init() -> None:
-    """Инициализация базы данных"""
-    with db_connect() as conn:
-        conn.executescript(SCHEMA_SQL)
+from config import (
+    BOT_API_BASE_URL,
+    BOT_MODE,
+    BOT_TOKEN,
+    CAMPAIGN_RELOAD_INTERVAL,
+    DB_PATH,
+    METRICS_HOST,
+    METRICS_PORT,
+    OUTBOX_TICK_SECONDS,
+    RETENTION_DAYS,
+    RETENTION_INTERVAL,
+    SEND_BULK_RESERVE,
+    SEND_BURST,
+    SEND_CHAT_BURST,
+    SEND_CHAT_RATE,
+    SEND_DRIP_JITTER,
+    SEND_GROUP_PER_MINUTE,
+    SEND_RATE,
+    UPDATE_CONCURRENCY,
+    UPDATE_MAX_IN_FLIGHT,
+    UPDATE_MAX_PER_USER,
+    UPDATE_QUEUE_SIZE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    is_admin,
+    GROUP_LINK,
+    GUIDE_LINK,
+    SHOP_LINK,
+)
+from content import ContentError, content, describe, format_problems
+from db import db_connect, db_init, migrate_legacy_events, pool
+from events import event_writer, record_write
+from stats import (
+    USERS_FILTERS,
+    UsersPage,
+    utcnow_ts,
+    build_stats_text,
+    format_epoch,
+    list_past_epochs,
+    reset_statistics,
+)
+from scheduler import campaign_event, drain_outbox, schedule_messages
+from metrics import InstrumentedRequest, counter_fn, gauge, start_metrics_server, timed
+from dispatcher import PerUserUpdateProcessor
+from delivery import track_delivery
+from ratelimit import PRIORITY_DRIP, PRIORITY_INTERACTIVE, PriorityRateLimiter
+from broadcast import cancel_broadcast, create_broadcast, resume_broadcasts, run_broadcast
+from retention import compact_events
+from reports import report_cache
+from storage import profile_cache, profile_of, save_user, storage
+from funnel import FUNNEL_WINDOWS, build_funnel_text
+from eventlog import EVENT_FILTERS, EventsPage, get_events_page, get_user_timeline
+from profiler import PROFILE_DURATIONS, collapsed_stacks, profiler, summary_text
+import stats
+from export import EXPORT_FORMATS, EXPORT_SOURCES, MAX_UPLOAD_BYTES, write_export
+
+ALLOWED_UPDATES = ["message", "callback_query"]
 
 # ---------------- БОТ ----------------
+@timed("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /start"""
     if not update.effective_user or not update.effective_chat:
@@ -65,75 +96,24 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     chat_id = update.effective_chat.id
 
-    with db_connect() as conn:
-        # Лёгкая миграция для новых колонок
-        try:
-            conn.execute("ALTER TABLE users ADD COLUMN language_code TEXT")
-        except Exception:
-            pass
-        try:
-            conn.execute("ALTER TABLE users ADD COLUMN is_premium INTEGER DEFAULT 0")
-        except Exception:
-            pass
-        try:
-            conn.execute("ALTER TABLE users ADD COLUMN is_bot INTEGER DEFAULT 0")
-        except Exception:
-            pass
-
-        # Сохраняем расширенную информацию о пользователе
-        language_code = getattr(user, "language_code", None)
-        is_premium = 1 if getattr(user, "is_premium", False) else 0
-        is_bot = 1 if getattr(user, "is_bot", False) else 0
-
-        conn.execute(
-            """
-            INSERT INTO users (user_id, username, first_name, last_name, language_code, is_premium, is_bot, last_start)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                username=excluded.username,
-                first_name=excluded.first_name,
-                last_name=excluded.last_name,
-                language_code=excluded.language_code,
-                is_premium=excluded.is_premium,
-                is_bot=excluded.is_bot,
-                last_start=excluded.last_start
-            """,
-            (
-                user.id,
-                user.username,
-                user.first_name,
-                user.last_name,
-                language_code,
-                is_premium,
-                is_bot,
-                utcnow_iso(),
-            ),
-        )
-        conn.execute(
-            "INSERT INTO events (user_id, type, payload, created_at) VALUES (?, ?, ?, ?)",
-            (user.id, "start", None, utcnow_iso()),
-        )
-        conn.commit()
+    # Сохраняем расширенную информацию о пользователе
+    await save_user(profile_of(user), started_at=utcnow_ts())
+    await storage.record_event(user.id, "start")
 
-    # Планируем таймеры только для обычных пользователей
     if not is_admin(user.id, chat_id):
-        for delay, key in TIMELINE:
-            context.job_queue.run_once(
-                send_timed_message,
-                when=delay,
-                data={"chat_id": chat_id, "user_id": user.id, "key": key},
-                name=f"msg_{user.id}_{key}_{delay}",
-            )
+        # Планируем шаги кампании только для обычных пользователей
+        await campaign_event(chat_id, user.id, "start")
 
         # Отправляем приветствие сразу
         await send_timed_message(
             CallbackContext.from_update(update, context),
-            data={"chat_id": chat_id, "user_id": user.id, "key": "welcome"},
+            data={"chat_id": chat_id, "user_id": user.id, "key": "welcome", "priority": PRIORITY_INTERACTIVE},
         )
     else:
         # Для админов отправляем только статистику и кнопку для тестирования последовательности
         await send_admin_overview(context, chat_id, user.id)
 
+@timed("send_timed_message")
 async def send_timed_message(context: CallbackContext, data: dict | None = None) -> None:
     """Отправка сообщения по таймеру"""
     if not data:
@@ -144,33 +124,36 @@ async def send_timed_message(context: CallbackContext, data: dict | None = None)
     if not chat_id or not key:
         return
 
-    text = MESSAGES.get(key)
-    keyboard = None
-
-    # Базовые кнопки из набора
-    rows: List[List[InlineKeyboardButton]] = []
-    if key in BUTTON_SETS:
-        for row in BUTTON_SETS[key]:
-            btn_row = [InlineKeyboardButton(text=txt, callback_data=payload) for txt, payload in row]
-            rows.append(btn_row)
-
-    # Специальные кнопки для конкретных сообщений
-    special_buttons = get_special_buttons(key)
-    rows.extend(special_buttons)
-
-    if rows:
-        keyboard = InlineKeyboardMarkup(rows)
-
-    await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+    # Текст и клавиатура берутся из одного снимка, даже если контент перезагрузят во время отправки
+    snapshot = content.current
+    text = snapshot.messages.get(key)
+    if text is None:
+        # Шаг из очереди, которого нет в новой версии кампании
+        logging.warning("Unknown message key %s, skipping", key)
+        return
+    keyboard = snapshot.keyboards.get(key)
+
+    # Исход отправки записывается; заблокировавший бота пользователь помечается недоступным
+    await track_delivery(
+        "drip",
+        user_id or chat_id,
+        context.bot.send_message(
+            chat_id=chat_id,
+            text=text,
+            reply_markup=keyboard,
+            parse_mode=ParseMode.HTML,
+            rate_limit_args=data.get("priority", PRIORITY_DRIP),
+        ),
+    )
 
     if user_id:
-        with db_connect() as conn:
-            conn.execute(
-                "INSERT INTO events (user_id, type, payload, created_at) VALUES (?, ?, ?, ?)",
-                (user_id, "message_sent", key, utcnow_iso()),
-            )
-            conn.commit()
+        await storage.record_event(user_id, "message_sent", key)
+
+# Кнопки меню админа не пишутся в события: в их callback_data курсоры страниц,
+# и каждое листание отчёта добавляло бы новую пару в event_kinds
+ADMIN_CALLBACKS = ("btn_test_sequence", "btn_stats", "stats_", "btn_profile", "profile_", "btn_broadcast", "broadcast_")
 
+@timed("on_button")
 async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик нажатий на кнопки"""
     if not update.callback_query or not update.effective_user:
@@ -180,66 +163,18 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     payload = query.data or ""
 
-    with db_connect() as conn:
-        # Обновим профиль пользователя на случай изменений
-        try:
-            conn.execute("ALTER TABLE users ADD COLUMN language_code TEXT")
-        except Exception:
-            pass
-        try:
-            conn.execute("ALTER TABLE users ADD COLUMN is_premium INTEGER DEFAULT 0")
-        except Exception:
-            pass
-        try:
-            conn.execute("ALTER TABLE users ADD COLUMN is_bot INTEGER DEFAULT 0")
-        except Exception:
-            pass
-
-        language_code = getattr(user, "language_code", None)
-        is_premium = 1 if getattr(user, "is_premium", False) else 0
-        is_bot = 1 if getattr(user, "is_bot", False) else 0
-
-        conn.execute(
-            """
-            INSERT INTO users (user_id, username, first_name, last_name, language_code, is_premium, is_bot, last_start)
-            VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE((SELECT last_start FROM users WHERE user_id = ?), NULL))
-            ON CONFLICT(user_id) DO UPDATE SET
-                username=excluded.username,
-                first_name=excluded.first_name,
-                last_name=excluded.last_name,
-                language_code=excluded.language_code,
-                is_premium=excluded.is_premium,
-                is_bot=excluded.is_bot
-            """,
-            (
-                user.id,
-                user.username,
-                user.first_name,
-                user.last_name,
-                language_code,
-                is_premium,
-                is_bot,
-                user.id,
-            ),
-        )
-        conn.execute(
-            "INSERT INTO events (user_id, type, payload, created_at) VALUES (?, ?, ?, ?)",
-            (user.id, "button_click", payload, utcnow_iso()),
-        )
-        conn.commit()
+    # Обновим профиль пользователя, если он изменился
+    await save_user(profile_of(user))
+    if not payload.startswith(ADMIN_CALLBACKS):
+        await storage.record_event(user.id, "button_click", payload)
+        if update.effective_chat:
+            # Переход кампании: флаг события, отмена ненужных шагов, новые шаги (например, видео после гайда)
+            await campaign_event(update.effective_chat.id, user.id, payload)
 
     if payload == "btn_group":
         await query.message.reply_text(f"Вот ссылка на закрытую группу: <a href='{GROUP_LINK}'>перейти в группу</a>", parse_mode=ParseMode.HTML)
     elif payload == "btn_guide":
         await query.message.reply_text(f"Вот твой PDF-гайд: <a href='{GUIDE_LINK}'>Скачать PDF</a>", parse_mode=ParseMode.HTML)
-        
-        # Планируем отправку видео через 24 часа после клика на гайд
-        context.job_queue.run_once(
-            send_timed_message,
-            when=24 * 3600,  # 24 часа в секундах
-            data={"chat_id": update.effective_chat.id, "user_id": user.id, "key": "video"},
-            name=f"msg_{user.id}_video_24h_after_guide",
-        )
     elif payload == "btn_kaspi":
         await query.message.reply_text(f"Оформить заказ в Kaspi: <a href='{SHOP_LINK}'>перейти в Kaspi</a>", parse_mode=ParseMode.HTML)
     elif payload == "btn_test_sequence":
@@ -256,16 +191,16 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             data={"chat_id": update.effective_chat.id, "user_id": user.id, "key": "welcome"},
         )
         
+        # Тест идёт с чистого состояния кампании, иначе прошлые клики отменят часть шагов
+        await record_write("DELETE FROM campaign_state WHERE user_id = ?", (user.id,))
+
         # Планируем остальные сообщения с короткими интервалами для тестирования
         test_delays = [5, 10, 15, 20]  # 5, 10, 15, 20 секунд для быстрого тестирования
-        for i, (_, key) in enumerate(TIMELINE):
-            if i < len(test_delays):
-                context.job_queue.run_once(
-                    send_timed_message,
-                    when=test_delays[i],
-                    data={"chat_id": update.effective_chat.id, "user_id": user.id, "key": key},
-                    name=f"test_{user.id}_{key}_{test_delays[i]}",
-                )
+        await schedule_messages(
+            update.effective_chat.id,
+            user.id,
+            [(delay, key) for delay, (_, key) in zip(test_delays, content.current.timeline)],
+        )
         
         await query.answer("Тест запущен! Сообщения придут через 5, 10, 15, 20 секунд.", show_alert=True)
         
@@ -289,20 +224,154 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                     InlineKeyboardButton(text="📊 Кратко всё", callback_data="stats_short_all"),
                     InlineKeyboardButton(text="📊 Подробно всё", callback_data="stats_full_all"),
                 ],
+                [
+                    InlineKeyboardButton(text=f"🔻 Воронка {key}", callback_data=f"stats_funnel:{key}")
+                    for key in FUNNEL_WINDOWS
+                ],
                 [
                     InlineKeyboardButton(text="👥 Все пользователи", callback_data="stats_users"),
+                    InlineKeyboardButton(text="📜 События", callback_data="stats_events"),
+                    InlineKeyboardButton(text="⬇️ Выгрузка", callback_data="stats_export"),
                 ],
                 [
+                    InlineKeyboardButton(text="🗂 Прошлые периоды", callback_data="stats_epochs"),
                     InlineKeyboardButton(text="♻️ Обнулить статистику", callback_data="stats_reset_confirm"),
                 ],
             ])
             await query.message.reply_text("Выберите отчёт:", reply_markup=kb)
             return
 
-        if payload == "stats_users":
-            # Показать список пользователей
-            text = get_users_list()
-            await query.message.reply_text(text)
+        if payload == "stats_users" or payload.startswith("stats_users:"):
+            # Список пользователей: stats_users[:{фильтр}[:{n|p}:{last_seen}:{user_id}]]
+            parts = payload.split(":")
+            filter_key = parts[1] if len(parts) > 1 else "all"
+            after = before = None
+            if len(parts) == 5:
+                cursor = (int(parts[3]), int(parts[4]))
+                if parts[2] == "n":
+                    after = cursor
+                else:
+                    before = cursor
+            page = await report_cache.get(("users", filter_key, after, before), storage.users_page, filter_key, after, before)
+            kb = users_page_keyboard(filter_key, page)
+            if len(parts) == 1:
+                await query.message.reply_text(page.text, reply_markup=kb)
+            else:
+                try:
+                    await query.edit_message_text(page.text, reply_markup=kb)
+                except BadRequest:
+                    # Та же страница (например, повторно выбран текущий фильтр)
+                    pass
+                await query.answer()
+            return
+
+        if payload == "stats_events" or payload.startswith("stats_events:"):
+            # Лента событий: stats_events[:{фильтр}[:{id последнего события страницы}]]
+            parts = payload.split(":")
+            filter_key = parts[1] if len(parts) > 1 else "all"
+            before_id = int(parts[2]) if len(parts) > 2 else None
+            page = await asyncio.to_thread(get_events_page, filter_key, before_id)
+            kb = events_page_keyboard(filter_key, page, first=before_id is None)
+            if len(parts) == 1:
+                await query.message.reply_text(page.text, reply_markup=kb)
+            else:
+                try:
+                    await query.edit_message_text(page.text, reply_markup=kb)
+                except BadRequest:
+                    pass
+                await query.answer()
+            return
+
+        if payload.startswith("stats_user:"):
+            # События пользователя: stats_user:{user_id}[:{created_at}:{id}]
+            parts = payload.split(":")
+            target = int(parts[1])
+            before = (int(parts[2]), int(parts[3])) if len(parts) == 4 else None
+            page = await asyncio.to_thread(get_user_timeline, target, before)
+            nav: List[InlineKeyboardButton] = []
+            if before is not None:
+                nav.append(InlineKeyboardButton(text="⏮ Сначала", callback_data=f"stats_user:{target}"))
+            if page.next_cursor:
+                nav.append(InlineKeyboardButton(text="Старее ▶️", callback_data=f"stats_user:{target}:{page.next_cursor}"))
+            kb = InlineKeyboardMarkup([nav]) if nav else None
+            if before is None:
+                await query.message.reply_text(page.text, reply_markup=kb)
+            else:
+                try:
+                    await query.edit_message_text(page.text, reply_markup=kb)
+                except BadRequest:
+                    pass
+                await query.answer()
+            return
+
+        if payload == "stats_epochs":
+            # Прошлые эпохи (до обнулений): stats_epoch:{id}[:full]
+            epochs = await asyncio.to_thread(list_past_epochs)
+            if not epochs:
+                await query.message.reply_text("Статистику ещё не обнуляли.")
+                return
+            kb = InlineKeyboardMarkup(
+                [[InlineKeyboardButton(text=format_epoch(epoch), callback_data=f"stats_epoch:{epoch.id}")] for epoch in epochs]
+            )
+            await query.message.reply_text("Статистика до обнулений:", reply_markup=kb)
+            return
+
+        if payload.startswith("stats_epoch:"):
+            parts = payload.split(":")
+            detailed = len(parts) > 2 and parts[2] == "full"
+            epoch_id = int(parts[1])
+            text = await report_cache.get(("stats", "all", detailed, epoch_id), build_stats_text, "all", detailed, epoch_id)
+            kb = None if detailed else InlineKeyboardMarkup(
+                [[InlineKeyboardButton(text="📊 Подробно", callback_data=f"stats_epoch:{parts[1]}:full")]]
+            )
+            await query.message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=kb)
+            return
+
+        if payload.startswith("stats_funnel:"):
+            window = payload.split(":", 1)[1]
+            if window not in FUNNEL_WINDOWS:
+                await query.answer("Неверный период", show_alert=False)
+                return
+            text = await report_cache.get(("funnel", window), build_funnel_text, window)
+            await query.message.reply_text(text, parse_mode=ParseMode.HTML)
+            return
+
+        if payload == "stats_export":
+            # Выбор выгрузки: stats_export:{users|events|daily}:{csv|jsonl}
+            kb = InlineKeyboardMarkup([
+                [
+                    InlineKeyboardButton(text=f"{source.title} · {fmt.upper()}", callback_data=f"stats_export:{name}:{fmt}")
+                    for fmt in EXPORT_FORMATS
+                ]
+                for name, source in EXPORT_SOURCES.items()
+            ])
+            await query.message.reply_text("Выберите выгрузку (файл .gz):", reply_markup=kb)
+            return
+
+        if payload.startswith("stats_export:"):
+            _, name, fmt = payload.split(":")
+            if name not in EXPORT_SOURCES or fmt not in EXPORT_FORMATS:
+                await query.answer("Неверный формат", show_alert=False)
+                return
+            await query.answer("Готовлю файл…")
+            path, count = await asyncio.to_thread(write_export, name, fmt)
+            try:
+                if os.path.getsize(path) > MAX_UPLOAD_BYTES:
+                    await query.message.reply_text(
+                        f"Файл слишком большой для Telegram ({os.path.getsize(path) // (1024 * 1024)} МБ, строк: {count}). "
+                        "Скопируйте файл БД с сервера."
+                    )
+                    return
+                stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M")
+                with open(path, "rb") as f:
+                    await query.message.reply_document(
+                        document=f,
+                        filename=f"woolzy-{name}-{stamp}.{fmt}.gz",
+                        caption=f"{EXPORT_SOURCES[name].title}, строк: {count}",
+                        write_timeout=300,
+                    )
+            finally:
+                os.remove(path)
             return
 
         if payload == "stats_reset_confirm":
@@ -317,9 +386,10 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             return
 
         if payload == "stats_reset_yes":
-            # Удаляем все события
-            reset_statistics()
-            await query.message.reply_text("Статистика обнулена.")
+            # Открываем новую эпоху; прошлые данные остаются в «Прошлые периоды»
+            await asyncio.to_thread(reset_statistics)
+            report_cache.clear()
+            await query.message.reply_text("Статистика обнулена. Прежние данные — в «🗂 Прошлые периоды».")
             return
 
         if payload == "stats_reset_no":
@@ -338,22 +408,186 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             await query.answer("Неверный период", show_alert=False)
             return
 
-        text = build_stats_text(period, detailed)
+        text = await report_cache.get(("stats", period, detailed, None), storage.stats_text, period, detailed)
         await query.message.reply_text(text, parse_mode=ParseMode.HTML)
+    elif payload == "btn_profile" or payload.startswith("profile_"):
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        if not is_admin(user.id, chat_id):
+            await query.answer("Недоступно", show_alert=False)
+            return
+
+        if payload == "btn_profile":
+            kb = InlineKeyboardMarkup([[
+                InlineKeyboardButton(text=f"⏱ {seconds} с", callback_data=f"profile_run:{seconds}")
+                for seconds in PROFILE_DURATIONS
+            ]])
+            await query.message.reply_text(
+                "Профилирование обработчиков и отчётов: срезы стеков раз в несколько миллисекунд. "
+                "Бот продолжает работать как обычно. Сколько записывать?",
+                reply_markup=kb,
+            )
+            return
+
+        if payload.startswith("profile_run:"):
+            seconds = int(payload.split(":", 1)[1])
+            if seconds not in PROFILE_DURATIONS:
+                await query.answer("Неверная длительность", show_alert=False)
+                return
+            if profiler.running:
+                await query.answer("Профилирование уже идёт", show_alert=True)
+                return
+            await query.answer()
+            await query.message.reply_text(f"🔬 Записываю профиль {seconds} с…")
+            context.application.create_task(run_profile(context, chat_id, seconds))
+            return
+    elif payload == "btn_broadcast" or payload.startswith("broadcast_"):
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        if not is_admin(user.id, chat_id):
+            await query.answer("Недоступно", show_alert=False)
+            return
+
+        if payload == "btn_broadcast":
+            # Ждём текст рассылки следующим сообщением
+            context.user_data["awaiting_broadcast"] = True
+            await query.message.reply_text(
+                "📣 Пришлите текст рассылки одним сообщением. Форматирование сохранится.",
+                reply_markup=InlineKeyboardMarkup(
+                    [[InlineKeyboardButton("Отмена", callback_data="broadcast_cancel")]]
+                ),
+            )
+            return
+
+        if payload == "broadcast_cancel":
+            context.user_data.pop("awaiting_broadcast", None)
+            context.user_data.pop("broadcast_text", None)
+            await query.answer("Отменено", show_alert=False)
+            return
+
+        if payload == "broadcast_go":
+            text = context.user_data.pop("broadcast_text", None)
+            if not text:
+                await query.answer("Нет текста для рассылки", show_alert=False)
+                return
+            broadcast_id = await asyncio.to_thread(create_broadcast, chat_id, text)
+            context.application.create_task(run_broadcast(context.bot, broadcast_id))
+            await query.answer("Рассылка запущена", show_alert=False)
+            return
+
+        if payload.startswith("broadcast_stop:"):
+            cancel_broadcast(int(payload.split(":", 1)[1]))
+            await query.answer("Останавливаю…", show_alert=False)
+            return
     else:
         await query.answer("Зафиксировал! ✅")
 
+async def on_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Принимает текст рассылки от админа и просит подтверждения"""
+    if not update.message or not update.effective_user:
+        return
+    if not is_admin(update.effective_user.id, update.effective_chat.id if update.effective_chat else None):
+        return
+    if not context.user_data.pop("awaiting_broadcast", False):
+        return
+
+    text = update.message.text_html
+    context.user_data["broadcast_text"] = text
+    kb = InlineKeyboardMarkup(
+        [[
+            InlineKeyboardButton("Да, разослать", callback_data="broadcast_go"),
+            InlineKeyboardButton("Отмена", callback_data="broadcast_cancel"),
+        ]]
+    )
+    await update.message.reply_text(f"Разослать всем пользователям?\n\n{text}", reply_markup=kb, parse_mode=ParseMode.HTML)
+
+async def reload_content(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/reload — перечитать campaign.json без перезапуска бота"""
+    if not update.message or not update.effective_user:
+        return
+    if not is_admin(update.effective_user.id, update.effective_chat.id if update.effective_chat else None):
+        return
+    try:
+        snapshot = content.reload()
+    except ContentError as e:
+        await update.message.reply_text(
+            f"❌ Файл кампании с ошибками, работает прежняя {describe(content.current)}\n\n{format_problems(e)}"
+        )
+        return
+    except OSError as e:
+        await update.message.reply_text(f"❌ Не удалось прочитать файл кампании: {e}")
+        return
+    await update.message.reply_text(f"✅ Кампания обновлена, {describe(snapshot)}")
+
+def users_page_keyboard(filter_key: str, page: UsersPage) -> InlineKeyboardMarkup:
+    """Кнопки листания и фильтров для списка пользователей"""
+    nav: List[InlineKeyboardButton] = []
+    if page.has_prev and page.first:
+        nav.append(InlineKeyboardButton(
+            text="◀️ Новее", callback_data=f"stats_users:{filter_key}:p:{page.first[0]}:{page.first[1]}"
+        ))
+    if page.has_next and page.last:
+        nav.append(InlineKeyboardButton(
+            text="Старее ▶️", callback_data=f"stats_users:{filter_key}:n:{page.last[0]}:{page.last[1]}"
+        ))
+    filters = [
+        InlineKeyboardButton(text=f"• {label}" if key == filter_key else label, callback_data=f"stats_users:{key}")
+        for key, (label, _, _) in USERS_FILTERS.items()
+    ]
+    rows = [nav] if nav else []
+    rows.extend(filters[i:i + 3] for i in range(0, len(filters), 3))
+    return InlineKeyboardMarkup(rows)
+
+def events_page_keyboard(filter_key: str, page: EventsPage, first: bool) -> InlineKeyboardMarkup:
+    """Кнопки листания, фильтров и перехода к пользователю для ленты событий"""
+    nav: List[InlineKeyboardButton] = []
+    if not first:
+        nav.append(InlineKeyboardButton(text="⏮ Сначала", callback_data=f"stats_events:{filter_key}"))
+    if page.next_cursor:
+        nav.append(InlineKeyboardButton(text="Старее ▶️", callback_data=f"stats_events:{filter_key}:{page.next_cursor}"))
+    filters = [
+        InlineKeyboardButton(text=f"• {label}" if key == filter_key else label, callback_data=f"stats_events:{key}")
+        for key, (label, _, _) in EVENT_FILTERS.items()
+    ]
+    users = [
+        InlineKeyboardButton(text=f"👤 {name[:16]}", callback_data=f"stats_user:{uid}") for uid, name in page.users
+    ]
+    rows = [nav] if nav else []
+    rows.extend(filters[i:i + 3] for i in range(0, len(filters), 3))
+    rows.extend(users[i:i + 4] for i in range(0, len(users), 4))
+    return InlineKeyboardMarkup(rows)
+
+async def run_profile(context: ContextTypes.DEFAULT_TYPE, chat_id: int, seconds: int) -> None:
+    """Записывает профиль и отправляет админу сводку и файл стеков для flamegraph"""
+    try:
+        profile = await profiler.capture(seconds, (start, on_button, send_timed_message), (stats,))
+    except RuntimeError:
+        await context.bot.send_message(chat_id=chat_id, text="Профилирование уже идёт")
+        return
+    await context.bot.send_message(chat_id=chat_id, text=summary_text(profile)[:4000])
+    if profile.stacks:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        await context.bot.send_document(
+            chat_id=chat_id,
+            document=collapsed_stacks(profile).encode(),
+            filename=f"woolzy-profile-{stamp}.folded",
+            caption="Стеки для flamegraph.pl или speedscope.app",
+        )
+
 async def send_admin_overview(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> None:
     """Отправляет админу обзор статистики и кнопки управления"""
     text = (
         "👋 Привет, администратор!\n\n"
-        "📊 Здесь ты можешь посмотреть статистику бота и протестировать последовательность сообщений.\n\n"
+        "📊 Здесь ты можешь посмотреть статистику бота и протестировать последовательность сообщений.\n"
+        "✏️ Тексты и шаги кампании — в campaign.json, /reload применит правки сразу.\n\n"
         "Выбери действие:"
     )
     
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton(text="📊 Статистика", callback_data="btn_stats")],
+        [
+            InlineKeyboardButton(text="📊 Статистика", callback_data="btn_stats"),
+            InlineKeyboardButton(text="🔬 Профилирование", callback_data="btn_profile"),
+        ],
         [InlineKeyboardButton(text="🎬 Тест последовательности", callback_data="btn_test_sequence")],
+        [InlineKeyboardButton(text="📣 Рассылка", callback_data="btn_broadcast")],
     ])
     
     await context.bot.send_message(
@@ -363,26 +597,102 @@ async def send_admin_overview(context: ContextTypes.DEFAULT_TYPE, chat_id: int,
         parse_mode=ParseMode.HTML
     )
 
+async def outbox_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Периодическая отправка созревших сообщений из очереди"""
+    await drain_outbox(context, send_timed_message)
+
+async def legacy_events_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Фоновый перенос событий из старого формата пачками"""
+    if await asyncio.to_thread(migrate_legacy_events, 5000):
+        context.job.schedule_removal()
+
+async def retention_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Сворачивание и архивирование событий старше срока хранения"""
+    await asyncio.to_thread(compact_events)
+
+async def content_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Перезагрузка контента кампании, если файл изменился"""
+    if not content.changed():
+        return
+    try:
+        content.reload()
+    except ContentError as e:
+        logging.warning("Campaign content rejected, keeping %s: %s", content.current.version, e)
+    except OSError:
+        logging.exception("Failed to read campaign content")
+
+def _db_scalar(sql: str, *params: object) -> float:
+    with db_connect() as conn:
+        return conn.execute(sql, params).fetchone()[0] or 0
+
+def register_metrics(app: Application) -> None:
+    """Размеры очередей и счётчики, которые вычисляются при сборе метрик"""
+    gauge("woolzy_outbox_pending", "Scheduled messages waiting in the outbox",
+          lambda: _db_scalar("SELECT COUNT(*) FROM scheduled_messages"))
+    gauge("woolzy_outbox_due", "Scheduled messages that are already due",
+          lambda: _db_scalar("SELECT COUNT(*) FROM scheduled_messages WHERE due_at <= ?", int(time.time())))
+    gauge("woolzy_event_queue_depth", "Records waiting for the event writer", event_writer.pending)
+    gauge("woolzy_update_queue_depth", "Updates waiting to be processed", app.update_queue.qsize)
+    gauge("woolzy_jobs", "Jobs in the job queue", lambda: len(app.job_queue.jobs()))
+    gauge("woolzy_send_queue_depth", "Bot API calls waiting for the global rate limit", app.bot.rate_limiter.queued)
+    gauge("woolzy_profile_cache_size", "User profiles in the profile cache", lambda: len(profile_cache))
+    gauge("woolzy_update_users_active", "Users with updates in processing", app.update_processor.active_keys)
+    counter_fn("woolzy_updates_dropped_total", "Updates dropped because a user queue was full",
+               lambda: app.update_processor.dropped)
+    counter_fn("woolzy_events_enqueued_total", "Records queued for the event writer", lambda: event_writer.enqueued)
+    counter_fn("woolzy_events_written_total", "Records written by the event writer", lambda: event_writer.written)
+    counter_fn("woolzy_db_pool_waits_total", "Waits for a free DB connection", lambda: pool.waits)
+    counter_fn("woolzy_db_write_lock_wait_seconds_total", "Time the event writer waited for the write lock",
+               lambda: event_writer.lock_wait_seconds)
+
 # ---------------- ЗАПУСК ----------------
 async def on_startup(app: Application) -> None:
     """Действия при запуске приложения"""
     db_init()
     logging.info("Database initialized at %s", DB_PATH)
+    event_writer.start()
+    await storage.open()
+    # Один тикер на всю очередь; просроченные после перезапуска сообщения он подберёт сам
+    app.job_queue.run_repeating(outbox_tick, interval=OUTBOX_TICK_SECONDS, first=1, name="outbox_drain")
+    app.job_queue.run_repeating(legacy_events_tick, interval=1, first=1, name="legacy_events_migration")
+    if RETENTION_DAYS:
+        app.job_queue.run_repeating(retention_tick, interval=RETENTION_INTERVAL, first=60, name="events_retention")
+    if CAMPAIGN_RELOAD_INTERVAL:
+        app.job_queue.run_repeating(content_tick, interval=CAMPAIGN_RELOAD_INTERVAL, name="campaign_reload")
+    resume_broadcasts(app)
+    if METRICS_PORT:
+        register_metrics(app)
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+async def on_shutdown(app: Application) -> None:
+    """Действия при остановке приложения"""
+    await storage.close()
+    event_writer.stop()
+    pool.close()
 
 def build_app() -> Application:
     """Создание и настройка приложения"""
-    rate_limiter = AIORateLimiter()
+    rate_limiter = PriorityRateLimiter(
+        SEND_RATE, SEND_BURST, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_GROUP_PER_MINUTE, SEND_BULK_RESERVE, SEND_DRIP_JITTER,
+    )
     app = (
         ApplicationBuilder()
         .token(BOT_TOKEN)
+        .base_url(BOT_API_BASE_URL)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedRequest(connection_pool_size=1))
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
         .rate_limiter(rate_limiter)
-        .concurrent_updates(True)
+        .concurrent_updates(PerUserUpdateProcessor(UPDATE_MAX_IN_FLIGHT, UPDATE_CONCURRENCY, UPDATE_MAX_PER_USER))
         .build()
     )
 
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("reload", reload_content))
     app.add_handler(CallbackQueryHandler(on_button))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_admin_text))
     app.post_init = on_startup
+    app.post_shutdown = on_shutdown
     return app
 
 def main() -> None:
@@ -401,9 +711,20 @@ def main() -> None:
     
     # Keep our own logs at INFO level
     logging.getLogger("root").setLevel(logging.INFO)
-    
+
     app = build_app()
-    app.run_polling(allowed_updates=["message", "callback_query"])
+    if BOT_MODE == "webhook":
+        # Встроенный HTTP-сервер; TLS обычно терминирует балансировщик перед ботом
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+    else:
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == "__main__":
     main()
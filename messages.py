@@ -1,54 +0,0 @@
-"""
-Тексты сообщений Woolzy Bot
-Здесь настраиваются все тексты сообщений бота
-"""
-
-from config import GROUP_LINK, SHOP_LINK, VIDEO_LINK
-
-# ---------------- ТЕКСТЫ СООБЩЕНИЙ ----------------
-MESSAGES = {
-    "welcome": (
-        "👋 Привет, мама!\n"
-        "Добро пожаловать в Woolzy Bot 💜\n\n"
-        "🎁 Чтобы не тратить твои нервы и деньги зря — держи бесплатный гайд:\n"
-        "<b>\"5 ошибок при грудном вскармливании и как их избежать\"</b> (PDF).\n\n"
-        "📌 В нём то, о чём обычно никто не говорит:\n"
-        "– как справиться с протеканиями,\n"
-        "– почему появляется запах кислого молока,\n"
-        "– как не переплачивать на вкладышах.\n\n"
-        "👇 А теперь самое важное: у нас есть закрытая группа мам, где они каждый день делятся живыми отзывами. Хочешь туда?"
-    ),
-    
-    "remind_group": (
-        "Кстати, все мамы обсуждают свой опыт в закрытой группе — вот ссылка 👇"
-    ),
-    
-    "reviews": (
-        "🌸 Смотри, мамы в группе уже поделились:\n"
-        "– \"раньше меняла вкладыши каждые 3 часа, теперь забываю на сутки\"\n"
-        "– \"в +30 сухо и не жарко\"\n"
-        "– \"за месяц экономия ×7!\"\n\n"
-        f"👉 <a href='{GROUP_LINK}'>отзывы здесь</a>"
-    ),
-    
-    "check_in": (
-        "❓ Ты уже успела посмотреть отзывы?\n\n"
-        "👉 Если <b>да</b> — Попробуй сама 💜 \n"
-        "👉 Если <b>нет</b> — Посмотри отзывы снизу"
-    ),
-    
-    "video": (
-        "🎥 Вчера ты забрала гайд, сегодня держи видео-отчёт тестирования:\n"
-        "5 мам из Алматы → 10 дней → результат один: нет запаха и до 24 часов сухо.\n\n"
-        f"Смотри видео здесь 👇 (ссылка на хайлайт или пост с отзывом)\n\n"
-        f"А все отзывы — <a href='{GROUP_LINK}'>в группе 👇</a>"
-    ),
-    
-    "offer": (
-        "🔥 Мама, у тебя уже есть два варианта:\n"
-        "– дальше покупать одноразовые и потратить <b>100.000 ₸</b> за всё время кормления\n"
-        f"– или попробовать Woolzy за <b>12.000 ₸</b> и забыть о проблемах.\n\n"
-        "У нас действует 30 дней возврата, если не подойдёт.\n\n"
-        f"👇 <a href='{SHOP_LINK}'>Закажи прямо сейчас через Kaspi</a>"
-    ),
-}
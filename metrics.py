@@ -0,0 +1,196 @@
+"""
+Метрики Woolzy Bot в текстовом формате Prometheus
+Гистограммы задержек обработчиков, SQL-запросов и вызовов Bot API,
+счётчики ошибок и размеры очередей; отдаются по HTTP на /metrics
+"""
+
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from telegram.request import HTTPXRequest
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ---------------- ТИПЫ МЕТРИК ----------------
+def _labels_text(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Counter:
+    """Монотонно растущий счётчик с метками"""
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines.extend(f"{self.name}{_labels_text(k)} {v}" for k, v in self._values.items())
+        return lines
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help_text
+        self._buckets = tuple(buckets)
+        self._values: Dict[LabelKey, List[float]] = {}  # счётчики корзин + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0.0] * (len(self._buckets) + 2)
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Замеряет длительность блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, data in self._values.items():
+                for bound, count in zip(self._buckets, data):
+                    lines.append(f"{self.name}_bucket{_labels_text(key, [('le', repr(bound))])} {count}")
+                lines.append(f"{self.name}_bucket{_labels_text(key, [('le', '+Inf')])} {data[-1]}")
+                lines.append(f"{self.name}_sum{_labels_text(key)} {data[-2]}")
+                lines.append(f"{self.name}_count{_labels_text(key)} {data[-1]}")
+        return lines
+
+class CallbackMetric:
+    """Значение, которое вычисляется в момент сбора (gauge или counter)"""
+
+    def __init__(self, name: str, help_text: str, kind: str, fn: Callable[[], float]) -> None:
+        self.name = name
+        self.help = help_text
+        self._kind = kind
+        self._fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            value = self._fn()
+        except Exception as e:
+            logging.warning("Metric %s failed: %s", self.name, e)
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self._kind}", f"{self.name} {value}"]
+
+# ---------------- РЕЕСТР ----------------
+_registry: Dict[str, Any] = {}
+
+def _register(metric: Any) -> Any:
+    _registry[metric.name] = metric
+    return metric
+
+def gauge(name: str, help_text: str, fn: Callable[[], float]) -> None:
+    """Регистрирует gauge, который вычисляется при каждом сборе"""
+    _register(CallbackMetric(name, help_text, "gauge", fn))
+
+def counter_fn(name: str, help_text: str, fn: Callable[[], float]) -> None:
+    """Регистрирует счётчик, значение которого хранится в другом объекте"""
+    _register(CallbackMetric(name, help_text, "counter", fn))
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines: List[str] = []
+    for metric in list(_registry.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+HANDLER_SECONDS: Histogram = _register(Histogram("woolzy_handler_seconds", "Handler latency"))
+HANDLER_ERRORS: Counter = _register(Counter("woolzy_handler_errors_total", "Handler exceptions"))
+SQL_SECONDS: Histogram = _register(Histogram("woolzy_sql_seconds", "SQL statement latency in stats reports"))
+BOT_API_SECONDS: Histogram = _register(Histogram("woolzy_bot_api_seconds", "Bot API call latency"))
+BOT_API_ERRORS: Counter = _register(Counter("woolzy_bot_api_errors_total", "Failed Bot API calls"))
+SEND_WAIT_SECONDS: Histogram = _register(Histogram("woolzy_send_wait_seconds", "Time a Bot API call waited for rate limits"))
+REPORT_CACHE: Counter = _register(Counter("woolzy_report_cache_total", "Admin report cache lookups by result"))
+PROFILE_CACHE: Counter = _register(Counter("woolzy_profile_cache_total", "User profile cache lookups by result"))
+DELIVERIES: Counter = _register(Counter("woolzy_deliveries_total", "Message delivery outcomes by source"))
+
+# ---------------- ИНСТРУМЕНТИРОВАНИЕ ----------------
+def timed(handler: str) -> Callable:
+    """Декоратор для async-обработчиков: задержка и число исключений"""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=handler)
+                raise
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - started, handler=handler)
+        return wrapper
+    return decorator
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который замеряет каждый вызов Bot API по имени метода"""
+
+    async def post(self, url: str, *args: Any, **kwargs: Any) -> Any:
+        method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().post(url, *args, **kwargs)
+        except Exception as e:
+            BOT_API_ERRORS.inc(method=method, error=type(e).__name__)
+            raise
+        finally:
+            BOT_API_SECONDS.observe(time.perf_counter() - started, method=method)
+
+# ---------------- HTTP-СЕРВЕР ----------------
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(host: str, port: int) -> ThreadingHTTPServer:
+    """Запускает HTTP-сервер метрик в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info("Metrics available at http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,167 @@
+"""
+Профилирование Woolzy Bot по запросу админа
+На заданное время по таймеру снимаются стеки всех потоков через
+sys._current_frames() и остаются срезы, в которых выполняется целевая
+функция. Пока профилирование выключено, никаких хуков нет
+"""
+
+import asyncio
+import inspect
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType, ModuleType
+from typing import Callable, Dict, Iterable, List, NamedTuple, Set
+
+from config import PROFILER_INTERVAL
+
+# Длительности на выбор в меню, секунды
+PROFILE_DURATIONS = (10, 30, 60)
+# Сколько строк в каждой таблице сводки
+TOP_FUNCTIONS = 15
+
+class Profile(NamedTuple):
+    seconds: float
+    samples: int              # срезов всего (по одному на тик)
+    stacks: Counter           # стек (имя потока, затем от внешней профилируемой функции к листу) -> число срезов
+
+def _label(code: CodeType) -> str:
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class _Collector:
+    """Копит стеки, в которых есть профилируемый код"""
+
+    def __init__(self, codes: Set[CodeType], files: Set[str]) -> None:
+        self._codes = codes
+        self._files = files
+        self._labels: Dict[CodeType, str] = {}
+        self._main_ident = threading.main_thread().ident
+        self.stacks: Counter = Counter()    # стек (ident потока, затем метки кадров) -> число срезов
+        self.samples = 0
+
+    def take(self, skip: int | None = None, main_frame: FrameType | None = None) -> None:
+        """Один срез всех потоков; skip — поток самого сэмплера, main_frame — прерванный кадр главного потока.
+
+        Вызывается из обработчика SIGALRM, поэтому не берёт блокировок
+        (threading.enumerate() берёт): поток записывается по ident, а имена
+        подставляет named_stacks() после записи.
+        """
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            if ident == self._main_ident and main_frame is not None:
+                frame = main_frame
+            chain: List[CodeType] = []
+            outermost = -1
+            while frame is not None:
+                code = frame.f_code
+                chain.append(code)
+                if code in self._codes or code.co_filename in self._files:
+                    outermost = len(chain) - 1
+                frame = frame.f_back
+            if outermost < 0:
+                continue
+            # Стек от самой внешней профилируемой функции: кадры цикла событий и пула потоков отбрасываются
+            stack: List[object] = [ident]
+            for code in reversed(chain[: outermost + 1]):
+                label = self._labels.get(code)
+                if label is None:
+                    label = self._labels[code] = _label(code)
+                stack.append(label)
+            self.stacks[tuple(stack)] += 1
+        self.samples += 1
+
+    def named_stacks(self) -> Counter:
+        """Стеки с именами потоков вместо ident; потоки, завершившиеся за время записи, остаются номерами"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        named: Counter = Counter()
+        for (ident, *frames), count in self.stacks.items():
+            named[(names.get(ident, str(ident)), *frames)] += count
+        return named
+
+class SamplingProfiler:
+    """Сэмплер стеков: один запуск за раз и только на время записи.
+
+    Срезы снимает таймер SIGALRM: обработчик сигнала выполняется в главном
+    потоке между инструкциями, поэтому короткие обработчики в цикле событий
+    попадают в профиль. Поток-сэмплер видел бы главный поток только в моменты
+    переключения GIL и остаётся запасным вариантом (нет setitimer или цикл
+    событий не в главном потоке).
+    """
+
+    def __init__(self, interval: float) -> None:
+        self._interval = interval
+        self.running = False
+
+    async def capture(
+        self, seconds: float, functions: Iterable[Callable], modules: Iterable[ModuleType] = (),
+    ) -> Profile:
+        """Записывает профиль seconds секунд; учитываются стеки, где есть functions или код из modules"""
+        if self.running:
+            raise RuntimeError("profiling is already running")
+        # Декораторы (timed) сохраняют исходную функцию в __wrapped__
+        collector = _Collector({inspect.unwrap(fn).__code__ for fn in functions}, {module.__file__ for module in modules})
+        self.running = True
+        started = time.monotonic()
+        try:
+            if hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread():
+                previous = signal.signal(signal.SIGALRM, lambda signum, frame: collector.take(main_frame=frame))
+                signal.setitimer(signal.ITIMER_REAL, self._interval, self._interval)
+                try:
+                    await asyncio.sleep(seconds)
+                finally:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+                    signal.signal(signal.SIGALRM, previous)
+            else:
+                await asyncio.to_thread(self._sample_in_thread, collector, seconds)
+        finally:
+            self.running = False
+        return Profile(time.monotonic() - started, collector.samples, collector.named_stacks())
+
+    def _sample_in_thread(self, collector: _Collector, seconds: float) -> None:
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            collector.take(skip=own)
+            time.sleep(self._interval)
+
+profiler = SamplingProfiler(PROFILER_INTERVAL)
+
+# ---------------- ОТЧЁТ ----------------
+def collapsed_stacks(profile: Profile) -> str:
+    """Стеки в формате flamegraph.pl / speedscope: «поток;корень;...;лист число»"""
+    return "".join(
+        f"{';'.join(frame.replace(';', ':') for frame in stack)} {count}\n"
+        for stack, count in sorted(profile.stacks.items())
+    )
+
+def summary_text(profile: Profile) -> str:
+    """Самые горячие функции: собственное время (лист стека) и включительное"""
+    hits = sum(profile.stacks.values())
+    own: Counter = Counter()
+    total: Counter = Counter()
+    for stack, count in profile.stacks.items():
+        own[stack[-1]] += count
+        for frame in set(stack[1:]):
+            total[frame] += count
+
+    def table(counter: Counter) -> List[str]:
+        return [f"{count / hits * 100:5.1f}%  {frame}" for frame, count in counter.most_common(TOP_FUNCTIONS)]
+
+    lines = [
+        f"🔬 Профиль за {profile.seconds:.0f} с: срезов {profile.samples}, "
+        f"в профилируемых функциях {hits}",
+    ]
+    if not hits:
+        lines.append("За это время профилируемые функции не выполнялись.")
+        return "\n".join(lines)
+    lines.append("")
+    lines.append("Собственное время:")
+    lines.extend(table(own))
+    lines.append("")
+    lines.append("Включая вызванные:")
+    lines.extend(table(total))
+    return "\n".join(lines)
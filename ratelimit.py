@@ -0,0 +1,215 @@
+"""
+Очередь исходящих вызовов Bot API Woolzy Bot
+Общий и початовый лимиты — token bucket; при нехватке токенов вызовы ждут
+в очереди с приоритетами, поэтому ответы на нажатия не стоят за цепочкой
+и рассылкой
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Tuple
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import is_admin
+from metrics import SEND_WAIT_SECONDS
+
+# Классы приоритета (меньше — важнее); передаются в rate_limit_args вызова бота.
+# Вызовы без rate_limit_args — ответы пользователю или админу
+PRIORITY_INTERACTIVE = 0
+PRIORITY_ADMIN = 1
+PRIORITY_DRIP = 2
+PRIORITY_BROADCAST = 3
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_ADMIN: "admin",
+    PRIORITY_DRIP: "drip",
+    PRIORITY_BROADCAST: "broadcast",
+}
+
+# Очередь упорядочена по времени постановки плюс фора класса (секунды):
+# менее важный вызов пропускает более важные, но не бесконечно
+_PRIORITY_HANDICAP = {
+    PRIORITY_INTERACTIVE: 0.0,
+    PRIORITY_ADMIN: 0.5,
+    PRIORITY_DRIP: 5.0,
+    PRIORITY_BROADCAST: 10.0,
+}
+
+# Сколько початовых лимитов держать, прежде чем выбросить простаивающие
+_MAX_CHAT_BUCKETS = 10000
+
+class _Bucket:
+    """Token bucket: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, need: float) -> float:
+        """Через сколько секунд в корзине будет need токенов"""
+        self.refill(time.monotonic())
+        return max(0.0, (need - self.tokens) / self.rate)
+
+    def reserve(self) -> float:
+        """Занимает токен в долг: возвращает, сколько ждать, пока он станет доступен"""
+        self.refill(time.monotonic())
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    """Ограничитель вызовов Bot API с классами приоритета.
+
+    Сначала вызов ждёт лимита своего чата (это не задерживает другие чаты),
+    затем токен общего лимита. Ожидающие общего лимита выстраиваются по
+    приоритету (с форой по времени, чтобы не голодали); цепочка и рассылка берут токен, только если в корзине
+    остаётся bulk_reserve токенов для ответов на нажатия. Сообщения цепочки
+    дополнительно сдвигаются на случайные 0..drip_jitter секунд.
+    RetryAfter пробрасывается вызывающему; на это время чат и фоновые
+    классы приостанавливаются.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        chat_rate: float,
+        chat_burst: int,
+        group_per_minute: int,
+        bulk_reserve: int,
+        drip_jitter: float,
+    ) -> None:
+        self._global = _Bucket(rate, burst)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._group_rate = group_per_minute / 60
+        self._group_burst = group_per_minute
+        self._bulk_reserve = min(bulk_reserve, burst - 1)
+        self._drip_jitter = drip_jitter
+        self._chats: Dict[int | str, _Bucket] = {}
+        self._waiters: List[Tuple[float, int, asyncio.Future, int]] = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+        self._dispatcher: asyncio.Task | None = None
+        self._paused_until = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def queued(self) -> int:
+        """Сколько вызовов сейчас ждут общего лимита"""
+        return len(self._waiters)
+
+    # ---------------- ЛИМИТ ЧАТА ----------------
+    def _chat_bucket(self, chat_id: int | str) -> _Bucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_CHAT_BUCKETS:
+                # Полные корзины ничем не отличаются от новых — их можно выбросить
+                now = time.monotonic()
+                for key, old in list(self._chats.items()):
+                    old.refill(now)
+                    if old.tokens >= old.capacity:
+                        del self._chats[key]
+            # Отрицательный id или @username — группа или канал
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = _Bucket(self._group_rate, self._group_burst)
+            else:
+                bucket = _Bucket(self._chat_rate, self._chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    # ---------------- ОБЩИЙ ЛИМИТ ----------------
+    def _reserve_for(self, priority: int) -> int:
+        return 0 if priority <= PRIORITY_ADMIN else self._bulk_reserve
+
+    async def _acquire(self, priority: int) -> None:
+        reserve = self._reserve_for(priority)
+        if (
+            not self._waiters
+            and self._global.delay(1 + reserve) == 0
+            and (priority <= PRIORITY_ADMIN or time.monotonic() >= self._paused_until)
+        ):
+            self._global.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        deadline = time.monotonic() + _PRIORITY_HANDICAP[priority]
+        heapq.heappush(self._waiters, (deadline, next(self._seq), future, priority))
+        self._changed.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        # Один диспетчер выдаёт токены ожидающим по порядку очереди
+        while self._waiters:
+            self._changed.clear()
+            _, _, future, priority = self._waiters[0]
+            if future.done():
+                # Ожидавший вызов отменён
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._global.delay(1 + self._reserve_for(priority))
+            if priority > PRIORITY_ADMIN:
+                wait = max(wait, self._paused_until - time.monotonic())
+            if wait > 0:
+                # Ждём токен или появления более важного вызова
+                try:
+                    await asyncio.wait_for(self._changed.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._waiters)
+            self._global.tokens -= 1
+            future.set_result(None)
+
+    # ---------------- ВЫЗОВ ----------------
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> Any:
+        started = time.perf_counter()
+        chat_id = data.get("chat_id")
+        priority = rate_limit_args
+        if priority is None:
+            priority = PRIORITY_ADMIN if is_admin(None, chat_id) else PRIORITY_INTERACTIVE
+        if priority == PRIORITY_DRIP and self._drip_jitter > 0:
+            await asyncio.sleep(random.uniform(0, self._drip_jitter))
+        if chat_id is not None:
+            delay = self._chat_bucket(chat_id).reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await self._acquire(priority)
+        SEND_WAIT_SECONDS.observe(time.perf_counter() - started, priority=PRIORITY_NAMES[priority])
+        try:
+            return await callback(*args, **kwargs)
+        except RetryAfter as e:
+            logging.info("Rate limit hit on %s (%s): retry after %s s", endpoint, PRIORITY_NAMES[priority], e.retry_after)
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            if chat_id is not None:
+                bucket = self._chat_bucket(chat_id)
+                bucket.tokens = min(bucket.tokens, -e.retry_after * bucket.rate)
+            raise
@@ -0,0 +1,88 @@
+"""
+Кэш отчётов админа Woolzy Bot
+Отчёт считается в отдельном потоке один раз на ключ; одинаковые запросы,
+пришедшие во время расчёта, ждут тот же результат. Готовый отчёт устаревает
+по времени, но только если с момента расчёта в БД что-то записали
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from config import REPORT_CACHE_IDLE_TTL, REPORT_CACHE_TTL
+from events import event_writer
+from metrics import REPORT_CACHE
+
+# Сколько отчётов держать (страницы списка пользователей дают много ключей)
+_MAX_ENTRIES = 256
+
+class ReportCache:
+    """Кэш отчётов: ключ — (отчёт, параметры...).
+
+    Отчёт пересчитывается, если он старше ttl и с момента расчёта счётчик
+    записей generation() изменился, либо если он старше idle_ttl (отчёты
+    за скользящие периоды меняются и без новых записей).
+    """
+
+    def __init__(self, ttl: float, idle_ttl: float, generation: Callable[[], int]) -> None:
+        self._ttl = ttl
+        self._idle_ttl = idle_ttl
+        self._generation = generation
+        self._entries: Dict[Hashable, Tuple[Any, float, int]] = {}
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self._clears = 0
+
+    def _fresh(self, computed_at: float, generation: int) -> bool:
+        age = time.monotonic() - computed_at
+        if age < self._ttl:
+            return True
+        return age < self._idle_ttl and generation == self._generation()
+
+    async def get(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """Отчёт из кэша или результат fn(*args); синхронная fn считается в отдельном потоке"""
+        entry = self._entries.get(key)
+        if entry is not None and self._fresh(entry[1], entry[2]):
+            REPORT_CACHE.inc(result="hit")
+            return entry[0]
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            REPORT_CACHE.inc(result="coalesced")
+            # shield: отмена одного ожидающего не отменяет расчёт для остальных
+            return await asyncio.shield(inflight)
+
+        REPORT_CACHE.inc(result="miss")
+        # Счётчик берём до расчёта: записи во время расчёта сделают отчёт устаревшим
+        generation = self._generation()
+        clears = self._clears
+        if asyncio.iscoroutinefunction(fn):
+            task = asyncio.ensure_future(fn(*args))
+        else:
+            task = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+        self._inflight[key] = task
+        try:
+            value = await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._inflight.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        if clears == self._clears:
+            self._store(key, value, generation)
+        return value
+
+    def _store(self, key: Hashable, value: Any, generation: int) -> None:
+        if key not in self._entries and len(self._entries) >= _MAX_ENTRIES:
+            # Сначала выбрасываем устаревшие, затем самые старые
+            for old in [k for k, (_, at, gen) in self._entries.items() if not self._fresh(at, gen)]:
+                del self._entries[old]
+            while len(self._entries) >= _MAX_ENTRIES:
+                del self._entries[next(iter(self._entries))]
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.monotonic(), generation)
+
+    def clear(self) -> None:
+        """Сбрасывает все отчёты (например, после обнуления статистики)"""
+        self._entries.clear()
+        self._clears += 1
+
+report_cache = ReportCache(REPORT_CACHE_TTL, REPORT_CACHE_IDLE_TTL, lambda: event_writer.written)
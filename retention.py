@@ -0,0 +1,141 @@
+"""
+Хранение событий Woolzy Bot
+События старше RETENTION_DAYS сворачиваются в дневные агрегаты (events_daily),
+выгружаются в сжатые архивы и удаляются небольшими пачками; записи об исходах
+отправки (deliveries) старше того же срока просто удаляются
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+from config import ARCHIVE_DIR, RETENTION_BATCH_SIZE, RETENTION_DAYS
+from db import db_connect
+
+DAY_SECONDS = 86400
+
+# Пауза между пачками, чтобы поток записи событий успевал брать блокировку
+_BATCH_PAUSE_SECONDS = 0.05
+# Сколько страниц освобождать за один шаг incremental_vacuum
+_VACUUM_STEP_PAGES = 1000
+
+# ---------------- АРХИВ ----------------
+def archive_path(day: int) -> str:
+    """Файл архива за день: events-YYYY-MM-DD.jsonl.gz"""
+    name = datetime.fromtimestamp(day, timezone.utc).strftime("events-%Y-%m-%d.jsonl.gz")
+    return os.path.join(ARCHIVE_DIR, name)
+
+def _append_archive(day: int, rows: List[Tuple[int, int, str, str, int]]) -> None:
+    # Режим "ab" дописывает новый gzip-member: файл остаётся корректным архивом,
+    # а каждая пачка сохраняется на диск до удаления строк из БД
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(archive_path(day), "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            for event_id, user_id, etype, payload, created_at in rows:
+                record = {"id": event_id, "user_id": user_id, "type": etype, "payload": payload, "created_at": created_at}
+                f.write((json.dumps(record, ensure_ascii=False) + "\n").encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+
+# ---------------- СВОРАЧИВАНИЕ ----------------
+def _oldest_day(cutoff: int) -> int | None:
+    with db_connect() as conn:
+        row = conn.execute("SELECT MIN(created_at) FROM events WHERE created_at < ?", (cutoff,)).fetchone()
+    if row[0] is None:
+        return None
+    return row[0] - row[0] % DAY_SECONDS
+
+def _fold_day(day: int) -> None:
+    # Агрегат считается один раз по полному дню до первого удаления;
+    # при повторном запуске после сбоя уже записанный агрегат не трогаем
+    with db_connect() as conn:
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO events_daily (day, kind, events, users)
+            SELECT ?, kind, COUNT(*), COUNT(DISTINCT user_id)
+            FROM events WHERE created_at >= ? AND created_at < ?
+            GROUP BY kind
+            """,
+            (day, day, day + DAY_SECONDS),
+        )
+
+def _archive_and_delete_day(day: int) -> int:
+    removed = 0
+    while True:
+        with db_connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT e.id, e.user_id, k.type, k.payload, e.created_at
+                FROM events e JOIN event_kinds k ON k.id = e.kind
+                WHERE e.created_at >= ? AND e.created_at < ?
+                ORDER BY e.created_at, e.id
+                LIMIT ?
+                """,
+                (day, day + DAY_SECONDS, RETENTION_BATCH_SIZE),
+            ).fetchall()
+        if not rows:
+            return removed
+        _append_archive(day, rows)
+        with db_connect() as conn:
+            conn.executemany("DELETE FROM events WHERE id = ?", [(row[0],) for row in rows])
+        removed += len(rows)
+        time.sleep(_BATCH_PAUSE_SECONDS)
+
+def _prune_deliveries(cutoff: int) -> int:
+    removed = 0
+    while True:
+        with db_connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM deliveries WHERE id IN (SELECT id FROM deliveries WHERE created_at < ? LIMIT ?)",
+                (cutoff, RETENTION_BATCH_SIZE),
+            ).rowcount
+        removed += deleted
+        if deleted < RETENTION_BATCH_SIZE:
+            return removed
+        time.sleep(_BATCH_PAUSE_SECONDS)
+
+def _incremental_vacuum() -> None:
+    with db_connect() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return
+    while True:
+        with db_connect() as conn:
+            if not conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                return
+            # Прагма освобождает по странице за шаг выполнения, а execute делает только один шаг;
+            # executescript выполняет её до конца
+            conn.executescript(f"PRAGMA incremental_vacuum({_VACUUM_STEP_PAGES});")
+        time.sleep(_BATCH_PAUSE_SECONDS)
+
+def compact_events() -> int:
+    """Сворачивает, архивирует и удаляет события старше окна хранения.
+
+    Обрабатывает полные дни (UTC) по одному, от старых к новым; возвращает
+    число удалённых событий. Счётчики event_rollups не трогаются, поэтому
+    отчёты «за всё время» остаются прежними. Старые записи deliveries
+    удаляются без архива.
+    """
+    if RETENTION_DAYS <= 0:
+        return 0
+    now = int(time.time())
+    cutoff = (now - RETENTION_DAYS * DAY_SECONDS) // DAY_SECONDS * DAY_SECONDS
+    pruned = _prune_deliveries(cutoff)
+    if pruned:
+        logging.info("Retention: removed %s delivery records older than %s days", pruned, RETENTION_DAYS)
+    removed = 0
+    with db_connect() as conn:
+        # Пока идёт перенос старых событий, дни ещё дополняются — сворачивать рано
+        legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events_legacy'").fetchone()
+    if not legacy:
+        while (day := _oldest_day(cutoff)) is not None:
+            _fold_day(day)
+            removed += _archive_and_delete_day(day)
+        if removed:
+            logging.info("Retention: archived and removed %s events older than %s days", removed, RETENTION_DAYS)
+    if removed or pruned:
+        _incremental_vacuum()
+    return removed
@@ -0,0 +1,123 @@
+"""
+Очередь отложенных сообщений Woolzy Bot
+Сообщения хранятся в таблице scheduled_messages и отправляются одним тикером,
+поэтому переживают перезапуск процесса
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, List, Tuple
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from telegram.ext import CallbackContext
+
+from campaign import EVENT_BITS, FLAGS_SET_SQL
+from config import OUTBOX_BATCH_SIZE, OUTBOX_CATCHUP, OUTBOX_MAX_LATENESS
+from content import content
+from db import db_connect
+from delivery import is_permanent_failure
+from events import record_write
+
+Sender = Callable[..., Awaitable[None]]
+
+# ---------------- ПОСТАНОВКА В ОЧЕРЕДЬ ----------------
+async def schedule_messages(chat_id: int, user_id: int, items: Iterable[Tuple[int, str]]) -> None:
+    """Ставит сообщения в очередь: items — пары (задержка в секундах, ключ).
+
+    Пара (user_id, key) уникальна: повторный /start не дублирует уже ожидающие сообщения.
+    """
+    now = int(time.time())
+    await record_write(
+        "INSERT OR IGNORE INTO scheduled_messages (user_id, key, chat_id, due_at) VALUES (?, ?, ?, ?)",
+        *[(user_id, key, chat_id, now + delay) for delay, key in items],
+    )
+
+async def campaign_event(chat_id: int, user_id: int, event: str) -> None:
+    """Переход кампании по событию: запоминает флаг, снимает ненужные шаги и ставит новые"""
+    plan = content.current.plan
+    bit = EVENT_BITS.get(event)
+    if bit is not None:
+        await record_write(FLAGS_SET_SQL, (user_id, bit))
+        cancelled = plan.keys_cancelled_by(event)
+        if cancelled:
+            await record_write(
+                "DELETE FROM scheduled_messages WHERE user_id = ? AND key = ?",
+                *[(user_id, key) for key in cancelled],
+            )
+    steps = plan.steps_for(event)
+    if steps:
+        await schedule_messages(chat_id, user_id, steps)
+
+# ---------------- ОТПРАВКА ----------------
+def _fetch_due(now: int) -> List[Tuple[int, str, int, int, int, int]]:
+    with db_connect() as conn:
+        return conn.execute(
+            "SELECT m.user_id, m.key, m.chat_id, m.due_at, IFNULL(c.flags, 0), IFNULL(u.unreachable, 0) "
+            "FROM scheduled_messages m "
+            "LEFT JOIN campaign_state c ON c.user_id = m.user_id "
+            "LEFT JOIN users u ON u.user_id = m.user_id "
+            "WHERE m.due_at <= ? ORDER BY m.due_at LIMIT ?",
+            (now, OUTBOX_BATCH_SIZE),
+        ).fetchall()
+
+def _delete(rows: List[Tuple[int, str, int]]) -> None:
+    # due_at в условии: строку, которую /start поставил заново во время отправки, не трогаем
+    with db_connect() as conn:
+        conn.executemany("DELETE FROM scheduled_messages WHERE user_id = ? AND key = ? AND due_at = ?", rows)
+
+async def drain_outbox(context: CallbackContext, send: Sender) -> None:
+    """Отправляет одну пачку созревших сообщений.
+
+    Шаги, отменённые флагами пользователя в campaign_state, и сообщения
+    недоступным пользователям (users.unreachable) не отправляются.
+    Просроченные дольше OUTBOX_MAX_LATENESS сообщения (например, после простоя)
+    обрабатываются согласно OUTBOX_CATCHUP: "send" — отправить, "drop" — выбросить.
+    """
+    now = int(time.time())
+    # Запросы к БД — в отдельном потоке: ожидание блокировки записи не должно останавливать цикл событий
+    rows = await asyncio.to_thread(_fetch_due, now)
+    if not rows:
+        return
+
+    plan = content.current.plan
+    batch: List[Tuple[int, str, int, int]] = []
+    done: List[Tuple[int, str, int]] = []
+    for user_id, key, chat_id, due_at, flags, unreachable in rows:
+        if unreachable:
+            # Пользователь заблокировал бота: сообщение поставлено до того, как это стало известно
+            logging.info("Skipping %s for user %s: user is unreachable", key, user_id)
+            done.append((user_id, key, due_at))
+            continue
+        if plan.is_cancelled(key, flags):
+            # Шаг отменён событием, которое произошло уже после постановки в очередь
+            logging.info("Skipping %s for user %s: cancelled by campaign state", key, user_id)
+            done.append((user_id, key, due_at))
+            continue
+        if OUTBOX_CATCHUP == "drop" and now - due_at > OUTBOX_MAX_LATENESS:
+            logging.info("Dropping overdue message %s for user %s (%ss late)", key, user_id, now - due_at)
+            done.append((user_id, key, due_at))
+            continue
+        batch.append((user_id, key, chat_id, due_at))
+
+    results = await asyncio.gather(
+        *(send(context, data={"chat_id": chat_id, "user_id": user_id, "key": key}) for user_id, key, chat_id, _ in batch),
+        return_exceptions=True,
+    )
+    for (user_id, key, _, due_at), result in zip(batch, results):
+        if isinstance(result, RetryAfter):
+            # Оставляем в очереди: отправим на следующих тиках
+            continue
+        if isinstance(result, (Forbidden, BadRequest)) and is_permanent_failure(result):
+            # Исход уже записан в deliveries, недоступный пользователь помечен
+            logging.info("Could not deliver %s to user %s: %s", key, user_id, result)
+        elif isinstance(result, BadRequest):
+            # Ошибка в самом сообщении (например, разметка текста в campaign.json): пользователь тут ни при чём
+            logging.error("Telegram rejected %s for user %s: %s", key, user_id, result)
+        elif isinstance(result, Exception):
+            logging.warning("Failed to send %s to user %s: %s", key, user_id, result)
+        done.append((user_id, key, due_at))
+
+    if done:
+        # Синхронно с тиком, а не через поток записи: следующий тик не должен снова выбрать эти строки
+        await asyncio.to_thread(_delete, done)
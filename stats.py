@@ -4,9 +4,12 @@
 """
 
 import sqlite3
-from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List
-from config import DB_PATH
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+from db import db_connect
+from metrics import SQL_SECONDS
 
 # ---------------- ПЕРИОДЫ СТАТИСТИКИ ----------------
 STATS_PERIODS: Dict[str, int | None] = {
@@ -14,173 +17,408 @@ STATS_PERIODS: Dict[str, int | None] = {
     "7d": 7 * 86400,
     "all": None,
 }
+PERIOD_TITLES: Dict[str, str] = {
+    "24h": "за 24 часа",
+    "7d": "за 7 дней",
+    "all": "за весь период",
+}
 
 # ---------------- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ----------------
-def utcnow_iso() -> str:
-    """Возвращает текущее время в UTC в формате ISO"""
-    return datetime.now(timezone.utc).isoformat()
-
-def db_connect() -> sqlite3.Connection:
-    """Создает соединение с базой данных"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA synchronous=NORMAL;")
-    return conn
-
-def period_cutoff_iso(period_key: str) -> str | None:
-    """Возвращает время отсечения для периода в формате ISO"""
+def utcnow_ts() -> int:
+    """Возвращает текущее время в UTC как unix time (секунды)"""
+    return int(time.time())
+
+def period_cutoff_ts(period_key: str) -> int | None:
+    """Возвращает время отсечения для периода (unix time)"""
     seconds = STATS_PERIODS.get(period_key)
     if seconds is None:
         return None
-    cutoff = datetime.now(timezone.utc) - timedelta(seconds=seconds)
-    return cutoff.isoformat()
+    return utcnow_ts() - seconds
 
-# ---------------- ФУНКЦИИ СТАТИСТИКИ ----------------
-def build_stats_text(period_key: str, detailed: bool) -> str:
-    """Строит текст статистики для указанного периода"""
-    cutoff_iso = period_cutoff_iso(period_key)
-    where_clause = ""
-    params: List[Any] = []
-    if cutoff_iso is not None:
-        where_clause = " AND created_at >= ?"
-        params.append(cutoff_iso)
+def format_time_short(ts: int | None) -> str:
+    """Короткая запись времени (UTC) для отчётов"""
+    if not ts:
+        return "—"
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%m-%d %H:%M")
 
-    with db_connect() as conn:
-        cur = conn.cursor()
-        cur.execute(f"SELECT COUNT(*) FROM events WHERE type='start'" + where_clause, params)
-        total_starts = cur.fetchone()[0] or 0
+def format_user(uid: int, first_name: str, last_name: str, username: str, lang: str, is_premium: int, is_bot: int) -> str:
+    """Имя пользователя для отчётов: «Имя Фамилия (@username) • ru/premium/bot»"""
+    display = first_name
+    if last_name:
+        display = f"{display} {last_name}" if display else last_name
+    if username:
+        at = f"@{username}"
+        display = f"{display} ({at})" if display else at
+    if not display:
+        display = str(uid)
+    info_bits = []
+    if lang:
+        info_bits.append(lang)
+    if is_premium:
+        info_bits.append("premium")
+    if is_bot:
+        info_bits.append("bot")
+    extra = f" • {'/'.join(info_bits)}" if info_bits else ""
+    return f"{display}{extra}"
 
-        cur.execute(
-            f"SELECT COUNT(*) FROM events WHERE type='button_click' AND payload='btn_group'" + where_clause,
-            params,
+def action_name(ev_type: str, payload: str) -> str:
+    """Название события для списка последних событий"""
+    if ev_type == "start":
+        return "Старт"
+    if ev_type == "button_click":
+        mapping = {
+            "btn_group": "Кнопка: Перейти в группу",
+            "btn_kaspi": "Кнопка: Оформить в Kaspi",
+            "btn_guide": "Кнопка: Сначала посмотрю гайд",
+        }
+        return mapping.get(payload, f"Кнопка: {payload}")
+    if ev_type == "message_sent":
+        return f"Отправлено: {payload}"
+    return ev_type
+
+# ---------------- СПРАВОЧНИК ТИПОВ СОБЫТИЙ ----------------
+# Пара (type, payload) хранится в events одним небольшим целым кодом из event_kinds
+_kind_ids: Dict[Tuple[str, str], int] = {}
+
+def event_kind_id(conn: sqlite3.Connection, etype: str, payload: str | None) -> int:
+    """Код пары (type, payload); новые пары добавляются в справочник"""
+    key = (etype, payload or "")
+    kind = _kind_ids.get(key)
+    if kind is None:
+        conn.execute("INSERT OR IGNORE INTO event_kinds (type, payload) VALUES (?, ?)", key)
+        kind = conn.execute("SELECT id FROM event_kinds WHERE type = ? AND payload = ?", key).fetchone()[0]
+        _kind_ids[key] = kind
+    return kind
+
+def forget_event_kinds() -> None:
+    """Сбрасывает кэш кодов (например, если транзакция с новыми кодами откатилась)"""
+    _kind_ids.clear()
+
+def _kind_filter(etype: str, payload: str | None) -> Tuple[str, List[Any]]:
+    """Условие на колонку kind по типу и (необязательно) payload"""
+    if payload is None:
+        return "kind IN (SELECT id FROM event_kinds WHERE type = ?)", [etype]
+    return "kind IN (SELECT id FROM event_kinds WHERE type = ? AND payload = ?)", [etype, payload]
+
+# ---------------- ПОЧАСОВЫЕ АГРЕГАТЫ ----------------
+# Таблица event_rollups хранит число событий по (час, kind) и обновляется
+# в той же транзакции, что и вставка событий, поэтому всегда совпадает с events
+ROLLUP_BUCKET_SECONDS = 3600
+
+ROLLUP_UPSERT_SQL = (
+    "INSERT INTO event_rollups (bucket, kind, cnt) VALUES (?, ?, ?) "
+    "ON CONFLICT(bucket, kind) DO UPDATE SET cnt = cnt + excluded.cnt"
+)
+
+def rollup_rows(events: Iterable[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    """Сворачивает события (user_id, kind, created_at) в строки для ROLLUP_UPSERT_SQL"""
+    counts = Counter((created_at - created_at % ROLLUP_BUCKET_SECONDS, kind) for _, kind, created_at in events)
+    return [(bucket, kind, cnt) for (bucket, kind), cnt in counts.items()]
+
+# ---------------- СТАРЫЙ ФОРМАТ СОБЫТИЙ ----------------
+# Пока events_legacy переносится в фоне, часть сырых событий лежит в ней (время — ISO-строка).
+# Счётчики event_rollups уже учитывают их, а края интервалов и список последних событий
+# дочитывают events_legacy в том же запросе, что и events, — одним снимком БД
+_LEGACY_TIME = "CAST(strftime('%s', l.created_at) AS INTEGER)"
+
+def legacy_pending(cur: sqlite3.Cursor) -> bool:
+    """Перенос events_legacy ещё не закончен"""
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events_legacy'")
+    return cur.fetchone() is not None
+
+def _raw_count(cur: sqlite3.Cursor, since: int, until: int, etype: str, payload: str | None, legacy: bool) -> int:
+    kind_clause, kind_params = _kind_filter(etype, payload)
+    sql = f"SELECT COUNT(*) FROM events WHERE created_at >= ? AND created_at < ? AND {kind_clause}"
+    params: List[Any] = [since, until, *kind_params]
+    if legacy:
+        payload_clause = "" if payload is None else " AND IFNULL(l.payload, '') = ?"
+        sql = (
+            f"SELECT ({sql}) + (SELECT COUNT(*) FROM events_legacy l "
+            f"WHERE {_LEGACY_TIME} >= ? AND {_LEGACY_TIME} < ? AND l.type = ?{payload_clause})"
         )
-        group_clicks = cur.fetchone()[0] or 0
+        params += [since, until, etype] + ([] if payload is None else [payload])
+    cur.execute(sql, params)
+    return cur.fetchone()[0] or 0
+
+def count_events(
+    cur: sqlite3.Cursor, cutoff_ts: int | None, etype: str, payload: str | None = None, until_ts: int | None = None,
+) -> int:
+    """Число событий с cutoff_ts <= created_at < until_ts (границы необязательны).
+
+    Полные часы берутся из event_rollups, а неполные часы на краях
+    досчитываются по events через индекс idx_events_created (и по
+    events_legacy, пока она не перенесена).
+    """
+    kind_clause, kind_params = _kind_filter(etype, payload)
+    if cutoff_ts is None and until_ts is None:
+        with SQL_SECONDS.time(query="rollup_sum"):
+            cur.execute(f"SELECT SUM(cnt) FROM event_rollups WHERE {kind_clause}", kind_params)
+            return cur.fetchone()[0] or 0
+
+    since = cutoff_ts or 0
+    legacy = legacy_pending(cur)
+    first_full = -(-since // ROLLUP_BUCKET_SECONDS) * ROLLUP_BUCKET_SECONDS
+    last_full = None if until_ts is None else until_ts - until_ts % ROLLUP_BUCKET_SECONDS
+    if last_full is not None and last_full < first_full:
+        # Весь интервал внутри одного часа
+        with SQL_SECONDS.time(query="partial_hour_count"):
+            return _raw_count(cur, since, until_ts, etype, payload, legacy)
+
+    with SQL_SECONDS.time(query="rollup_sum"):
+        if last_full is None:
+            cur.execute(f"SELECT SUM(cnt) FROM event_rollups WHERE bucket >= ? AND {kind_clause}", [first_full, *kind_params])
+        else:
+            cur.execute(
+                f"SELECT SUM(cnt) FROM event_rollups WHERE bucket >= ? AND bucket < ? AND {kind_clause}",
+                [first_full, last_full, *kind_params],
+            )
+        total = cur.fetchone()[0] or 0
+    with SQL_SECONDS.time(query="partial_hour_count"):
+        if since < first_full:
+            total += _raw_count(cur, since, first_full, etype, payload, legacy)
+        if last_full is not None and last_full < until_ts:
+            total += _raw_count(cur, last_full, until_ts, etype, payload, legacy)
+    return total
+
+# ---------------- ЭПОХИ СТАТИСТИКИ ----------------
+# Обнуление статистики не удаляет события, а открывает новую эпоху: отчёты
+# считают только события текущей эпохи, прошлые эпохи можно посмотреть отдельно
+class Epoch(NamedTuple):
+    id: int
+    started_at: int
+    ended_at: int | None  # None — текущая эпоха
+
+def get_epoch(cur: sqlite3.Cursor, epoch_id: int | None = None) -> Epoch | None:
+    """Эпоха по id или текущая (epoch_id=None)"""
+    if epoch_id is None:
+        cur.execute("SELECT id, started_at, ended_at FROM stat_epochs WHERE ended_at IS NULL ORDER BY id DESC LIMIT 1")
+    else:
+        cur.execute("SELECT id, started_at, ended_at FROM stat_epochs WHERE id = ?", (epoch_id,))
+    row = cur.fetchone()
+    return Epoch(*row) if row else None
+
+def list_past_epochs(limit: int = 10) -> List[Epoch]:
+    """Последние завершённые эпохи, от новых к старым"""
+    with db_connect() as conn:
+        rows = conn.execute(
+            "SELECT id, started_at, ended_at FROM stat_epochs WHERE ended_at IS NOT NULL ORDER BY id DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+    return [Epoch(*row) for row in rows]
+
+def format_epoch(epoch: Epoch) -> str:
+    """Подпись эпохи: «#3 10-01 12:00 — 10-15 09:00»"""
+    start = format_time_short(epoch.started_at) if epoch.started_at else "начало"
+    end = format_time_short(epoch.ended_at) if epoch.ended_at else "сейчас"
+    return f"#{epoch.id} {start} — {end}"
 
+# ---------------- ДОСТАВКА ----------------
+def delivery_lines(cur: sqlite3.Cursor, cutoff_ts: int | None, until_ts: int | None) -> List[str]:
+    """Строки отчёта о доставке сообщений за период"""
+    # delivery.py пишет через events.py, а тот импортирует stats: импорт на уровне модуля дал бы цикл
+    from delivery import DELIVERY_BLOCKED, DELIVERY_CHAT_NOT_FOUND, DELIVERY_FAILED, DELIVERY_OK, DELIVERY_RETRY_AFTER
+
+    with SQL_SECONDS.time(query="deliveries"):
         cur.execute(
-            f"SELECT COUNT(*) FROM events WHERE type='button_click' AND payload='btn_kaspi'" + where_clause,
-            params,
+            "SELECT status, COUNT(*), SUM(latency_ms) FROM deliveries "
+            "WHERE created_at >= ? AND created_at < ? GROUP BY status",
+            (cutoff_ts or 0, until_ts if until_ts is not None else 2**62),
         )
-        kaspi_clicks = cur.fetchone()[0] or 0
+        by_status = {status: (cnt, latency) for status, cnt, latency in cur.fetchall()}
+        cur.execute("SELECT COUNT(*) FROM users WHERE unreachable <> 0")
+        unreachable = cur.fetchone()[0]
+    # RETRY_AFTER не итог: сообщение ещё будет отправлено повторно
+    ok, ok_latency = by_status.get(DELIVERY_OK, (0, 0))
+    blocked = by_status.get(DELIVERY_BLOCKED, (0, 0))[0]
+    not_found = by_status.get(DELIVERY_CHAT_NOT_FOUND, (0, 0))[0]
+    failed = by_status.get(DELIVERY_FAILED, (0, 0))[0]
+    retried = by_status.get(DELIVERY_RETRY_AFTER, (0, 0))[0]
+    attempted = ok + blocked + not_found + failed
+    rate = f"{ok * 100 / attempted:.1f}%" if attempted else "—"
+    avg = f", в среднем {ok_latency / ok:.0f} мс" if ok else ""
+    return [
+        f"– Доставлено сообщений: <b>{ok}</b> из {attempted} ({rate}){avg}",
+        f"– Заблокировали бота: <b>{blocked}</b>, чат не найден: {not_found}, ошибок: {failed}, повторов из-за лимита: {retried}",
+        f"– Недоступны сейчас: <b>{unreachable}</b>",
+    ]
+
+# ---------------- ФУНКЦИИ СТАТИСТИКИ ----------------
+def build_stats_text(period_key: str, detailed: bool, epoch_id: int | None = None) -> str:
+    """Строит текст статистики для указанного периода текущей (или указанной) эпохи"""
+    with db_connect() as conn:
+        cur = conn.cursor()
+        epoch = get_epoch(cur, epoch_id)
+        if epoch is None:
+            return "Период не найден."
+        cutoff_ts = period_cutoff_ts(period_key)
+        if epoch.ended_at is not None:
+            # Прошлая эпоха: периоды «24h/7d» отсчитываются от её конца
+            seconds = STATS_PERIODS.get(period_key)
+            cutoff_ts = None if seconds is None else epoch.ended_at - seconds
+        if epoch.started_at and (cutoff_ts is None or cutoff_ts < epoch.started_at):
+            cutoff_ts = epoch.started_at
+        until_ts = epoch.ended_at
+        params: List[Any] = []
+        where: List[str] = []
+        if cutoff_ts is not None:
+            where.append("e.created_at >= ?")
+            params.append(cutoff_ts)
+        if until_ts is not None:
+            where.append("e.created_at < ?")
+            params.append(until_ts)
+
+        total_starts = count_events(cur, cutoff_ts, "start", until_ts=until_ts)
+        group_clicks = count_events(cur, cutoff_ts, "button_click", "btn_group", until_ts=until_ts)
+        kaspi_clicks = count_events(cur, cutoff_ts, "button_click", "btn_kaspi", until_ts=until_ts)
 
         lines: List[str] = []
-        header = {
-            "24h": "за 24 часа",
-            "7d": "за 7 дней",
-            "all": "за весь период",
-        }.get(period_key, "за период")
+        header = PERIOD_TITLES.get(period_key, "за период")
+        if epoch.ended_at is not None:
+            header = f"{header} эпохи {format_epoch(epoch)}"
         lines.append(f"📊 Статистика {header}")
+        if epoch.ended_at is None and epoch.started_at:
+            lines.append(f"(после обнуления {format_time_short(epoch.started_at)})")
         lines.append(f"– Стартовали бота: <b>{total_starts}</b>")
         lines.append(f"– Перешли в группу: <b>{group_clicks}</b>")
         lines.append(f"– Кликнули на Kaspi: <b>{kaspi_clicks}</b>")
+        lines.extend(delivery_lines(cur, cutoff_ts, until_ts))
 
         if detailed:
             lines.append("")
             lines.append("Последние события (до 50):")
 
             # Читаем последние события вместе с профилем пользователя
+            profile = (
+                "IFNULL(u.first_name,''), IFNULL(u.last_name,''), IFNULL(u.username,''), IFNULL(u.language_code,''), IFNULL(u.is_premium,0), IFNULL(u.is_bot,0)"
+            )
             q = (
-                "SELECT e.created_at, e.user_id, e.type, IFNULL(e.payload, ''), "
-                "IFNULL(u.first_name,''), IFNULL(u.last_name,''), IFNULL(u.username,''), IFNULL(u.language_code,''), IFNULL(u.is_premium,0), IFNULL(u.is_bot,0) "
-                "FROM events e LEFT JOIN users u ON u.user_id = e.user_id"
-                + (" WHERE e.created_at >= ?" if cutoff_iso is not None else "")
+                f"SELECT e.created_at, e.user_id, k.type, k.payload, {profile} "
+                "FROM events e JOIN event_kinds k ON k.id = e.kind LEFT JOIN users u ON u.user_id = e.user_id"
+                + (" WHERE " + " AND ".join(where) if where else "")
                 + " ORDER BY e.created_at DESC LIMIT 50"
             )
-            cur.execute(q, params)
-            recent = cur.fetchall()
-
-            def format_time_short(iso_str: str) -> str:
-                try:
-                    dt = datetime.fromisoformat(iso_str)
-                except Exception:
-                    return iso_str
-                return dt.strftime("%m-%d %H:%M")
-
-            def action_name(ev_type: str, payload: str) -> str:
-                if ev_type == "start":
-                    return "Старт"
-                if ev_type == "button_click":
-                    mapping = {
-                        "btn_group": "Кнопка: Перейти в группу",
-                        "btn_kaspi": "Кнопка: Оформить в Kaspi",
-                        "btn_guide": "Кнопка: Сначала посмотрю гайд",
-                    }
-                    return mapping.get(payload, f"Кнопка: {payload}")
-                if ev_type == "message_sent":
-                    return f"Отправлено: {payload}"
-                return ev_type
+            if legacy_pending(cur):
+                legacy_where = [w.replace("e.created_at", _LEGACY_TIME) for w in where]
+                q = (
+                    f"SELECT * FROM ({q}) UNION ALL SELECT * FROM ("
+                    f"SELECT {_LEGACY_TIME}, l.user_id, l.type, IFNULL(l.payload, ''), {profile} "
+                    "FROM events_legacy l LEFT JOIN users u ON u.user_id = l.user_id"
+                    + (" WHERE " + " AND ".join(legacy_where) if legacy_where else "")
+                    + f" ORDER BY 1 DESC LIMIT 50) ORDER BY 1 DESC LIMIT 50"
+                )
+                params = params * 2
+            with SQL_SECONDS.time(query="recent_events"):
+                cur.execute(q, params)
+                recent = cur.fetchall()
 
             for created_at, uid, etype, payload, first_name, last_name, username, lang, is_premium, is_bot in recent:
-                display = first_name
-                if last_name:
-                    display = f"{display} {last_name}" if display else last_name
-                if username:
-                    at = f"@{username}"
-                    display = f"{display} ({at})" if display else at
-                if not display:
-                    display = str(uid)
-                info_bits = []
-                if lang:
-                    info_bits.append(lang)
-                if is_premium:
-                    info_bits.append("premium")
-                if is_bot:
-                    info_bits.append("bot")
-                extra = f" • {'/'.join(info_bits)}" if info_bits else ""
-                lines.append(f"{format_time_short(created_at)} • {display}{extra} • {action_name(etype, payload)}")
+                display = format_user(uid, first_name, last_name, username, lang, is_premium, is_bot)
+                lines.append(f"{format_time_short(created_at)} • {display} • {action_name(etype, payload)}")
 
         return "\n".join(lines)
 
-def get_users_list() -> str:
-    """Возвращает список пользователей (до 200)"""
-    with db_connect() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT u.user_id, IFNULL(u.first_name,''), IFNULL(u.last_name,''), IFNULL(u.username,''),
-                   IFNULL(u.language_code,''), IFNULL(u.is_premium,0), IFNULL(u.is_bot,0),
-                   MAX(e.created_at) as last_seen
-            FROM users u
-            LEFT JOIN events e ON e.user_id = u.user_id
-            GROUP BY u.user_id
-            ORDER BY last_seen DESC
-            LIMIT 200
-            """
-        )
-        rows = cur.fetchall()
-
-    def format_time_short(iso_str: str | None) -> str:
-        if not iso_str:
-            return "—"
-        try:
-            dt = datetime.fromisoformat(iso_str)
-            return dt.strftime("%m-%d %H:%M")
-        except Exception:
-            return iso_str
-
-    lines = ["👥 Пользователи (до 200):"]
+# ---------------- СПИСОК ПОЛЬЗОВАТЕЛЕЙ ----------------
+# users.last_seen обновляется потоком записи событий вместе с самими событиями
+LAST_SEEN_UPDATE_SQL = "UPDATE users SET last_seen = ? WHERE user_id = ? AND last_seen < ?"
+
+def last_seen_rows(events: Iterable[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    """Строки для LAST_SEEN_UPDATE_SQL: последнее время события по каждому пользователю"""
+    latest: Dict[int, int] = {}
+    for user_id, _, created_at in events:
+        if created_at > latest.get(user_id, 0):
+            latest[user_id] = created_at
+    return [(ts, user_id, ts) for user_id, ts in latest.items()]
+
+USERS_PAGE_SIZE = 20
+
+# Фильтры списка: код (используется в callback_data) -> (подпись, SQL-условие, параметры)
+USERS_FILTERS: Dict[str, Tuple[str, str, Tuple[Any, ...]]] = {
+    "all": ("все", "1 = 1", ()),
+    "prem": ("premium", "is_premium = 1", ()),
+    "bot": ("боты", "is_bot = 1", ()),
+    "ru": ("ru", "language_code = ?", ("ru",)),
+    "kk": ("kk", "language_code = ?", ("kk",)),
+    "en": ("en", "language_code = ?", ("en",)),
+}
+
+class UsersPage(NamedTuple):
+    text: str
+    first: Tuple[int, int] | None  # ключ (last_seen, user_id) первой строки страницы
+    last: Tuple[int, int] | None   # ключ последней строки
+    has_prev: bool
+    has_next: bool
+
+def get_users_page(
+    filter_key: str = "all",
+    after: Tuple[int, int] | None = None,
+    before: Tuple[int, int] | None = None,
+) -> UsersPage:
+    """Страница списка пользователей по убыванию last_seen (keyset-пагинация).
+
+    after — ключ последней строки предыдущей страницы (листаем к более старым),
+    before — ключ первой строки следующей страницы (листаем к более новым).
+    Каждая страница — один проход по диапазону индекса по (last_seen, user_id).
+    """
+    label, condition, filter_params = USERS_FILTERS.get(filter_key, USERS_FILTERS["all"])
+    params: List[Any] = list(filter_params)
+    if before is not None:
+        keyset, order = " AND (last_seen, user_id) > (?, ?)", "ASC"
+        params.extend(before)
+    elif after is not None:
+        keyset, order = " AND (last_seen, user_id) < (?, ?)", "DESC"
+        params.extend(after)
+    else:
+        keyset, order = "", "DESC"
+    params.append(USERS_PAGE_SIZE + 1)
+
+    with db_connect() as conn, SQL_SECONDS.time(query="users_page"):
+        rows = conn.execute(
+            f"""
+            SELECT user_id, IFNULL(first_name,''), IFNULL(last_name,''), IFNULL(username,''),
+                   IFNULL(language_code,''), IFNULL(is_premium,0), IFNULL(is_bot,0), last_seen
+            FROM users
+            WHERE {condition}{keyset}
+            ORDER BY last_seen {order}, user_id {order}
+            LIMIT ?
+            """,
+            params,
+        ).fetchall()
+
+    return users_page_from_rows(label, rows, after, before)
+
+def users_page_from_rows(
+    label: str, rows: List[Tuple[Any, ...]], after: Tuple[int, int] | None, before: Tuple[int, int] | None,
+) -> UsersPage:
+    """Страница из строк (user_id, имя, фамилия, username, язык, premium, bot, last_seen); строк — до USERS_PAGE_SIZE + 1"""
+    has_more = len(rows) > USERS_PAGE_SIZE
+    rows = list(rows[:USERS_PAGE_SIZE])
+    if before is not None:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after is not None, has_more
+
+    lines = [f"👥 Пользователи ({label}):"]
     for uid, first_name, last_name, username, lang, is_premium, is_bot, last_seen in rows:
-        display = first_name
-        if last_name:
-            display = f"{display} {last_name}" if display else last_name
-        if username:
-            at = f"@{username}"
-            display = f"{display} ({at})" if display else at
-        if not display:
-            display = str(uid)
-        info_bits = []
-        if lang:
-            info_bits.append(lang)
-        if is_premium:
-            info_bits.append("premium")
-        if is_bot:
-            info_bits.append("bot")
-        extra = f" • {'/'.join(info_bits)}" if info_bits else ""
-        lines.append(f"{format_time_short(last_seen)} • {display}{extra}")
-
-    return "\n".join(lines)
+        lines.append(f"{format_time_short(last_seen)} • {format_user(uid, first_name, last_name, username, lang, is_premium, is_bot)}")
+    if not rows:
+        lines.append("Никого не найдено")
+
+    return UsersPage(
+        text="\n".join(lines),
+        first=(rows[0][7], rows[0][0]) if rows else None,
+        last=(rows[-1][7], rows[-1][0]) if rows else None,
+        has_prev=has_prev and bool(rows),
+        has_next=has_next and bool(rows),
+    )
 
 def reset_statistics() -> None:
-    """Обнуляет всю статистику (удаляет все события)"""
-    with db_connect() as conn:
-        conn.execute("DELETE FROM events")
-        conn.commit()
+    """Обнуляет статистику: закрывает текущую эпоху и открывает новую.
+
+    События не удаляются: старые эпохи остаются доступны в меню статистики,
+    а физически события удаляет задача хранения (retention.py).
+    """
+    now = utcnow_ts()
+    with db_connect() as conn, SQL_SECONDS.time(query="reset"):
+        conn.execute("UPDATE stat_epochs SET ended_at = ? WHERE ended_at IS NULL", (now,))
+        conn.execute("INSERT INTO stat_epochs (started_at) VALUES (?)", (now,))
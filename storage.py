@@ -0,0 +1,162 @@
+"""
+Хранилище пользователей и событий Woolzy Bot
+Обработчики сохраняют профили и события и читают отчёты через интерфейс
+Storage. Сейчас реализация одна — SQLite (db.py, events.py, stats.py)
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, NamedTuple, Tuple
+
+from config import PROFILE_CACHE_SIZE
+from db import db_connect
+from events import record_event, record_write
+from metrics import PROFILE_CACHE
+from stats import UsersPage, build_stats_text, count_events, get_users_page
+
+class UserProfile(NamedTuple):
+    user_id: int
+    username: str | None
+    first_name: str | None
+    last_name: str | None
+    language_code: str | None
+    is_premium: int
+    is_bot: int
+
+def profile_of(user: Any) -> UserProfile:
+    """Профиль из telegram.User"""
+    return UserProfile(
+        user.id,
+        user.username,
+        user.first_name,
+        user.last_name,
+        getattr(user, "language_code", None),
+        1 if getattr(user, "is_premium", False) else 0,
+        1 if getattr(user, "is_bot", False) else 0,
+    )
+
+# ---------------- ИНТЕРФЕЙС ----------------
+class Storage(ABC):
+    """Пользователи, события и отчёты по ним"""
+
+    async def open(self) -> None:
+        """Подключение и подготовка схемы"""
+
+    async def close(self) -> None:
+        """Дописывает накопленное и закрывает соединения"""
+
+    @abstractmethod
+    async def upsert_user(self, profile: UserProfile, started_at: int | None = None) -> None:
+        """Создаёт или обновляет профиль и снимает отметку недоступности; started_at — время /start"""
+
+    @abstractmethod
+    async def record_event(self, user_id: int, type: str, payload: str | None = None) -> None:
+        """Добавляет событие; запись может идти пачками в фоне"""
+
+    @abstractmethod
+    async def count_events(
+        self, etype: str, payload: str | None = None, since: int | None = None, until: int | None = None,
+    ) -> int:
+        """Число событий с since <= created_at < until (границы необязательны)"""
+
+    @abstractmethod
+    async def stats_text(self, period_key: str, detailed: bool) -> str:
+        """Отчёт статистики за период"""
+
+    @abstractmethod
+    async def users_page(
+        self, filter_key: str, after: Tuple[int, int] | None = None, before: Tuple[int, int] | None = None,
+    ) -> UsersPage:
+        """Страница списка пользователей по убыванию last_seen"""
+
+# ---------------- SQLITE ----------------
+USER_UPSERT_SQL = """
+    INSERT INTO users (user_id, username, first_name, last_name, language_code, is_premium, is_bot, last_start)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username=excluded.username,
+        first_name=excluded.first_name,
+        last_name=excluded.last_name,
+        language_code=excluded.language_code,
+        is_premium=excluded.is_premium,
+        is_bot=excluded.is_bot,
+        last_start=IFNULL(excluded.last_start, users.last_start),
+        unreachable=0
+"""
+
+def _count_events(etype: str, payload: str | None, since: int | None, until: int | None) -> int:
+    with db_connect() as conn:
+        return count_events(conn.cursor(), since, etype, payload, until)
+
+class SqliteStorage(Storage):
+    """Файл DB_PATH: запись через поток записи событий, чтение — в отдельном потоке"""
+
+    async def upsert_user(self, profile: UserProfile, started_at: int | None = None) -> None:
+        await record_write(USER_UPSERT_SQL, (*profile, started_at))
+
+    async def record_event(self, user_id: int, type: str, payload: str | None = None) -> None:
+        await record_event(user_id, type, payload)
+
+    async def count_events(
+        self, etype: str, payload: str | None = None, since: int | None = None, until: int | None = None,
+    ) -> int:
+        return await asyncio.to_thread(_count_events, etype, payload, since, until)
+
+    async def stats_text(self, period_key: str, detailed: bool) -> str:
+        return await asyncio.to_thread(build_stats_text, period_key, detailed)
+
+    async def users_page(
+        self, filter_key: str, after: Tuple[int, int] | None = None, before: Tuple[int, int] | None = None,
+    ) -> UsersPage:
+        return await asyncio.to_thread(get_users_page, filter_key, after, before)
+
+storage: Storage = SqliteStorage()
+
+# ---------------- КЭШ ПРОФИЛЕЙ ----------------
+class ProfileCache:
+    """LRU последних записанных профилей: user_id -> UserProfile"""
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._profiles: "OrderedDict[int, UserProfile]" = OrderedDict()
+
+    def unchanged(self, profile: UserProfile) -> bool:
+        """Профиль уже записан именно таким"""
+        cached = self._profiles.get(profile.user_id)
+        if cached is None:
+            PROFILE_CACHE.inc(result="miss")
+            return False
+        self._profiles.move_to_end(profile.user_id)
+        if cached != profile:
+            PROFILE_CACHE.inc(result="changed")
+            return False
+        PROFILE_CACHE.inc(result="hit")
+        return True
+
+    def remember(self, profile: UserProfile) -> None:
+        self._profiles[profile.user_id] = profile
+        self._profiles.move_to_end(profile.user_id)
+        if len(self._profiles) > self._size:
+            self._profiles.popitem(last=False)
+
+    def forget(self, user_id: int) -> None:
+        """Следующее обновление пользователя снова запишет профиль"""
+        self._profiles.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+profile_cache = ProfileCache(PROFILE_CACHE_SIZE)
+
+async def save_user(profile: UserProfile, started_at: int | None = None) -> None:
+    """Записывает профиль, если он изменился с прошлой записи; /start (started_at) пишется всегда.
+
+    Запись профиля снимает с пользователя отметку недоступности: он прислал
+    обновление, значит, снова получает сообщения. mark_unreachable убирает
+    пользователя из кэша, чтобы это обновление не было пропущено.
+    """
+    if started_at is None and profile_cache.unchanged(profile):
+        return
+    await storage.upsert_user(profile, started_at)
+    profile_cache.remember(profile)
@@ -1,10 +1,19 @@
-from typing import List, Tuple
+from typing import List, NamedTuple, Tuple
 
-# ---------------- ТАЙМИНГИ СООБЩЕНИЙ (в секундах) ----------------
-# формат: (delay_seconds, key)
-TIMELINE: List[Tuple[int, str]] = [
-    (30, "remind_group"),       # 30 секунд после старта
-    (300, "reviews"),           # 5 минут после старта  
-    (3600, "check_in"),         # 1 час после старта
-    (86400, "offer"),           # 24 часа после старта
-]
\ No newline at end of file
+# ---------------- КАМПАНИЯ ----------------
+# Сами шаги (ключ, триггер, задержка, отмена) задаются в campaign.json и
+# перечитываются без перезапуска бота (см. content.py)
+class CampaignStep(NamedTuple):
+    key: str                         # ключ сообщения из campaign.json
+    trigger: str                     # событие, после которого ставится шаг: "start" или кнопка
+    delay: int                       # задержка от события, секунды
+    cancel_on: Tuple[str, ...] = ()  # события, после которых шаг уже не нужен
+
+# События, которые запоминаются за пользователем (битовая маска в campaign_state).
+# Порядок менять нельзя: номер бита = позиция в списке; новые — только в конец.
+# Список хранится в коде, а не в campaign.json: биты уже записаны в БД
+CAMPAIGN_EVENTS: List[str] = [
+    "btn_group",
+    "btn_guide",
+    "btn_kaspi",
+]
@@ -0,0 +1,444 @@
+"""
+Бенчмарк отчётов и обработчиков Woolzy Bot на синтетических данных
+
+Генерирует БД текущей схемы (users, events и производные таблицы пишет тот
+же поток записи, что и в боте) с правдоподобным распределением: рост числа
+новых пользователей, суточный ритм, кнопки и сообщения цепочки по campaign.json,
+«тяжёлый хвост» активных пользователей и отказы доставки. Затем замеряет
+build_stats_text для всех периодов, список пользователей, ленту событий,
+воронку, обнуление статистики и обработчики start/on_button с заглушкой
+Bot API без HTTP. Каждый набор данных проверяется в отдельном процессе:
+config читает DB_PATH при импорте.
+
+    python -m tools.bench --events 10k,1m --json bench.json
+    python -m tools.bench --events 10m --data-dir /var/tmp/woolzy-bench --json bench-10m.json
+    python -m tools.bench --events 1m --json new.json --compare bench.json
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Tuple
+
+from telegram.request import BaseRequest
+
+from tools.fake_bot_api import BOT_USER, make_callback_update, make_start_update
+from tools.harness import percentiles
+
+DAY_SECONDS = 86400
+HISTORY_DAYS = 90
+# Первые id синтетических пользователей; обработчики получают id выше занятых
+FIRST_USER_ID = 10_000_000
+
+FIRST_NAMES = ("Айгерим", "Дана", "Алия", "Мария", "Анна", "Асель", "Жанна", "Ольга", "Камила", "Dinara")
+LANGUAGES = (("ru", 0.6), ("kk", 0.3), ("en", 0.1))
+# Исходы доставки: код DELIVERY_* из delivery.py -> доля (OK, BLOCKED, RETRY_AFTER, FAILED).
+# Числами, а не импортом: delivery тянет config, а его читают только после выбора DB_PATH
+DELIVERY_MIX = ((0, 0.95), (1, 0.03), (3, 0.01), (4, 0.01))
+
+# ---------------- ГЕНЕРАТОР ----------------
+def parse_size(text: str) -> int:
+    """10k, 1m, 10m или просто число"""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+def _pick(rng: random.Random, weighted: Tuple[Tuple[Any, float], ...]) -> Any:
+    point = rng.random()
+    for value, share in weighted:
+        point -= share
+        if point < 0:
+            return value
+    return weighted[-1][0]
+
+def user_profile(rng: random.Random, uid: int) -> Tuple[Any, ...]:
+    """(user_id, username, first_name, last_name, language_code, is_premium, is_bot)"""
+    return (
+        uid,
+        f"user{uid}" if rng.random() < 0.7 else None,
+        rng.choice(FIRST_NAMES),
+        None,
+        _pick(rng, LANGUAGES),
+        1 if rng.random() < 0.06 else 0,
+        1 if rng.random() < 0.005 else 0,
+    )
+
+def user_events(rng: random.Random, t0: int) -> Tuple[List[Tuple[int, str, str | None, int | None]], bool]:
+    """События пользователя с первым /start в t0: [(время, type, payload, статус доставки)] и флаг «заблокировал бота»"""
+    from content import content
+    from funnel import FUNNEL_BUTTONS
+
+    clicks: Dict[str, int] = {}
+    if rng.random() < 0.45:
+        clicks["btn_group"] = t0 + int(rng.lognormvariate(4.5, 1.5))
+    if rng.random() < 0.35:
+        clicks["btn_guide"] = t0 + int(rng.lognormvariate(5.0, 1.5))
+    if rng.random() < 0.08:
+        clicks["btn_kaspi"] = t0 + 3600 + int(rng.lognormvariate(9.0, 1.2))
+
+    events: List[Tuple[int, str, str | None, int | None]] = [(t0, "start", None, None), (t0 + 1, "message_sent", "welcome", 0)]
+    for step in content.current.steps:
+        trigger_at = t0 if step.trigger == "start" else clicks.get(step.trigger)
+        if trigger_at is None:
+            continue
+        due = trigger_at + step.delay
+        if any(clicks.get(event, due + 1) <= due for event in step.cancel_on):
+            continue
+        events.append((due, "message_sent", step.key, _pick(rng, DELIVERY_MIX)))
+    events.extend((at, "button_click", payload, None) for payload, at in clicks.items())
+    # Небольшая часть пользователей возвращается много раз (распределение Парето)
+    for _ in range(min(int(rng.paretovariate(1.3)) - 1, 500)):
+        at = t0 + int(rng.expovariate(1 / (3 * DAY_SECONDS)))
+        if rng.random() < 0.2:
+            events.append((at, "start", None, None))
+        else:
+            events.append((at, "button_click", rng.choice(FUNNEL_BUTTONS), None))
+    events.sort()
+
+    # После блокировки бота пользователь больше ничего не получает и не нажимает
+    for i, (_, etype, _, status) in enumerate(events):
+        if etype == "message_sent" and status == 1:
+            return events[: i + 1], True
+    return events, False
+
+def _daily_new_users(users: int) -> List[int]:
+    """Новые пользователи по дням истории: рост к концу периода и пик в выходные"""
+    weights = [(1 + 2 * day / HISTORY_DAYS) * (1.3 if day % 7 in (5, 6) else 1.0) for day in range(HISTORY_DAYS)]
+    total = sum(weights)
+    return [max(1, round(users * w / total)) for w in weights]
+
+async def generate(target_events: int, seed: int) -> Dict[str, Any]:
+    """Заполняет пустую БД через поток записи событий; события идут строго по времени"""
+    from delivery import INSERT_DELIVERY_SQL
+    from events import Event, event_writer, record_write
+    from storage import USER_UPSERT_SQL
+
+    # Среднее число событий на пользователя — по пробной выборке с тем же seed
+    probe = random.Random(seed)
+    per_user = statistics.fmean(len(user_events(probe, 0)[0]) for _ in range(2000))
+    users = max(50, round(target_events / per_user))
+    rng = random.Random(seed)
+
+    now = int(time.time())
+    history_start = now - now % DAY_SECONDS - (HISTORY_DAYS - 1) * DAY_SECONDS
+    pending: List[Tuple[int, int, int, str, str | None, int | None]] = []
+    seq = uid = FIRST_USER_ID
+    written = 0
+    blocked: List[Tuple[int]] = []
+
+    async def emit(until: int) -> int:
+        count = 0
+        while pending and pending[0][0] < until:
+            at, _, user_id, etype, payload, status = heapq.heappop(pending)
+            if at > now:
+                continue
+            await event_writer.submit(Event(user_id, etype, payload, at))
+            if status is not None:
+                latency_ms = int(rng.lognormvariate(4.5, 0.5))
+                await record_write(INSERT_DELIVERY_SQL, (user_id, "drip", status, latency_ms, at))
+            count += 1
+        return count
+
+    event_writer.start()
+    for day, new_users in enumerate(_daily_new_users(users)):
+        day_start = history_start + day * DAY_SECONDS
+        profiles = []
+        for _ in range(new_users):
+            uid += 1
+            t0 = day_start + int(14 * 3600 + rng.gauss(0, 4 * 3600)) % DAY_SECONDS
+            events, is_blocked = user_events(rng, t0)
+            profiles.append((*user_profile(rng, uid), t0))
+            if is_blocked:
+                blocked.append((uid,))
+            for at, etype, payload, status in events:
+                seq += 1
+                heapq.heappush(pending, (at, seq, uid, etype, payload, status))
+        await record_write(USER_UPSERT_SQL, *profiles)
+        written += await emit(day_start + DAY_SECONDS)
+    written += await emit(now + 1)
+    if blocked:
+        await record_write("UPDATE users SET unreachable = 1 WHERE user_id = ?", *blocked)
+    event_writer.stop()
+    return {"users": uid - FIRST_USER_ID, "events": written, "blocked_users": len(blocked)}
+
+# ---------------- ЗАМЕРЫ ----------------
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Время вызовов, мс: первый (холодный) вызов отдельно, перцентили по всем"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    ms = {k: round(v * 1000, 3) for k, v in percentiles(samples).items()}
+    return {
+        "runs": len(samples),
+        "first_ms": round(samples[0] * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        **{f"{k}_ms": v for k, v in ms.items()},
+    }
+
+def bench_reports(repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Отчёты админа: вызовы тех же функций, что и в обработчиках, без кэша отчётов"""
+    from db import db_connect
+    from eventlog import EVENT_FILTERS, get_events_page, get_user_timeline
+    from funnel import FUNNEL_WINDOWS, build_funnel_text
+    from stats import PERIOD_TITLES, USERS_FILTERS, build_stats_text, get_users_page
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for period in PERIOD_TITLES:
+        for detailed in (False, True):
+            name = f"stats:{period}:{'full' if detailed else 'short'}"
+            results[name] = measure(lambda: build_stats_text(period, detailed), repeat)
+    for filter_key in USERS_FILTERS:
+        results[f"users_page:{filter_key}"] = measure(lambda: get_users_page(filter_key), repeat)
+    # Страница из середины списка: keyset-курсор той же стоимости, что и первая
+    with db_connect() as conn:
+        middle = conn.execute(
+            "SELECT last_seen, user_id FROM users ORDER BY last_seen DESC, user_id DESC LIMIT 1 OFFSET "
+            "(SELECT COUNT(*) / 2 FROM users)"
+        ).fetchone()
+        heaviest = conn.execute(
+            "SELECT user_id FROM events GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()
+    if middle:
+        results["users_page:all:middle"] = measure(lambda: get_users_page("all", after=tuple(middle)), repeat)
+    for filter_key in EVENT_FILTERS:
+        results[f"events_page:{filter_key}"] = measure(lambda: get_events_page(filter_key), repeat)
+    if heaviest:
+        results["user_timeline:heaviest"] = measure(lambda: get_user_timeline(heaviest[0]), repeat)
+    for window in FUNNEL_WINDOWS:
+        results[f"funnel:{window}"] = measure(lambda: build_funnel_text(window), repeat)
+    return results
+
+class StubRequest(BaseRequest):
+    """Запросы Bot API без сети: отвечает сразу, как заглушка нагрузочного теста"""
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Any = None, *args: Any, **kwargs: Any) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        result: Any = True
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+                "from": BOT_USER,
+                "text": str(params.get("text") or ""),
+            }
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+async def bench_handlers(updates: int, new_user_id: int) -> Dict[str, Dict[str, Any]]:
+    """start и on_button через Application.process_update; запись в БД — через поток записи, как в боте"""
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, CallbackQueryHandler, CommandHandler
+
+    import main
+    from events import event_writer
+
+    app = ApplicationBuilder().token(main.BOT_TOKEN).request(StubRequest()).build()
+    app.add_handler(CommandHandler("start", main.start))
+    app.add_handler(CallbackQueryHandler(main.on_button))
+    errors: List[BaseException] = []
+
+    async def on_error(update: object, context: Any) -> None:
+        errors.append(context.error)
+
+    app.add_error_handler(on_error)
+    await app.initialize()
+    event_writer.start()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    new_users = range(new_user_id, new_user_id + updates)
+    known_users = range(FIRST_USER_ID + 1, FIRST_USER_ID + 1 + updates)
+    scenarios = (
+        ("handler:start", new_users, lambda uid: make_start_update(uid)),
+        # Пользователи из набора данных, которых кэш профилей ещё не видел
+        ("handler:on_button", known_users, lambda uid: make_callback_update(uid, "btn_group")),
+        # Повторное нажатие: профиль не изменился, кэш профилей пропускает запись
+        ("handler:on_button:repeat", known_users, lambda uid: make_callback_update(uid, "btn_guide")),
+    )
+    update_id = 0
+    for name, user_ids, make_update in scenarios:
+        samples = []
+        enqueued = event_writer.enqueued
+        started_all = time.perf_counter()
+        for uid in user_ids:
+            update_id += 1
+            update = Update.de_json({"update_id": update_id, **make_update(uid)}, app.bot)
+            started = time.perf_counter()
+            await app.process_update(update)
+            samples.append(time.perf_counter() - started)
+        handled = time.perf_counter() - started_all
+        # Время до записи всего, что поставили обработчики
+        while event_writer.written < event_writer.enqueued and time.perf_counter() - started_all < 60:
+            await asyncio.sleep(0.005)
+        results[name] = {
+            **summarize(samples),
+            "records_queued": event_writer.enqueued - enqueued,
+            "updates_per_s": round(updates / handled, 1),
+            "drain_ms": round((time.perf_counter() - started_all - handled) * 1000, 3),
+        }
+    event_writer.stop()
+    await app.shutdown()
+    if errors:
+        raise RuntimeError(f"{len(errors)} handler errors, first: {errors[0]!r}")
+    return results
+
+def bench_reset(repeat: int) -> Dict[str, Any]:
+    """Обнуление статистики (новая эпоха); идёт последним, потому что меняет отчёты"""
+    from stats import build_stats_text, reset_statistics
+
+    result = measure(reset_statistics, repeat)
+    # Отчёт сразу после обнуления: текущая эпоха пустая
+    result["stats_after_reset"] = measure(lambda: build_stats_text("all", False), repeat)
+    return result
+
+# ---------------- НАБОР ДАННЫХ ----------------
+def dataset_path(data_dir: str, events: int, seed: int) -> str:
+    from db import MIGRATIONS
+
+    return os.path.join(data_dir, f"bench-{events}-seed{seed}-v{len(MIGRATIONS)}.sqlite3")
+
+def run_dataset(events: int, seed: int, data_dir: str, repeat: int, updates: int) -> Dict[str, Any]:
+    """Один набор данных в отдельном процессе: генерация (или готовый файл) и все замеры"""
+    os.environ.setdefault("BOT_TOKEN", "123456:local-test-token")
+    # Генератор пишет большими пачками; обработчики замеряются с этими же настройками
+    os.environ.setdefault("EVENTS_BATCH_SIZE", "5000")
+    os.environ.setdefault("EVENTS_QUEUE_SIZE", "100000")
+    os.environ["DB_PATH"] = path = os.path.join(data_dir, "current.sqlite3")
+    warnings.simplefilter("ignore")  # rate_limit_args без лимитера отправки
+
+    cached = dataset_path(data_dir, events, seed)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    from db import db_init
+    result: Dict[str, Any] = {"target_events": events}
+    if os.path.exists(cached):
+        _copy_db(cached, path)
+        result["dataset_age_s"] = int(time.time() - os.path.getmtime(cached))
+        db_init()
+    else:
+        db_init()
+        started = time.perf_counter()
+        result["generated"] = asyncio.run(generate(events, seed))
+        result["generate_s"] = round(time.perf_counter() - started, 2)
+        _copy_db(path, cached)
+
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        result["users"] = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        result["events"] = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        first_free = conn.execute("SELECT IFNULL(MAX(user_id), 0) + 1 FROM users").fetchone()[0]
+    result["db_bytes"] = os.path.getsize(path)
+
+    timings = bench_reports(repeat)
+    timings.update(asyncio.run(bench_handlers(updates, first_free)))
+    timings["reset_statistics"] = bench_reset(repeat)
+    result["timings"] = timings
+    return result
+
+def _copy_db(source: str, target: str) -> None:
+    """Копия БД вместе с содержимым WAL (sqlite3 backup API)"""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+# ---------------- ОТЧЁТ ----------------
+def _flatten(timings: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+    """Медиана по каждому замеру, включая вложенные"""
+    flat = {}
+    for name, values in timings.items():
+        flat[name] = values["median_ms"]
+        for key, nested in values.items():
+            if isinstance(nested, dict):
+                flat[f"{name}:{key}"] = nested["median_ms"]
+    return flat
+
+def print_dataset(result: Dict[str, Any], baseline: Dict[str, Any] | None) -> None:
+    print(f"\n== {result['events']} events, {result['users']} users, {result['db_bytes'] / 2**20:.1f} MiB ==")
+    if "generate_s" in result:
+        print(f"generated in {result['generate_s']}s")
+    old = _flatten(baseline["timings"]) if baseline else {}
+    for name, median in _flatten(result["timings"]).items():
+        line = f"  {name:<36} {median:>10.3f} ms"
+        if name in old and old[name] > 0:
+            line += f"  ({(median / old[name] - 1) * 100:+.0f}% vs baseline {old[name]:.3f})"
+        print(line)
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", default="10k,1m", help="размеры наборов через запятую: 10k, 1m, 10m")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5, help="повторов каждого замера отчётов")
+    parser.add_argument("--updates", type=int, default=200, help="обновлений на каждый сценарий обработчиков")
+    parser.add_argument("--data-dir", help="каталог для сгенерированных наборов; готовые наборы берутся из него повторно")
+    parser.add_argument("--json", help="записать результат в JSON-файл")
+    parser.add_argument("--compare", help="JSON прошлого запуска: показать изменение медиан")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="woolzy-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    baseline: Dict[int, Dict[str, Any]] = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {d["target_events"]: d for d in json.load(f)["datasets"]}
+
+    report: Dict[str, Any] = {
+        "created_at": int(time.time()),
+        "git": _git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "args": vars(args),
+        "datasets": [],
+    }
+    for size in args.events.split(","):
+        events = parse_size(size)
+        # Отдельный процесс на набор: config и пул соединений привязаны к DB_PATH при импорте
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(run_dataset, events, args.seed, data_dir, args.repeat, args.updates).result()
+        report["datasets"].append(result)
+        print_dataset(result, baseline.get(events))
+
+    if not args.data_dir:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nsaved to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Локальная заглушка Bot API для тестов Woolzy Bot
+Отвечает на методы, которые использует бот, записывает все вызовы
+и отдаёт подложенные обновления через getUpdates
+"""
+
+import json
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qsl
+
+Listener = Callable[[str, Dict[str, Any], float], None]
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Woolzy", "username": "woolzy_test_bot"}
+
+# ---------------- ОБНОВЛЕНИЯ ----------------
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "ru"}
+
+def make_start_update(user_id: int) -> Dict[str, Any]:
+    """Обновление с командой /start от пользователя"""
+    return {
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }
+    }
+
+def make_callback_update(user_id: int, data: str) -> Dict[str, Any]:
+    """Обновление с нажатием inline-кнопки"""
+    return {
+        "callback_query": {
+            "id": f"{user_id}-{time.monotonic_ns()}",
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 2,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "…",
+            },
+        }
+    }
+
+# ---------------- СЕРВЕР ----------------
+class FakeBotAPI:
+    """Bot API на ThreadingHTTPServer.
+
+    calls — список (время, метод, параметры) всех запросов; listeners
+    вызываются из потока сервера на каждый запрос.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.calls: List[Tuple[float, str, Dict[str, Any]]] = []
+        self.listeners: List[Listener] = []
+        self._updates: List[Dict[str, Any]] = []
+        self._next_update_id = 1
+        self._next_message_id = 100
+        self._cond = threading.Condition()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def push_update(self, update: Dict[str, Any]) -> int:
+        """Кладёт обновление в очередь getUpdates, возвращает его update_id"""
+        with self._cond:
+            update = {"update_id": self._next_update_id, **update}
+            self._next_update_id += 1
+            self._updates.append(update)
+            self._cond.notify_all()
+        return update["update_id"]
+
+    def count(self, method: str) -> int:
+        return sum(1 for _, m, _ in self.calls if m == method)
+
+    # ---------------- МЕТОДЫ ----------------
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        with self._cond:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return list(self._updates[: int(params.get("limit") or 100)])
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self._cond:
+            self._next_message_id += 1
+            message_id = int(params.get("message_id") or self._next_message_id)
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+            "from": BOT_USER,
+            "text": str(params.get("text") or ""),
+        }
+
+    def handle(self, method: str, params: Dict[str, Any]) -> Any:
+        now = time.monotonic()
+        self.calls.append((now, method, params))
+        for listener in self.listeners:
+            listener(method, params, now)
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            return self._message(params)
+        return True
+
+    def _handler_class(self) -> type:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                method = self.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                result = api.handle(method, _parse_params(self.headers.get("Content-Type", ""), body))
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+def _parse_params(content_type: str, body: bytes) -> Dict[str, Any]:
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        raw = {
+            part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.get_payload()
+        }
+        params = {k: v.decode(errors="replace") if not k == "document" else v for k, v in raw.items()}
+    elif content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    else:
+        params = dict(parse_qsl(body.decode()))
+    for key, value in params.items():
+        if isinstance(value, str):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                pass
+    return params
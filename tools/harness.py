@@ -0,0 +1,124 @@
+"""
+Запуск Woolzy Bot в процессе против локальной заглушки Bot API
+Используется инструментами замера задержек и нагрузочного теста
+"""
+
+import asyncio
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import httpx
+
+from tools.fake_bot_api import FakeBotAPI
+
+WEBHOOK_SECRET = "local-test-secret"
+
+def configure_env(api: FakeBotAPI, mode: str, webhook_port: int, db_path: str | None = None) -> str:
+    """Настраивает окружение до импорта config; возвращает путь к временной БД"""
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="woolzy-"), "bot.sqlite3")
+    os.environ.setdefault("BOT_TOKEN", "123456:local-test-token")
+    os.environ["DB_PATH"] = db_path
+    os.environ["BOT_API_BASE_URL"] = api.base_url
+    os.environ["BOT_MODE"] = mode
+    os.environ["WEBHOOK_LISTEN"] = "127.0.0.1"
+    os.environ["WEBHOOK_PORT"] = str(webhook_port)
+    os.environ["WEBHOOK_URL"] = f"http://127.0.0.1:{webhook_port}/telegram"
+    os.environ["WEBHOOK_SECRET"] = WEBHOOK_SECRET
+    return db_path
+
+@asynccontextmanager
+async def running_bot(api: FakeBotAPI, mode: str, webhook_port: int) -> AsyncIterator[Any]:
+    """Поднимает приложение из main.build_app() так же, как run_polling/run_webhook"""
+    import main  # импорт после configure_env: config читает окружение при импорте
+
+    app = main.build_app()
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    if mode == "webhook":
+        await app.updater.start_webhook(
+            listen="127.0.0.1",
+            port=webhook_port,
+            url_path="telegram",
+            webhook_url=f"http://127.0.0.1:{webhook_port}/telegram",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=main.ALLOWED_UPDATES,
+        )
+    else:
+        await app.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=main.ALLOWED_UPDATES)
+    await app.start()
+    try:
+        yield app
+    finally:
+        await app.updater.stop()
+        await app.stop()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        await app.shutdown()
+
+class UpdateSender:
+    """Доставляет обновления боту: через getUpdates заглушки или POST на вебхук"""
+
+    def __init__(self, api: FakeBotAPI, mode: str, webhook_port: int) -> None:
+        self._api = api
+        self._mode = mode
+        self._url = f"http://127.0.0.1:{webhook_port}/telegram"
+        self._client = httpx.AsyncClient(timeout=30) if mode == "webhook" else None
+        self._next_id = 1
+
+    async def send(self, update: Dict[str, Any]) -> None:
+        if self._client is None:
+            self._api.push_update(update)
+            return
+        update = {"update_id": self._next_id, **update}
+        self._next_id += 1
+        response = await self._client.post(
+            self._url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+        )
+        response.raise_for_status()
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+
+class ReplyWaiter:
+    """Ждёт первый ответ бота в чат после отправки обновления"""
+
+    def __init__(self, api: FakeBotAPI, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._waiting: Dict[int, List[asyncio.Future]] = {}
+        api.listeners.append(self._on_call)
+
+    def expect(self, chat_id: int) -> "asyncio.Future[float]":
+        future: "asyncio.Future[float]" = self._loop.create_future()
+        self._waiting.setdefault(chat_id, []).append(future)
+        return future
+
+    def _on_call(self, method: str, params: Dict[str, Any], at: float) -> None:
+        if method not in ("sendMessage", "editMessageText", "sendDocument"):
+            return
+        chat_id = int(params.get("chat_id") or 0)
+        self._loop.call_soon_threadsafe(self._resolve, chat_id, at)
+
+    def _resolve(self, chat_id: int, at: float) -> None:
+        futures = self._waiting.get(chat_id)
+        if not futures:
+            return
+        future = futures.pop(0)
+        if not futures:
+            del self._waiting[chat_id]
+        if not future.done():
+            future.set_result(at)
+
+def percentiles(values: List[float], points: Tuple[float, ...] = (50, 95, 99)) -> Dict[str, float]:
+    """Перцентили по методу ближайшего ранга"""
+    if not values:
+        return {f"p{int(p)}": 0.0 for p in points}
+    ordered = sorted(values)
+    return {
+        f"p{int(p)}": ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+        for p in points
+    }
@@ -0,0 +1,49 @@
+"""
+Замер задержки от обновления до ответа бота в режимах polling и webhook
+
+    python -m tools.latency --mode polling --count 200
+    python -m tools.latency --mode webhook --count 200
+"""
+
+import argparse
+import asyncio
+import time
+
+from tools.fake_bot_api import FakeBotAPI, make_start_update
+from tools.harness import ReplyWaiter, UpdateSender, configure_env, percentiles, running_bot
+
+async def measure(api: FakeBotAPI, mode: str, count: int, webhook_port: int) -> None:
+    loop = asyncio.get_running_loop()
+    waiter = ReplyWaiter(api, loop)
+    async with running_bot(api, mode, webhook_port):
+        sender = UpdateSender(api, mode, webhook_port)
+        latencies = []
+        for i in range(count):
+            user_id = 10_000_000 + i
+            reply = waiter.expect(user_id)
+            sent_at = time.monotonic()
+            await sender.send(make_start_update(user_id))
+            latencies.append((await asyncio.wait_for(reply, timeout=30)) - sent_at)
+        await sender.close()
+
+    stats = percentiles([x * 1000 for x in latencies])
+    print(f"mode={mode} updates={count}")
+    print("update → reply, ms: " + ", ".join(f"{k}={v:.1f}" for k, v in stats.items()))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--webhook-port", type=int, default=8787)
+    args = parser.parse_args()
+
+    api = FakeBotAPI()
+    api.start()
+    configure_env(api, args.mode, args.webhook_port)
+    try:
+        asyncio.run(measure(api, args.mode, args.count, args.webhook_port))
+    finally:
+        api.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Нагрузочный тест Woolzy Bot против локальной заглушки Bot API
+
+N виртуальных пользователей в цикле шлют /start и нажатия кнопок, а админ
+запрашивает отчёты. Отчёт: перцентили задержки от обновления до ответа,
+ожидание блокировок БД и число отправленных сообщений в секунду.
+
+    python -m tools.loadtest --users 50 --duration 30
+    python -m tools.loadtest --mode webhook --mix start=1,btn_group=3,btn_kaspi=1,stats=0.2 --json out.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from tools.fake_bot_api import FakeBotAPI, make_callback_update, make_start_update
+from tools.harness import ReplyWaiter, UpdateSender, configure_env, percentiles, running_bot
+
+DEFAULT_MIX = "start=1,btn_group=2,btn_guide=1,btn_kaspi=1,stats=0.1"
+STATS_PAYLOADS = ("stats_short_24h", "stats_full_24h", "stats_short_7d", "stats_full_all", "stats_users")
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"start", "btn_group", "btn_guide", "btn_kaspi", "stats"}
+    if unknown:
+        raise SystemExit(f"unknown actions in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+async def virtual_user(
+    user_id: int,
+    admin_id: int,
+    mix: Dict[str, float],
+    deadline: float,
+    think: float,
+    sender: UpdateSender,
+    waiter: ReplyWaiter,
+    latencies: Dict[str, List[float]],
+    timeouts: Dict[str, int],
+) -> None:
+    actions, weights = list(mix), list(mix.values())
+    action = "start"  # каждый виртуальный пользователь начинает с /start
+    while time.monotonic() < deadline:
+        if action == "start":
+            chat_id, update = user_id, make_start_update(user_id)
+        elif action == "stats":
+            chat_id, update = admin_id, make_callback_update(admin_id, random.choice(STATS_PAYLOADS))
+        else:
+            chat_id, update = user_id, make_callback_update(user_id, action)
+        reply = waiter.expect(chat_id)
+        sent_at = time.monotonic()
+        await sender.send(update)
+        try:
+            latencies[action].append(await asyncio.wait_for(reply, timeout=30) - sent_at)
+        except asyncio.TimeoutError:
+            timeouts[action] += 1
+        if think:
+            await asyncio.sleep(random.expovariate(1 / think))
+        action = random.choices(actions, weights)[0]
+
+async def run(args: argparse.Namespace, api: FakeBotAPI) -> Dict[str, object]:
+    from config import ADMIN_IDS
+    from db import pool
+    from events import event_writer
+
+    mix = parse_mix(args.mix)
+    admin_id = int(ADMIN_IDS[0]) if ADMIN_IDS else 1
+    waiter = ReplyWaiter(api, asyncio.get_running_loop())
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    timeouts: Dict[str, int] = defaultdict(int)
+
+    async with running_bot(api, args.mode, args.webhook_port):
+        sender = UpdateSender(api, args.mode, args.webhook_port)
+        sent_before = api.count("sendMessage")
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            virtual_user(20_000_000 + i, admin_id, mix, deadline, args.think, sender, waiter, latencies, timeouts)
+            for i in range(args.users)
+        ))
+        elapsed = time.monotonic() - started
+        sent = api.count("sendMessage") - sent_before
+        await sender.close()
+
+    all_latencies = [x for values in latencies.values() for x in values]
+    return {
+        "mode": args.mode,
+        "users": args.users,
+        "duration_s": round(elapsed, 2),
+        "updates": len(all_latencies),
+        "updates_per_s": round(len(all_latencies) / elapsed, 1),
+        "messages_per_s": round(sent / elapsed, 1),
+        "latency_ms": {k: round(v * 1000, 1) for k, v in percentiles(all_latencies).items()},
+        "latency_ms_by_action": {
+            action: {k: round(v * 1000, 1) for k, v in percentiles(values).items()}
+            for action, values in sorted(latencies.items())
+        },
+        "timeouts": dict(timeouts),
+        "db_pool_waits": pool.waits,
+        "db_pool_wait_s": round(pool.wait_seconds, 3),
+        "db_write_lock_wait_s": round(event_writer.lock_wait_seconds, 3),
+        "db_flush_s": round(event_writer.flush_seconds, 3),
+        "db_records_written": event_writer.written,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--users", type=int, default=20, help="число виртуальных пользователей")
+    parser.add_argument("--duration", type=float, default=20, help="длительность теста, секунды")
+    parser.add_argument("--think", type=float, default=0.0, help="средняя пауза между действиями, секунды")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="веса действий: start, btn_group, btn_guide, btn_kaspi, stats")
+    parser.add_argument("--webhook-port", type=int, default=8787)
+    parser.add_argument("--db", help="путь к БД (по умолчанию — новая временная)")
+    parser.add_argument("--json", help="записать результат в JSON-файл")
+    args = parser.parse_args()
+
+    api = FakeBotAPI()
+    api.start()
+    configure_env(api, args.mode, args.webhook_port, args.db)
+    try:
+        result = asyncio.run(run(args, api))
+    finally:
+        api.stop()
+
+    latency = result["latency_ms"]
+    print(f"mode={result['mode']} users={result['users']} duration={result['duration_s']}s")
+    print(f"updates: {result['updates']} ({result['updates_per_s']}/s), sendMessage: {result['messages_per_s']}/s")
+    print("latency, ms: " + ", ".join(f"{k}={v}" for k, v in latency.items()))
+    for action, values in result["latency_ms_by_action"].items():
+        print(f"  {action:<10} " + ", ".join(f"{k}={v}" for k, v in values.items()))
+    if result["timeouts"]:
+        print(f"timeouts: {result['timeouts']}")
+    print(
+        f"db: pool waits={result['db_pool_waits']} ({result['db_pool_wait_s']}s), "
+        f"write lock wait={result['db_write_lock_wait_s']}s, flush={result['db_flush_s']}s, "
+        f"records={result['db_records_written']}"
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Проверка хранилища пользователей и событий на реальной базе
+
+Записывает пользователей и события через интерфейс Storage, затем сверяет
+счётчики и постраничный список и печатает время записи и чтения.
+
+    python -m tools.storage_check --users 2000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+def configure_env() -> None:
+    """Окружение до импорта config: токен-заглушка и временный файл SQLite"""
+    os.environ.setdefault("BOT_TOKEN", "123456:local-test-token")
+    os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="woolzy-"), "bot.sqlite3"))
+
+async def check(users: int, clicks: int) -> bool:
+    from db import db_init
+    from events import event_writer
+    from stats import USERS_PAGE_SIZE
+    from storage import UserProfile, storage
+
+    db_init()
+    event_writer.start()
+    await storage.open()
+    print(f"backend={type(storage).__name__} users={users} clicks/user={clicks}")
+
+    started = time.perf_counter()
+    for uid in range(1, users + 1):
+        profile = UserProfile(uid, f"user{uid}", "Имя", None, "ru" if uid % 2 else "kk", uid % 5 == 0, 0)
+        await storage.upsert_user(profile, started_at=int(time.time()))
+        await storage.record_event(uid, "start")
+        for _ in range(clicks):
+            await storage.record_event(uid, "button_click", "btn_group")
+    # close() дописывает буфер; для чтения открываем заново
+    await storage.close()
+    event_writer.stop()
+    write_seconds = time.perf_counter() - started
+    event_writer.start()
+    await storage.open()
+
+    started = time.perf_counter()
+    ok = True
+    starts = await storage.count_events("start")
+    group = await storage.count_events("button_click", "btn_group", since=int(time.time()) - 3600)
+    for name, got, expected in (("start", starts, users), ("btn_group", group, users * clicks)):
+        if got != expected:
+            ok = False
+        print(f"count {name}: {got} (expected {expected})")
+
+    seen = 0
+    page = await storage.users_page("all")
+    pages = 1
+    while True:
+        seen += page.text.count("\n") if page.first else 0
+        if not page.has_next:
+            break
+        page = await storage.users_page("all", after=page.last)
+        pages += 1
+    if seen != users:
+        ok = False
+    print(f"users list: {seen} users in {pages} pages of {USERS_PAGE_SIZE} (expected {users})")
+    print((await storage.stats_text("24h", False)).replace("<b>", "").replace("</b>", ""))
+    read_seconds = time.perf_counter() - started
+    await storage.close()
+    event_writer.stop()
+
+    print(f"write: {write_seconds:.2f}s, read: {read_seconds:.2f}s")
+    print("OK" if ok else "MISMATCH")
+    return ok
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--clicks", type=int, default=3, help="нажатий btn_group на пользователя")
+    args = parser.parse_args()
+    configure_env()
+    raise SystemExit(0 if asyncio.run(check(args.users, args.clicks)) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Проверка обновления базы исходной версии бота
+
+Создаёт БД в формате первой версии бота (время событий — ISO-строки, без
+миграций), применяет миграции и сравнивает с ней отчёты статистики до
+переноса events_legacy, на середине переноса и после него. Заодно
+проверяет флаги кампании: пользователи, уже нажавшие кнопки, не должны
+получать шаги, которые эти нажатия отменяют.
+
+    python -m tools.upgrade_check --users 300
+"""
+
+import argparse
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+# Схема первой версии бота (main.py до миграций)
+BASELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id     INTEGER PRIMARY KEY,
+    username    TEXT,
+    first_name  TEXT,
+    last_name   TEXT,
+    language_code TEXT,
+    is_premium  INTEGER DEFAULT 0,
+    is_bot      INTEGER DEFAULT 0,
+    last_start  TEXT
+);
+
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id     INTEGER NOT NULL,
+    type        TEXT NOT NULL,
+    payload     TEXT,
+    created_at  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_user_time ON events(user_id, created_at);
+"""
+
+PERIODS = {"24h": 24 * 3600, "7d": 7 * 86400, "all": None}
+BUTTONS = ("btn_group", "btn_guide", "btn_kaspi")
+
+def configure_env() -> str:
+    """Окружение до импорта config: токен-заглушка и временный файл SQLite"""
+    os.environ.setdefault("BOT_TOKEN", "123456:local-test-token")
+    os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="woolzy-"), "bot.sqlite3"))
+    return os.environ["DB_PATH"]
+
+def _iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+def build_baseline(path: str, users: int, seed: int) -> List[Tuple[int, str, str | None, int]]:
+    """БД первой версии: старты, сообщения цепочки и клики за 10 дней; возвращает события (user_id, type, payload, время)"""
+    rng = random.Random(seed)
+    now = int(time.time())
+    events: List[Tuple[int, str, str | None, int]] = []
+    for uid in range(1, users + 1):
+        t0 = now - rng.randint(600, 10 * 86400)
+        events.append((uid, "start", None, t0))
+        events.append((uid, "message_sent", "welcome", t0 + 1))
+        for button in BUTTONS:
+            if rng.random() < 0.4:
+                events.append((uid, "button_click", button, min(t0 + rng.randint(10, 86400), now - 60)))
+    events.sort(key=lambda event: event[3])
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO users (user_id, username, first_name, last_start) VALUES (?, ?, ?, ?)",
+            [(uid, f"user{uid}", "Имя", _iso(now)) for uid in range(1, users + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO events (user_id, type, payload, created_at) VALUES (?, ?, ?, ?)",
+            [(uid, etype, payload, _iso(at)) for uid, etype, payload, at in events],
+        )
+    conn.close()
+    return events
+
+def expected_counts(events: List[Tuple[int, str, str | None, int]], period: str) -> Tuple[int, int, int]:
+    """Старты, клики группы и Kaspi за период — как их считала первая версия"""
+    seconds = PERIODS[period]
+    since = 0 if seconds is None else int(time.time()) - seconds
+    recent = [(etype, payload) for _, etype, payload, at in events if at >= since]
+    return (
+        sum(1 for etype, _ in recent if etype == "start"),
+        sum(1 for event in recent if event == ("button_click", "btn_group")),
+        sum(1 for event in recent if event == ("button_click", "btn_kaspi")),
+    )
+
+def report_counts(period: str) -> Tuple[int, int, int]:
+    from stats import build_stats_text
+
+    text = build_stats_text(period, False)
+    values = [int(value) for value in re.findall(r"<b>(\d+)</b>", text)]
+    return values[0], values[1], values[2]
+
+def check_reports(events: List[Tuple[int, str, str | None, int]], stage: str) -> bool:
+    ok = True
+    for period in PERIODS:
+        got, expected = report_counts(period), expected_counts(events, period)
+        if got != expected:
+            ok = False
+        print(f"{stage:>12} {period:>4}: starts/group/kaspi {got} (expected {expected})")
+    return ok
+
+def check_campaign(events: List[Tuple[int, str, str | None, int]]) -> bool:
+    from campaign import EVENT_BITS
+    from content import content
+    from db import db_connect
+
+    clicked: Dict[int, int] = {}
+    for uid, etype, payload, _ in events:
+        if etype == "button_click" and payload in EVENT_BITS:
+            clicked[uid] = clicked.get(uid, 0) | EVENT_BITS[payload]
+    with db_connect() as conn:
+        flags = dict(conn.execute("SELECT user_id, flags FROM campaign_state").fetchall())
+    missing = [uid for uid, bits in clicked.items() if flags.get(uid, 0) & bits != bits]
+    plan = content.current.plan
+    # Шаги, которые /start поставил бы этим пользователям, а очередь всё равно бы отправила
+    leaked = sum(
+        1 for uid in clicked for _, key in plan.steps_for("start")
+        if not plan.is_cancelled(key, flags.get(uid, 0)) and plan.cancel_mask.get(key, 0) & clicked[uid]
+    )
+    print(f"campaign flags: {len(clicked) - len(missing)} of {len(clicked)} users who clicked, {leaked} cancelled steps would be sent")
+    return not missing and not leaked
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    path = configure_env()
+    events = build_baseline(path, args.users, args.seed)
+
+    from db import db_init, migrate_legacy_events
+
+    db_init()
+    ok = check_reports(events, "not moved")
+    # Перенос идёт от новых событий к старым: после первой пачки половина событий ещё в events_legacy
+    migrate_legacy_events(len(events) // 2)
+    ok = check_reports(events, "half moved") and ok
+    while not migrate_legacy_events(1000):
+        pass
+    ok = check_reports(events, "moved") and ok
+    ok = check_campaign(events) and ok
+    print("OK" if ok else "MISMATCH")
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()